@@ -6,6 +6,9 @@ import streamlit as st
 from backend.chain import VisionChain
 from langchain_core.chat_history import InMemoryChatMessageHistory
 from frontend.pages.page_prescription import render_prescription_page
+from services.jobs import get_job_queue
+from telemetry.prometheus import start_metrics_server
+from telemetry.tracing import span
 
 # Page configuration
 st.set_page_config(
@@ -38,22 +41,31 @@ def main():
     """Main application entry point."""
     initialize_session_state()
     
+    # Expose /metrics once per process when METRICS_PORT is set
+    start_metrics_server()
+    
+    # Background ingest workers (also resumes jobs interrupted by a restart)
+    get_job_queue()
+    
     # Render sidebar once at the top level
-    from frontend.ui_components import render_sidebar
+    from frontend.ui_components import render_sidebar, render_trace_panel
     model_config = render_sidebar()
     uploaded_file = model_config.get("uploaded_file")
     chat_mode = model_config.get("chat_mode", "Explain Prescription")
     
     # Route based on chat_mode (consistent with "Focused Medical Chat" UI)
-    if chat_mode == "Create Schedule":
-        try:
-            from frontend.pages.page_schedule import render_schedule_page
-            render_schedule_page(model_config, uploaded_file)
-        except ImportError:
-            st.error("Smart Scheduler module error. Please check logs.")
-    else:
-        # Default to Analyzer for "Explain Prescription", "Safety Check", etc.
-        render_prescription_page(model_config, uploaded_file)
+    with span("ui.render", page=chat_mode):
+        if chat_mode == "Create Schedule":
+            try:
+                from frontend.pages.page_schedule import render_schedule_page
+                render_schedule_page(model_config, uploaded_file)
+            except ImportError:
+                st.error("Smart Scheduler module error. Please check logs.")
+        else:
+            # Default to Analyzer for "Explain Prescription", "Safety Check", etc.
+            render_prescription_page(model_config, uploaded_file)
+    
+    render_trace_panel()
 
 if __name__ == "__main__":
     main()
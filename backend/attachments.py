@@ -0,0 +1,131 @@
+"""
+Attachment stores: turn a PreparedImage into a model part that can be sent
+on every turn of a conversation without re-uploading the image bytes.
+
+GeminiFileStore uploads each image once through the Gemini File API and
+then sends only its file URI. LocalAttachmentStore emulates the same
+contract in-process for the offline mock backend.
+"""
+import io
+import os
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+from backend.utils import PreparedImage
+from telemetry.tracing import span, increment
+
+# Gemini deletes uploaded files after 48h; re-upload a little before that
+FILE_TTL_SECONDS = int(os.getenv("VISION_FILE_TTL_SECONDS", str(47 * 3600)))
+
+
+class AttachmentStore:
+    """Base store: sends image bytes inline on every request."""
+
+    def part_for(self, image: PreparedImage) -> Any:
+        """Model part for an image that is referenced across turns."""
+        return image.blob
+
+    def payload_bytes(self, part: Any) -> int:
+        """Bytes this part adds to a request."""
+        if isinstance(part, dict) and "data" in part:
+            return len(part["data"])
+        return 0
+
+
+class GeminiFileStore(AttachmentStore):
+    """
+    Upload-once store backed by the Gemini File API, keyed by image digest.
+    Falls back to inline bytes if the upload fails.
+    """
+
+    def __init__(self, ttl_seconds: int = FILE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._files: Dict[str, Tuple[str, str, float]] = {}
+        self._upload_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def part_for(self, image: PreparedImage) -> Any:
+        import google.generativeai as genai
+
+        reference = self._reference(image)
+        if reference is None:
+            return image.blob
+        file_uri, mime_type = reference
+        return genai.protos.Part(file_data=genai.protos.FileData(file_uri=file_uri, mime_type=mime_type))
+
+    def payload_bytes(self, part: Any) -> int:
+        if isinstance(part, dict):
+            return super().payload_bytes(part)
+        return len(part.file_data.file_uri)
+
+    def _reference(self, image: PreparedImage):
+        import google.generativeai as genai
+
+        cached = self._cached(image.digest)
+        if cached:
+            increment("attachment_requests", result="hit")
+            return cached
+
+        # Uploads run under a per-image lock: concurrent first turns for the
+        # same image upload once, and other sessions are never blocked
+        with self._upload_lock(image.digest):
+            cached = self._cached(image.digest)
+            if cached:
+                increment("attachment_requests", result="hit")
+                return cached
+
+            increment("attachment_requests", result="upload")
+            try:
+                with span("attachment.upload", payload_bytes=len(image.data)):
+                    uploaded = genai.upload_file(
+                        io.BytesIO(image.data),
+                        mime_type=image.mime_type,
+                        display_name=f"rx-{image.digest[:16]}"
+                    )
+            except Exception:
+                increment("attachment_requests", result="upload_error")
+                return None
+            with self._lock:
+                self._files[image.digest] = (uploaded.uri, image.mime_type, time.time() + self.ttl_seconds)
+            return uploaded.uri, image.mime_type
+
+    def _cached(self, digest: str):
+        with self._lock:
+            cached = self._files.get(digest)
+        if cached and cached[2] > time.time():
+            return cached[0], cached[1]
+        return None
+
+    def _upload_lock(self, digest: str) -> threading.Lock:
+        with self._lock:
+            return self._upload_locks.setdefault(digest, threading.Lock())
+
+
+class LocalAttachmentStore(AttachmentStore):
+    """In-process emulation of an upload-once store (used by the mock backend)."""
+
+    def __init__(self):
+        self.uploads: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def part_for(self, image: PreparedImage) -> Any:
+        with self._lock:
+            if image.digest not in self.uploads:
+                increment("attachment_requests", result="upload")
+                self.uploads[image.digest] = image.data
+            else:
+                increment("attachment_requests", result="hit")
+        return {"file_uri": f"local://{image.digest}", "mime_type": image.mime_type}
+
+    def payload_bytes(self, part: Any) -> int:
+        if "file_uri" in part:
+            return len(part["file_uri"])
+        return super().payload_bytes(part)
+
+
+def get_attachment_store() -> AttachmentStore:
+    """Store for VisionLLMClient, selected by VISION_ATTACHMENTS (file | inline)."""
+    if os.getenv("VISION_ATTACHMENTS", "file").lower() == "inline":
+        return AttachmentStore()
+    return GeminiFileStore()
@@ -3,15 +3,50 @@ LangChain-based vision chain for image conversations.
 Uses LangChain memory for conversation history management.
 """
 import json
-from typing import Iterator, Dict, Any, List
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator, Dict, Any, List, Union, Callable
 from PIL import Image
 from langchain_core.chat_history import InMemoryChatMessageHistory
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 
-from backend.vision_client import VisionLLMClient
-from backend.prompt import get_step_prompt, get_mode_prompt, GLOBAL_DISCLAIMER
-from backend.utils import prepare_image_for_api
+from backend.context_budget import ContextBudget
+from backend.json_stream import JsonArrayStreamer
+from backend.lexicon import get_medicine_lexicon, match_medicines, merge_lexicon_options
+from backend.shorthand import prenormalize, merge_extraction, overall_confidence
+from backend.vision_client import get_vision_client
+from backend.prompt import get_step_prompt, get_mode_prompt, get_prompt_version, GLOBAL_DISCLAIMER, INTAKE_SCHEMA_VERSION
+from backend.response_cache import get_response_cache, hash_text
+from backend.utils import PreparedImage, as_prepared_image
 from db.chat import save_chat_message
+from scheduler.rules import build_local_schedule, medicine_key
+from telemetry.tracing import span, start_span, increment
+
+# Run OCR speculatively alongside validation (cancelled if the gate rejects)
+CONCURRENT_STAGES = os.getenv("VISION_CONCURRENT_STAGES", "1").lower() in ("1", "true", "yes")
+# Classify and transcribe in one image call (INTAKE_PROMPT) instead of two
+COMBINED_INTAKE = os.getenv("VISION_COMBINED_INTAKE", "0").lower() in ("1", "true", "yes")
+# Structure shorthand lines locally; the model only reads the rest
+SHORTHAND_PRENORMALIZE = os.getenv("SHORTHAND_PRENORMALIZE", "1").lower() in ("1", "true", "yes")
+# Skip the audit call when every medicine name matches the local lexicon
+LEXICON_SKIP_AUDIT = os.getenv("LEXICON_SKIP_AUDIT", "1").lower() in ("1", "true", "yes")
+STAGE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("VISION_STAGE_WORKERS", "8")),
+    thread_name_prefix="vision-stage"
+)
+
+
+@contextmanager
+def stage_timer(timings: Dict[str, float], stage: str):
+    """Record the wall-clock duration of a pipeline stage (seconds) into timings."""
+    started = time.perf_counter()
+    try:
+        with span(f"pipeline.{stage}"):
+            yield
+    finally:
+        timings[stage] = round(time.perf_counter() - started, 4)
 
 
 class VisionChain:
@@ -24,76 +59,225 @@ class VisionChain:
     - Structured JSON extraction
     """
     
-    def __init__(self, memory: InMemoryChatMessageHistory, prescription_id: str = None):
+    def __init__(
+        self,
+        memory: InMemoryChatMessageHistory,
+        prescription_id: str = None,
+        use_cache: bool = True,
+        on_stage: Callable[[str], None] = None
+    ):
         """
         Initialize the vision chain.
+        
+        Args:
+            memory: Chat history for mode-based streaming
+            prescription_id: Active prescription for chat persistence
+            use_cache: Serve deterministic reasoning steps from the response cache
+            on_stage: Called with the stage name as each pipeline stage starts
+                (progress reporting for background jobs)
         """
-        self.vision_client = VisionLLMClient()
+        self.vision_client = get_vision_client()
         self.memory = memory
         self.prescription_id = prescription_id
+        self.response_cache = get_response_cache() if use_cache else None
+        self.context_budget = ContextBudget(self._summarize_history)
+        self.on_stage = on_stage
     
-    def analyze_prescription(self, image: Image.Image) -> Dict[str, Any]:
+    def analyze_prescription(
+        self,
+        image: Union[Image.Image, PreparedImage],
+        on_validated: Callable[[Dict[str, Any]], None] = None,
+        concurrent: bool = None,
+        combined: bool = None,
+        on_medicine: Callable[[Dict[str, Any]], None] = None
+    ) -> Dict[str, Any]:
         """
         Execute the 4-step medical reasoning pipeline.
         
+        In concurrent mode OCR starts alongside validation, since it does not
+        depend on the verdict; it is cancelled if the safety gate rejects.
+        In combined mode a single intake call returns both the verdict and
+        the transcription (falling back to separate calls if its response
+        does not match the intake schema).
+        
         Args:
-            image: PIL Image object
+            image: PIL Image object or PreparedImage
+            on_validated: Called (in this thread) as soon as the gate passes
+            concurrent: Override CONCURRENT_STAGES
+            combined: Override COMBINED_INTAKE
+            on_medicine: Called with each medicine as soon as normalization
+                has streamed it (before the stage completes)
             
         Returns:
-            Dict containing extraction results, ambiguities, and confidence.
+            Dict containing extraction results, ambiguities, confidence and
+            per-stage "timings" (seconds).
         """
-        image_data = prepare_image_for_api(image)
+        image = as_prepared_image(image)
+        if concurrent is None:
+            concurrent = CONCURRENT_STAGES
+        if combined is None:
+            combined = COMBINED_INTAKE
+        timings = {}
         
-        # STEP 0: CLASSIFICATION
+        with stage_timer(timings, "total"):
+            intake = self._run_intake(image, timings) if combined else None
+            if intake is not None:
+                validation, raw_ocr = intake
+                if not self.passes_gate(validation):
+                    analysis = self._rejected_result(validation)
+                else:
+                    if on_validated:
+                        on_validated(validation)
+                    analysis = self.complete_analysis(image, validation, raw_ocr=raw_ocr, timings=timings, on_medicine=on_medicine)
+                analysis["timings"] = timings
+                return analysis
+            
+            ocr_future = None
+            cancel_ocr = threading.Event()
+            if concurrent:
+                ocr_future = STAGE_EXECUTOR.submit(self._run_ocr, image, timings, cancel_ocr)
+            
+            with self.track_stage(timings, "validation"):
+                validation = self.validate_image(image)
+            
+            if not self.passes_gate(validation):
+                if ocr_future is not None:
+                    cancel_ocr.set()
+                    ocr_future.cancel()
+                analysis = self._rejected_result(validation)
+            else:
+                if on_validated:
+                    on_validated(validation)
+                raw_ocr = ocr_future.result() if ocr_future is not None else None
+                analysis = self.complete_analysis(image, validation, raw_ocr=raw_ocr, timings=timings, on_medicine=on_medicine)
+        
+        analysis["timings"] = timings
+        return analysis
+
+    @contextmanager
+    def track_stage(self, timings: Dict[str, float], stage: str):
+        """stage_timer that also notifies on_stage when the stage starts."""
+        if self.on_stage:
+            self.on_stage(stage)
+        with stage_timer(timings, stage):
+            yield
+
+    def validate_image(self, image: Union[Image.Image, PreparedImage]) -> Dict[str, Any]:
+        """
+        Run Step 0 (classification) only.
+        
+        Args:
+            image: PIL Image object or PreparedImage
+            
+        Returns:
+            Validation verdict with is_prescription, confidence and reason.
+        """
         validation_json_str = self._call_non_streaming(
+            step="validation",
             prompt=get_step_prompt("validation"),
-            image_url=image_data,
-            user_query="Is this image a doctor's medical prescription?"
+            image=as_prepared_image(image),
+            user_query="Is this image a doctor's medical prescription?",
+            # Rejections are re-checked on retry instead of replayed for the TTL
+            cacheable=lambda text: self.passes_gate(self._parse_json_object(text) or {})
         )
         
         try:
-            validation = json.loads(self._clean_json_response(validation_json_str))
-        except:
-            validation = {"is_prescription": False, "confidence": 0, "reason": "Classification failed"}
+            return json.loads(self._clean_json_response(validation_json_str))
+        except ValueError:
+            increment("llm_parse_failures", step="validation")
+            return {"is_prescription": False, "confidence": 0, "reason": "Classification failed"}
 
-        # GATE: Block if not a prescription or low confidence
-        if not validation.get("is_prescription") or validation.get("confidence", 0) < 0.7:
-            return {
-                "validation": validation,
-                "extraction": {"medicines": [], "overall_confidence": 0},
-                "audit": {"ambiguities": [], "safety_flags": ["Image rejected by safety gate."], "is_safe_to_display": False},
-                "raw_ocr": ""
-            }
+    @staticmethod
+    def passes_gate(validation: Dict[str, Any]) -> bool:
+        """Safety gate: only confident prescription classifications may proceed."""
+        return bool(validation.get("is_prescription")) and validation.get("confidence", 0) >= 0.7
 
-        # STEP 1: RAW OCR
-        raw_ocr = self._call_non_streaming(
-            prompt=get_step_prompt("ocr"),
-            image_url=image_data,
-            user_query="Please extract all text from this prescription."
+    @staticmethod
+    def audit_needed(extraction: Dict[str, Any], raw_ocr: str, lexicon_matches: List[Dict[str, Any]] = None) -> bool:
+        """
+        Whether the model audit has anything to add: it is skipped only when
+        every medicine name is exactly a lexicon entry (fuzzy matches, even one
+        edit away, may be a different drug), nothing was illegible and each
+        medicine has a confident dosage and schedule.
+        """
+        medicines = extraction.get("medicines") or []
+        if not LEXICON_SKIP_AUDIT or not lexicon_matches or not medicines:
+            return True
+        if "[unclear]" in (raw_ocr or "").lower() or extraction.get("overall_confidence", 0) < 0.7:
+            return True
+        if not all(match.get("exact") for match in lexicon_matches):
+            return True
+        return any(
+            med.get("confidence", 0) < 0.7 or not med.get("dosage") or not (med.get("frequency") or med.get("timing"))
+            for med in medicines
         )
+
+    def complete_analysis(
+        self,
+        image: Union[Image.Image, PreparedImage],
+        validation: Dict[str, Any],
+        raw_ocr: str = None,
+        timings: Dict[str, float] = None,
+        on_medicine: Callable[[Dict[str, Any]], None] = None
+    ) -> Dict[str, Any]:
+        """
+        Run Steps 1-4 for an image whose validation verdict is already known.
         
-        # STEP 2: NORMALIZATION
-        normalization_json_str = self._call_non_streaming(
-            prompt=get_step_prompt("normalize"),
-            user_query=f"Convert this OCR text into the medical JSON schema:\n\n{raw_ocr}"
-        )
+        Args:
+            image: PIL Image object or PreparedImage
+            validation: Result of validate_image for the same image
+            raw_ocr: Step 1 output if it already ran (speculative OCR)
+            timings: Dict to record per-stage durations into
+            on_medicine: Called with each medicine as normalization streams it
+            
+        Returns:
+            Dict containing extraction results, ambiguities, and confidence.
+        """
+        # GATE: Block if not a prescription or low confidence
+        if not self.passes_gate(validation):
+            return self._rejected_result(validation)
         
-        try:
-            extraction = json.loads(self._clean_json_response(normalization_json_str))
-        except:
-            extraction = {"medicines": [], "overall_confidence": 0}
+        if timings is None:
+            timings = {}
 
-        # STEP 3 & 4: AUDIT (Ambiguity & Safety)
-        audit_json_str = self._call_non_streaming(
-            prompt=get_step_prompt("audit"),
-            user_query=f"Original OCR Text:\n{raw_ocr}\n\nExtracted JSON:\n{json.dumps(extraction)}\n\nAudit for safety and ambiguity."
-        )
+        # STEP 1: RAW OCR
+        if raw_ocr is None:
+            raw_ocr = self._run_ocr(as_prepared_image(image), timings)
         
-        try:
-            audit = json.loads(self._clean_json_response(audit_json_str))
-        except:
-            audit = {"ambiguities": [], "safety_flags": [], "is_safe_to_display": False}
+        # STEP 2: NORMALIZATION (medicines are surfaced as they are read)
+        with self.track_stage(timings, "normalize"):
+            extraction = self._normalize(raw_ocr, on_medicine)
+
+        # Match names against the offline lexicon
+        lexicon = get_medicine_lexicon()
+        lexicon_matches = None
+        if lexicon is not None:
+            with self.track_stage(timings, "lexicon"):
+                lexicon_matches = match_medicines(lexicon, extraction)
+
+        # STEP 3 & 4: AUDIT (Ambiguity & Safety)
+        if self.audit_needed(extraction, raw_ocr, lexicon_matches):
+            with self.track_stage(timings, "audit"):
+                audit_json_str = self._call_non_streaming(
+                    step="audit",
+                    prompt=get_step_prompt("audit"),
+                    user_query=f"Original OCR Text:\n{raw_ocr}\n\nExtracted JSON:\n{json.dumps(extraction)}\n\nAudit for safety and ambiguity."
+                )
+            
+            try:
+                audit = json.loads(self._clean_json_response(audit_json_str))
+            except ValueError:
+                increment("llm_parse_failures", step="audit")
+                audit = {"ambiguities": [], "safety_flags": [], "is_safe_to_display": False}
+            if lexicon_matches:
+                merge_lexicon_options(audit, lexicon_matches)
+        else:
+            increment("audit_skipped", reason="lexicon")
+            # No safety verdict: the audit that would give one did not run
+            audit = {"ambiguities": [], "safety_flags": [], "source": "lexicon"}
         
+        if lexicon_matches is not None:
+            audit["lexicon_matches"] = lexicon_matches
         audit["validation"] = validation
         
         # DETERMINE AMBIGUITY STATE
@@ -119,26 +303,165 @@ class VisionChain:
             "extraction": extraction,
             "audit": audit,
             "raw_ocr": raw_ocr,
-            "ambiguity_state": ambiguity_state
+            "ambiguity_state": ambiguity_state,
+            "timings": timings
+        }
+
+    def _normalize(self, raw_ocr: str, on_medicine: Callable[[Dict[str, Any]], None] = None) -> Dict[str, Any]:
+        """
+        Step 2: structure the OCR text into the medicine schema.
+        
+        Lines the shorthand parser fully understands are structured locally;
+        the model only reads the remaining lines, with the fields parsed from
+        them as a hint. If every line parses, no model call is made.
+        """
+        pre = prenormalize(raw_ocr, get_medicine_lexicon()) if SHORTHAND_PRENORMALIZE else None
+        parsed = [m for m in pre["extraction"]["medicines"] if m is not None] if pre else []
+        if on_medicine:
+            for medicine in parsed:
+                on_medicine(medicine)
+        
+        if parsed and not pre["unparsed"]:
+            increment("normalize_local", result="full")
+            return dict(pre["extraction"], overall_confidence=overall_confidence(parsed))
+        
+        if parsed:
+            increment("normalize_local", result="partial")
+            lines = [line for line, _ in pre["unparsed"]] + pre["notes"]
+            hints = [hint for _, hint in pre["unparsed"] if hint]
+            user_query = "Convert these prescription lines into the medical JSON schema:\n\n" + "\n".join(lines)
+            if hints:
+                user_query += f"\n\nFields already parsed from these lines (verify and complete):\n{json.dumps(hints)}"
+        else:
+            user_query = f"Convert this OCR text into the medical JSON schema:\n\n{raw_ocr}"
+        
+        on_chunk = None
+        if on_medicine:
+            streamer = JsonArrayStreamer("medicines")
+            # Lines already parsed locally were surfaced above; merge_extraction drops repeats
+            known = {medicine_key(medicine["name"]) for medicine in parsed}
+            
+            def on_chunk(chunk):
+                for medicine in streamer.feed(chunk):
+                    if not (isinstance(medicine, dict) and medicine_key(medicine.get("name")) in known):
+                        on_medicine(medicine)
+        
+        normalization_json_str = self._call_non_streaming(
+            step="normalize",
+            prompt=get_step_prompt("normalize"),
+            user_query=user_query,
+            on_chunk=on_chunk
+        )
+        
+        try:
+            extraction = json.loads(self._clean_json_response(normalization_json_str))
+        except ValueError:
+            increment("llm_parse_failures", step="normalize")
+            extraction = {"medicines": [], "overall_confidence": 0}
+        return merge_extraction(pre, extraction) if parsed else extraction
+
+    def _run_ocr(self, image: PreparedImage, timings: Dict[str, float], cancel_event: threading.Event = None) -> str:
+        """Step 1: raw transcription of the image."""
+        with self.track_stage(timings, "ocr"):
+            return self._call_non_streaming(
+                step="ocr",
+                prompt=get_step_prompt("ocr"),
+                image=image,
+                user_query="Please extract all text from this prescription.",
+                cancel_event=cancel_event,
+                cacheable=lambda text: bool(text.strip())
+            )
+
+    def _run_intake(self, image: PreparedImage, timings: Dict[str, float]):
+        """
+        Steps 0+1 in one call.
+        
+        Returns:
+            (validation, raw_ocr), or None if the response is not a valid
+            intake payload of the current schema version.
+        """
+        with self.track_stage(timings, "intake"):
+            response = self._call_non_streaming(
+                step="intake",
+                prompt=get_step_prompt("intake"),
+                image=image,
+                user_query="Is this image a doctor's medical prescription? If so, transcribe it.",
+                cacheable=self._is_cacheable_intake
+            )
+        try:
+            payload = json.loads(self._clean_json_response(response))
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict) or payload.get("schema_version") != INTAKE_SCHEMA_VERSION:
+            increment("llm_parse_failures", step="intake")
+            return None
+        
+        validation = {
+            "is_prescription": bool(payload.get("is_prescription")),
+            "confidence": payload.get("confidence", 0),
+            "reason": payload.get("reason", "")
+        }
+        raw_ocr = payload.get("raw_text") or ""
+        if self.passes_gate(validation) and not raw_ocr.strip():
+            # Verdict without a transcription: let the regular OCR step run
+            raw_ocr = None
+        return validation, raw_ocr
+
+    def _is_cacheable_intake(self, text: str) -> bool:
+        payload = self._parse_json_object(text)
+        if not payload or payload.get("schema_version") != INTAKE_SCHEMA_VERSION:
+            return False
+        return self.passes_gate(payload) and bool((payload.get("raw_text") or "").strip())
+
+    def _rejected_result(self, validation: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "validation": validation,
+            "extraction": {"medicines": [], "overall_confidence": 0},
+            "audit": {"ambiguities": [], "safety_flags": ["Image rejected by safety gate."], "is_safe_to_display": False},
+            "raw_ocr": ""
         }
 
     def generate_final_schedule(self, merged_context: Dict[str, Any]) -> Dict[str, Any]:
         """
         Generates a final JSON schedule from merged AI + Human context.
+        Well-formed medicines are scheduled locally by scheduler.rules; the
+        model is only asked about the entries the rules cannot parse.
         """
+        entries, unresolved = build_local_schedule(merged_context)
+        if unresolved:
+            medicines = merged_context.get("medicines", [])
+            llm_context = dict(merged_context, medicines=[medicines[i] for i in unresolved])
+            llm_schedule = self._generate_schedule_with_llm(llm_context).get("schedule", [])
+            # Entries are matched by medicine name, never by position
+            by_name = {
+                medicine_key(entry.get("medicine")): entry
+                for entry in llm_schedule if isinstance(entry, dict)
+            }
+            matched = [by_name.get(medicine_key(medicines[i].get("name"))) for i in unresolved]
+            if len(llm_schedule) != len(unresolved) or len(by_name) != len(unresolved) or None in matched:
+                increment("schedule_fallbacks", reason="unmatched_entries")
+                return self._generate_schedule_with_llm(merged_context)
+            for i, entry in zip(unresolved, matched):
+                entries[i] = entry
+        
+        return {"schedule": [entry for entry in entries if entry]}
+
+    def _generate_schedule_with_llm(self, merged_context: Dict[str, Any]) -> Dict[str, Any]:
         response_str = self._call_non_streaming(
+            step="schedule_final",
             prompt=get_step_prompt("schedule_final"),
             user_query=f"Verified Context:\n{json.dumps(merged_context)}\n\nGenerate schedule JSON."
         )
         
         try:
             return json.loads(self._clean_json_response(response_str))
-        except:
+        except ValueError:
+            increment("llm_parse_failures", step="schedule_final")
             return {"schedule": []}
 
     def stream_with_mode(
         self,
-        image: Image.Image,
+        image: Union[Image.Image, PreparedImage],
         user_query: str,
         mode: str,
         extraction_context: Dict[str, Any],
@@ -154,27 +477,34 @@ class VisionChain:
         if ambiguity_state == "UNRESOLVABLE":
             system_prompt += "\n\nSAFETY RULE: The current prescription handwriting is UNRESOLVABLE. Do NOT infer or suggest medicine names unless the user explicitly provides them in this chat. Avoid all guesses."
 
-        context_msg = f"Context: The following verified data was extracted from the prescription: {json.dumps(extraction_context)}"
+        context_msg = f"Context: The following verified data was extracted from the prescription: {json.dumps(extraction_context, separators=(',', ':'))}"
         
         # Merge system prompt and context into one system message
         combined_system = f"{system_prompt}\n\n{context_msg}"
         
+        # Bounded history: rolling summary of older turns + recent turns verbatim
+        summary, recent_turns = self.context_budget.build(self.memory.messages, self.prescription_id)
+        if summary:
+            combined_system += f"\n\nSummary of the earlier conversation: {summary}"
+        
+        # The image opens the conversation once, as an uploaded-file reference
+        # (see backend.attachments), instead of riding along with every question
         messages = [
-            {"role": "system", "content": [{"type": "text", "text": combined_system}]}
+            {"role": "system", "content": [{"type": "text", "text": combined_system}]},
+            {"role": "user", "content": [
+                {"type": "image_ref", "image": as_prepared_image(image).api_image},
+                {"type": "text", "text": "This is the prescription image for this conversation."}
+            ]}
         ]
         
-        # Add history
-        for msg in self.memory.messages:
-            messages.append(self._format_message_for_api(msg))
+        # Add history as real user/assistant turns
+        for role, text in recent_turns:
+            messages.append({"role": role, "content": [{"type": "text", "text": text}]})
             
-        # Add current query with image
-        image_data = prepare_image_for_api(image)
+        # Add current query
         messages.append({
             "role": "user",
-            "content": [
-                {"type": "image_url", "image_url": {"url": image_data}},
-                {"type": "text", "text": user_query}
-            ]
+            "content": [{"type": "text", "text": user_query}]
         })
         
         # Update memory and DB
@@ -182,10 +512,22 @@ class VisionChain:
         if self.prescription_id:
             save_chat_message(self.prescription_id, "user", user_query)
         
-        full_response = ""
-        for chunk in self.vision_client.stream(messages=messages, **model_params):
-            full_response += chunk
-            yield chunk
+        trace = start_span(
+            "chat.turn",
+            mode=mode,
+            history_messages=len(self.memory.messages),
+            sent_messages=len(recent_turns),
+            summarized=bool(summary)
+        )
+        chunks = []
+        try:
+            for chunk in self.vision_client.stream(messages=messages, **model_params):
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            full_response = "".join(chunks)
+            trace.set("response_chars", len(full_response))
+            trace.finish()
             
         # Append disclaimer
         response_with_disclaimer = full_response + GLOBAL_DISCLAIMER
@@ -194,41 +536,106 @@ class VisionChain:
         self.memory.add_ai_message(response_with_disclaimer)
         if self.prescription_id:
             save_chat_message(self.prescription_id, "assistant", response_with_disclaimer)
+        
+        # Summarize older turns off the request path, ready for the next turn
+        self.context_budget.compact_in_background(STAGE_EXECUTOR, self.memory.messages, self.prescription_id)
 
-    def _call_non_streaming(self, prompt: str, user_query: str, image_url: str = None) -> str:
-        """Helper for internal reasoning steps."""
-        contents = [{"type": "text", "text": prompt}]
+    def _summarize_history(self, previous_summary: str, transcript: str) -> str:
+        """Merge older chat turns into the rolling history summary (text-only call)."""
+        query = f"Previous summary: {previous_summary or 'None'}\n\nNew conversation turns:\n{transcript}"
+        return self._call_non_streaming(
+            get_step_prompt("history_summary"), query, step="history_summary",
+            cacheable=lambda text: bool(text.strip())
+        )
+
+    def _call_non_streaming(
+        self,
+        prompt: str,
+        user_query: str,
+        image: PreparedImage = None,
+        step: str = None,
+        cancel_event: threading.Event = None,
+        on_chunk: Callable[[str], None] = None,
+        cacheable: Callable[[str], bool] = None
+    ) -> str:
+        """
+        Helper for internal reasoning steps.
+        Responses for named steps are served from / stored in the response cache.
+        Only responses accepted by cacheable are stored or served (by default
+        a JSON object), so truncated or failed replies are retried, not replayed.
+        If cancel_event is set mid-stream, the stream is abandoned and "" returned.
+        on_chunk sees the response as it streams (or whole, on a cache hit).
+        """
+        if cacheable is None:
+            cacheable = lambda text: self._parse_json_object(text) is not None
+        with span("llm.step", step=step or "adhoc", has_image=image is not None) as trace:
+            temperature = 0.1
+            cache_key = None
+            if step and self.response_cache is not None and self.response_cache.enabled:
+                cache_key = self.response_cache.make_key(
+                    prompt_version=get_prompt_version(step),
+                    step=step,
+                    model_name=self.vision_client.model_name,
+                    input_hash=hash_text(user_query),
+                    image_hash=image.api_cache_tag if image else None,
+                    params={"temperature": temperature}
+                )
+                cached = self.response_cache.get(cache_key)
+                if cached is not None and not cacheable(cached):
+                    cached = None
+                increment("llm_cache_requests", step=step, result="hit" if cached is not None else "miss")
+                if cached is not None:
+                    trace.set("cache_hit", True)
+                    if on_chunk:
+                        on_chunk(cached)
+                    return cached
         
-        user_content = []
-        if image_url:
-            user_content = [
-                {"type": "image_url", "image_url": {"url": image_url}},
-                {"type": "text", "text": user_query}
-            ]
-        else:
-            user_content = user_query
+            if cancel_event is not None and cancel_event.is_set():
+                trace.set("cancelled", True)
+                return ""
+        
+            trace.set("cache_hit", False)
+            user_content = []
+            if image:
+                user_content = [
+                    {"type": "image", "image": image.api_image},
+                    {"type": "text", "text": user_query}
+                ]
+            else:
+                user_content = user_query
             
-        messages = [
-            {"role": "system", "content": [{"type": "text", "text": prompt}]},
-            {"role": "user", "content": user_content}
-        ]
+            messages = [
+                {"role": "system", "content": [{"type": "text", "text": prompt}]},
+                {"role": "user", "content": user_content}
+            ]
+        
+            chunks = []
+            for chunk in self.vision_client.stream(messages=messages, temperature=temperature):
+                if cancel_event is not None and cancel_event.is_set():
+                    trace.set("cancelled", True)
+                    return ""
+                chunks.append(chunk)
+                if on_chunk:
+                    on_chunk(chunk)
+            response = "".join(chunks)
         
-        response = ""
-        for chunk in self.vision_client.stream(messages=messages, temperature=0.1):
-            response += chunk
-        return response
+            trace.set("response_chars", len(response))
+            if cache_key and response and cacheable(response):
+                self.response_cache.put(cache_key, step, response)
+            return response
 
     def _clean_json_response(self, text: str) -> str:
         """Remove markdown artifacts from JSON responses."""
         return text.strip().replace("```json", "").replace("```", "")
 
-    def _format_message_for_api(self, message) -> Dict[str, Any]:
-        role = "system" if isinstance(message, SystemMessage) else \
-               "user" if isinstance(message, HumanMessage) else "assistant"
-        return {
-            "role": role,
-            "content": [{"type": "text", "text": message.content}]
-        }
+    def _parse_json_object(self, text: str) -> Union[Dict[str, Any], None]:
+        """Parse a model reply as a JSON object; None if it is not one."""
+        try:
+            value = json.loads(self._clean_json_response(text))
+        except ValueError:
+            return None
+        return value if isinstance(value, dict) else None
 
     def clear_memory(self):
-        self.memory.clear()
\ No newline at end of file
+        self.memory.clear()
+        self.context_budget.reset()
\ No newline at end of file
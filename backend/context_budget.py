@@ -0,0 +1,173 @@
+"""
+Token budget for the chat history sent with each streamed turn.
+
+Recent turns are sent verbatim (without the repeated GLOBAL_DISCLAIMER)
+until the budget is used up; older turns are folded into a rolling summary
+that is cached per prescription, so prompt size stays flat as chats grow.
+"""
+import hashlib
+import os
+import threading
+from typing import Any, Callable, List, Optional, Tuple
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from backend.prompt import GLOBAL_DISCLAIMER
+from db.conversation_summaries import get_conversation_summary, save_conversation_summary
+from telemetry.tracing import span
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "2000"))
+KEEP_RECENT_MESSAGES = int(os.getenv("CHAT_HISTORY_KEEP_RECENT", "4"))
+
+# Rough average for English text; only used to compare against the budget
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (no tokenizer round trip)."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def strip_disclaimer(text: str) -> str:
+    """Remove the disclaimer appended to every AI reply."""
+    return text.replace(GLOBAL_DISCLAIMER, "")
+
+
+def to_turns(messages: List[Any]) -> List[Tuple[str, str]]:
+    """Map LangChain messages to (api_role, text) pairs without disclaimers."""
+    turns = []
+    for message in messages:
+        role = "system" if isinstance(message, SystemMessage) else \
+               "user" if isinstance(message, HumanMessage) else "assistant"
+        turns.append((role, strip_disclaimer(message.content)))
+    return turns
+
+
+def _turns_hash(turns: List[Tuple[str, str]]) -> str:
+    digest = hashlib.sha256()
+    for role, text in turns:
+        digest.update(f"{role}\x00{text}\x00".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ContextBudget:
+    """
+    Builds bounded chat history for a VisionChain.
+
+    build() never calls the model: it combines the cached summary with as
+    many recent turns as fit. compact() folds older turns into the summary
+    with one LLM call and is meant to run in the background after a turn.
+    """
+
+    def __init__(
+        self,
+        summarize: Callable[[Optional[str], str], str],
+        budget_tokens: int = HISTORY_TOKEN_BUDGET,
+        keep_recent: int = KEEP_RECENT_MESSAGES
+    ):
+        """
+        Args:
+            summarize: (previous_summary, transcript) -> new summary text
+            budget_tokens: Token estimate allowed for summary + history
+            keep_recent: Messages never folded into the summary
+        """
+        self.summarize = summarize
+        self.budget_tokens = budget_tokens
+        self.keep_recent = keep_recent
+        # Summary of a chat that is not persisted (no prescription_id)
+        self._local_summary = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def build(self, messages: List[Any], prescription_id: str = None) -> Tuple[Optional[str], List[Tuple[str, str]]]:
+        """
+        Select the history to send for the next turn.
+
+        Returns:
+            (summary or None, recent (role, text) turns in chronological order)
+        """
+        turns = to_turns(messages)
+        covered, summary = self._valid_summary(turns, prescription_id)
+
+        remaining = self.budget_tokens - (estimate_tokens(summary) if summary else 0)
+        recent = []
+        for role, text in reversed(turns[covered:]):
+            cost = estimate_tokens(text)
+            if recent and cost > remaining:
+                break
+            remaining -= cost
+            recent.append((role, text))
+        recent.reverse()
+        return summary, recent
+
+    def compact(self, messages: List[Any], prescription_id: str = None) -> bool:
+        """
+        Fold turns older than keep_recent into the rolling summary if the
+        unsummarized history exceeds the budget.
+
+        Returns:
+            True if a new summary was stored.
+        """
+        turns = to_turns(messages)
+        covered, summary = self._valid_summary(turns, prescription_id)
+        pending = turns[covered:]
+        if sum(estimate_tokens(text) for _, text in pending) <= self.budget_tokens:
+            return False
+
+        fold = pending[:len(pending) - self.keep_recent] if self.keep_recent else pending
+        if not fold:
+            return False
+
+        transcript = "\n".join(f"{role.upper()}: {text}" for role, text in fold)
+        with span("chat.compact", folded_messages=len(fold)):
+            new_summary = (self.summarize(summary, transcript) or "").strip()
+        if not new_summary:
+            return False
+
+        new_covered = covered + len(fold)
+        record = {
+            "covered_messages": new_covered,
+            "covered_hash": _turns_hash(turns[:new_covered]),
+            "summary": new_summary
+        }
+        if prescription_id:
+            save_conversation_summary(prescription_id, **record)
+        else:
+            self._local_summary = record
+        return True
+
+    def compact_in_background(self, executor, messages: List[Any], prescription_id: str = None):
+        """Schedule compact() on executor unless one is already running for this chat."""
+        key = prescription_id
+        with self._lock:
+            if key in self._pending:
+                return None
+            self._pending.add(key)
+        snapshot = list(messages)
+
+        def _run():
+            try:
+                return self.compact(snapshot, prescription_id)
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+        return executor.submit(_run)
+
+    def _valid_summary(self, turns: List[Tuple[str, str]], prescription_id: str) -> Tuple[int, Optional[str]]:
+        """Return (covered_messages, summary) if the stored summary still matches the history."""
+        if prescription_id:
+            record = get_conversation_summary(prescription_id)
+        else:
+            record = self._local_summary
+        if not record:
+            return 0, None
+        covered = record["covered_messages"]
+        if covered > len(turns) or record["covered_hash"] != _turns_hash(turns[:covered]):
+            # Chat was reset or diverged; fall back to truncation until recompacted
+            return 0, None
+        return covered, record["summary"]
+
+    def reset(self):
+        """Forget the summary of the unsaved chat (memory was cleared)."""
+        self._local_summary = None
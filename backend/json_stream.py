@@ -0,0 +1,90 @@
+"""
+Incremental JSON parsing for streamed model output.
+
+JsonArrayStreamer watches a streamed JSON object (e.g. the
+NORMALIZATION_PROMPT response) and emits each element of one top-level
+array ("medicines") as soon as that element's closing brace arrives, so
+the UI can render medicines while the rest of the response is generated.
+Text before the opening brace (such as a ```json fence) is ignored.
+"""
+import json
+from typing import Any, List
+
+
+class JsonArrayStreamer:
+    """
+    Feed response chunks; get back newly completed elements of `key`.
+
+    Runs a single pass over the input with O(1) state per character; only
+    the characters of the element currently being read are buffered.
+    """
+
+    def __init__(self, key: str = "medicines"):
+        self.key = key
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.string_chars = []
+        self.last_key = None
+        self.expect_value_for = None
+        self.array_depth = None  # depth inside the target array, once entered
+        self.done = False
+        self.element = []
+        self.emitted = 0
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Consume a chunk of the response. Returns elements completed by it."""
+        completed = []
+        if self.done:
+            return completed
+        for ch in chunk:
+            if self.element:
+                self.element.append(ch)
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.array_depth is None:
+                        self.last_key = "".join(self.string_chars)
+                else:
+                    self.string_chars.append(ch)
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                self.string_chars = []
+            elif ch == ":":
+                if self.depth == 1 and self.array_depth is None:
+                    self.expect_value_for = self.last_key
+            elif ch in "{[":
+                if ch == "[" and self.depth == 1 and self.expect_value_for == self.key:
+                    self.array_depth = self.depth + 1
+                elif self.array_depth is not None and self.depth == self.array_depth and not self.element:
+                    self.element = [ch]
+                self.depth += 1
+                self.expect_value_for = None
+            elif ch in "}]":
+                self.depth -= 1
+                if self.array_depth is not None:
+                    if self.element and self.depth == self.array_depth:
+                        completed.extend(self._emit())
+                    elif self.depth < self.array_depth:
+                        self.done = True
+                        break
+            elif ch == ",":
+                self.expect_value_for = None
+        return completed
+
+    def _emit(self) -> List[Any]:
+        text = "".join(self.element)
+        self.element = []
+        try:
+            value = json.loads(text)
+        except ValueError:
+            return []
+        self.emitted += 1
+        return [value]
@@ -0,0 +1,329 @@
+"""
+Offline medicine-name lexicon with a fuzzy-match index.
+
+Names are loaded from a CSV (name,generic; MEDICINE_LEXICON_PATH, the
+bundled data/medicine_lexicon.csv by default) and indexed by character
+trigram (partitioned by name length) and by phonetic key. A lookup counts
+shared trigrams among names of similar length over the query's rarest
+trigrams (an edit touches at most three of them, so the most common ones
+can be skipped, and the scan is capped at a fixed number of ids), adds names that sound the same, and ranks the best few by
+bit-parallel Levenshtein distance. Fragments next to an [UNCLEAR] token
+are matched as prefixes (binary search over the sorted keys).
+
+This lets normalized names be resolved in-process: confident matches let
+the audit call be skipped, and garbled names get real correction options.
+"""
+import bisect
+import csv
+import os
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from telemetry.tracing import span, increment
+
+LEXICON_PATH = os.getenv("MEDICINE_LEXICON_PATH") or str(
+    Path(__file__).resolve().parent.parent / "data" / "medicine_lexicon.csv"
+)
+CONFIDENT_SCORE = float(os.getenv("LEXICON_CONFIDENT_SCORE", "0.9"))
+# Weaker candidates are never offered as correction options
+OPTION_MIN_SCORE = float(os.getenv("LEXICON_OPTION_MIN_SCORE", "0.7"))
+MAX_OPTIONS = 3
+VERIFY_CANDIDATES = 12  # best trigram overlaps checked with edit distance
+PHONETIC_CANDIDATES = 8
+POSTINGS_SCAN_LIMIT = 2000  # name ids counted per fuzzy lookup, rarest trigrams first
+PREFIX_SCORE_CAP = 0.85  # partial names are never confident on their own
+PREFIX_SCAN_LIMIT = 500
+
+UNCLEAR_TOKEN = "[unclear]"
+# Dosage forms and units that surround names on prescriptions
+NOISE_WORDS = {
+    "tab", "tabs", "tablet", "tablets", "cap", "caps", "capsule", "capsules",
+    "syp", "syr", "syrup", "susp", "suspension", "inj", "injection", "oint",
+    "ointment", "cream", "gel", "drops", "drop", "inh", "inhaler", "sachet",
+    "mg", "mcg", "g", "gm", "ml", "iu", "units", "unit", "sr", "er", "xr", "cr", "od", "rx"
+}
+_WORD_RE = re.compile(r"[a-z][a-z0-9]*")
+_UNCLEAR_RE = re.compile(r"([a-z]+)?\s*\[unclear\]([a-z]+)?")
+_SOFT_C_RE = re.compile(r"c(?=[eiy])")
+
+
+def normalize_name(text: str) -> str:
+    """Lowercase name key without dosage forms, strengths or punctuation."""
+    words = _WORD_RE.findall(text.lower().replace(UNCLEAR_TOKEN, " "))
+    return " ".join(w for w in words if w not in NOISE_WORDS)
+
+
+def phonetic_key(key: str) -> str:
+    """Coarse sound-alike key: merge look/sound-alike consonants, drop inner vowels."""
+    s = key.replace(" ", "")
+    if not s:
+        return ""
+    s = _SOFT_C_RE.sub("s", s.replace("ph", "f").replace("th", "t").replace("ck", "k"))
+    s = s.replace("qu", "kw").replace("c", "k").replace("q", "k").replace("x", "ks").replace("z", "s").replace("y", "i")
+    out = [s[0]]
+    for ch in s[1:]:
+        if ch in "aeiouh" or ch == out[-1]:
+            continue
+        out.append(ch)
+    return "".join(out)
+
+
+def _trigrams(key: str) -> List[str]:
+    padded = f"  {key} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def _max_distance(length: int) -> int:
+    return 1 if length <= 4 else 2 if length <= 10 else 3
+
+
+def edit_distance(pattern_bits: Dict[str, int], m: int, text: str) -> int:
+    """
+    Levenshtein distance between a pattern (as per-character bitmasks over
+    its m positions) and text, using Myers' bit-parallel algorithm.
+    """
+    if m == 0:
+        return len(text)
+    full = (1 << m) - 1
+    high = 1 << (m - 1)
+    pv, mv, score = full, 0, m
+    for ch in text:
+        eq = pattern_bits.get(ch, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & full
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv
+    return score
+
+
+def _pattern_bits(key: str) -> Dict[str, int]:
+    bits = {}
+    for i, ch in enumerate(key):
+        bits[ch] = bits.get(ch, 0) | (1 << i)
+    return bits
+
+
+class MedicineLexicon:
+    """In-memory fuzzy index over medicine names."""
+
+    def __init__(self, entries: Iterable[Tuple[str, str]]):
+        self.names = []
+        self.generics = []
+        self.keys = []
+        self.exact = {}
+        self.grams = {}  # trigram -> {key length -> [entry index]}
+        self.phonetic = {}
+        for name, generic in entries:
+            key = normalize_name(name)
+            if not key or key in self.exact:
+                continue
+            idx = len(self.names)
+            self.names.append(name)
+            self.generics.append(generic or name)
+            self.keys.append(key)
+            self.exact[key] = idx
+            for gram in set(_trigrams(key)):
+                self.grams.setdefault(gram, {}).setdefault(len(key), []).append(idx)
+            self.phonetic.setdefault(phonetic_key(key), []).append(idx)
+        self.sorted_keys = sorted(self.exact)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_csv(cls, path: str) -> "MedicineLexicon":
+        """Load a name,generic CSV (generic may be empty for generic names)."""
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = csv.DictReader(f)
+            return cls(((row.get("name") or "").strip(), (row.get("generic") or "").strip()) for row in rows)
+
+    def lookup(self, text: str, limit: int = MAX_OPTIONS) -> List[Dict[str, Any]]:
+        """
+        Ranked lexicon matches for a (possibly garbled) medicine name.
+
+        Args:
+            text: Name as extracted, e.g. "Tab Amoxycilin 500mg" or "Amox[UNCLEAR]"
+            limit: Maximum number of candidates
+
+        Returns:
+            [{"name", "generic", "score", "match"}], best first; match is
+            exact | fuzzy | phonetic | word (one word of a multi-word name) | prefix.
+        """
+        scores = {}
+        key = normalize_name(text)
+        if key:
+            idx = self.exact.get(key)
+            if idx is not None:
+                return [self._candidate(idx, 1.0, "exact")]
+            self._fuzzy(key, scores)
+            words = key.split()
+            if len(words) > 1 and max(scores.values(), default=(0, ""))[0] < CONFIDENT_SCORE:
+                # Extra words (e.g. "Duo", a brand suffix) can hide a known name
+                # but such a match only covers part of the name and is never confident
+                for word in words:
+                    if len(word) >= 4:
+                        self._fuzzy(word, scores, penalty=0.05, match="word")
+        if UNCLEAR_TOKEN in text.lower():
+            self._partial(text.lower(), scores)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1][0], len(self.keys[item[0]])))
+        return [self._candidate(idx, score, match) for idx, (score, match) in ranked[:limit]]
+
+    def is_confident(self, candidates: List[Dict[str, Any]]) -> bool:
+        """Whether the top candidate is good and clearly ahead of the next."""
+        if not candidates or candidates[0]["match"] in ("prefix", "word"):
+            return False
+        top = candidates[0]["score"]
+        runner_up = candidates[1]["score"] if len(candidates) > 1 else 0.0
+        return top >= CONFIDENT_SCORE and top - runner_up >= 0.05
+
+    def _fuzzy(self, key: str, scores: Dict[int, Tuple[float, str]], penalty: float = 0.0, match: str = "fuzzy"):
+        max_dist = _max_distance(len(key))
+        lengths = range(len(key) - max_dist, len(key) + max_dist + 1)
+        postings = {}
+        for gram in set(_trigrams(key)):
+            by_length = self.grams.get(gram)
+            postings[gram] = [by_length[n] for n in lengths if n in by_length] if by_length else []
+        grams = sorted(postings, key=lambda g: sum(map(len, postings[g])))
+        # A match within max_dist shares all but 3*max_dist trigrams, so it
+        # must contain one of the rarest len(grams) - required + 1 of them;
+        # the most common trigrams are never scanned, and scanning stops
+        # once POSTINGS_SCAN_LIMIT ids have been counted
+        required = len(grams) - 3 * max_dist
+        probe = grams[:len(grams) - required + 1] if required > 0 else grams
+        counts = Counter()
+        budget = POSTINGS_SCAN_LIMIT
+        for i, gram in enumerate(probe):
+            size = sum(map(len, postings[gram]))
+            if i and size > budget:
+                # Grams are rarest first, so every remaining one is at least as common
+                break
+            for ids in postings[gram]:
+                counts.update(ids[:max(budget, 0)])
+                budget -= len(ids)
+        candidates = [idx for idx, _ in counts.most_common(VERIFY_CANDIDATES)]
+        sound_alikes = set(self.phonetic.get(phonetic_key(key), ())[:PHONETIC_CANDIDATES])
+        candidates.extend(sound_alikes.difference(candidates))
+
+        bits = _pattern_bits(key)
+        for idx in candidates:
+            other = self.keys[idx]
+            if abs(len(other) - len(key)) > max_dist + 2:
+                continue
+            distance = edit_distance(bits, len(key), other)
+            sounds_alike = idx in sound_alikes
+            if distance > max_dist and not sounds_alike:
+                continue
+            score = 1.0 - distance / max(len(key), len(other))
+            kind = match
+            if sounds_alike:
+                score = min(0.99, score + 0.05)
+                kind = "phonetic" if match == "fuzzy" else match
+            self._keep(scores, idx, score - penalty, kind)
+
+    def _partial(self, lowered: str, scores: Dict[int, Tuple[float, str]]):
+        """Prefix (and attached suffix) matches around an [UNCLEAR] token."""
+        m = _UNCLEAR_RE.search(lowered)
+        prefix, suffix = (m.group(1) or "", m.group(2) or "") if m else ("", "")
+        if prefix in NOISE_WORDS:
+            prefix = ""
+        if len(prefix) < 3:
+            return
+        start = bisect.bisect_left(self.sorted_keys, prefix)
+        for key in self.sorted_keys[start:start + PREFIX_SCAN_LIMIT]:
+            if not key.startswith(prefix):
+                break
+            if suffix and not key.endswith(suffix):
+                continue
+            idx = self.exact[key]
+            known = len(prefix) + len(suffix)
+            self._keep(scores, idx, min(PREFIX_SCORE_CAP, 0.5 + 0.4 * known / len(key)), "prefix")
+
+    @staticmethod
+    def _keep(scores, idx, score, match):
+        if score > scores.get(idx, (0.0, ""))[0]:
+            scores[idx] = (score, match)
+
+    def _candidate(self, idx: int, score: float, match: str) -> Dict[str, Any]:
+        return {"name": self.names[idx], "generic": self.generics[idx], "score": round(score, 3), "match": match}
+
+
+def match_medicines(lexicon: MedicineLexicon, extraction: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Match every extracted medicine name against the lexicon.
+
+    Returns:
+        [{"medicine_name", "candidates", "confident", "exact"}] in extraction
+        order; exact means the name equals a lexicon entry once dosage forms
+        and strengths are stripped.
+    """
+    matches = []
+    with span("lexicon.match", medicines=len(extraction.get("medicines") or [])):
+        for med in extraction.get("medicines") or []:
+            name = med.get("name") or ""
+            candidates = lexicon.lookup(name)
+            confident = lexicon.is_confident(candidates)
+            increment("lexicon_lookups", result="confident" if confident else "candidates" if candidates else "miss")
+            exact = bool(candidates) and candidates[0]["match"] == "exact"
+            matches.append({"medicine_name": name, "candidates": candidates, "confident": confident, "exact": exact})
+    return matches
+
+
+def merge_lexicon_options(audit: Dict[str, Any], matches: List[Dict[str, Any]]):
+    """
+    Put lexicon candidates scoring at least OPTION_MIN_SCORE into the audit's
+    name ambiguities (ahead of the model's own suggestions), adding an
+    ambiguity for unmatched names the audit did not flag. Ambiguities the
+    audit left without options (no safe alternative) are left alone.
+    """
+    ambiguities = audit.setdefault("ambiguities", [])
+    for match in matches:
+        if match["confident"]:
+            continue
+        names = [c["name"] for c in match["candidates"] if c["score"] >= OPTION_MIN_SCORE]
+        if not names:
+            continue
+        existing = next(
+            (a for a in ambiguities if a.get("field", "name") == "name" and a.get("medicine_name") == match["medicine_name"]),
+            None
+        )
+        if existing is None:
+            ambiguities.append({
+                "medicine_name": match["medicine_name"],
+                "field": "name",
+                "issue": "Name is illegible or not a known medicine; closest lexicon matches listed",
+                "options": names
+            })
+        elif existing.get("options"):
+            model_options = [o for o in existing["options"] if o not in names]
+            existing["options"] = (names + model_options)[:MAX_OPTIONS + 1]
+
+
+_lexicon = None
+_lexicon_loaded = False
+_lexicon_lock = threading.Lock()
+
+
+def get_medicine_lexicon() -> Optional[MedicineLexicon]:
+    """Process-wide lexicon, loaded on first use; None if the CSV is missing."""
+    global _lexicon, _lexicon_loaded
+    if not _lexicon_loaded:
+        with _lexicon_lock:
+            if not _lexicon_loaded:
+                if os.path.exists(LEXICON_PATH):
+                    with span("lexicon.load", path=LEXICON_PATH) as trace:
+                        _lexicon = MedicineLexicon.from_csv(LEXICON_PATH)
+                        trace.set("names", len(_lexicon))
+                _lexicon_loaded = True
+    return _lexicon
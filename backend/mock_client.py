@@ -0,0 +1,148 @@
+"""
+Offline stand-in for VisionLLMClient.
+Replays recorded responses per reasoning step with configurable
+token-by-token latency and failure injection, so the pipeline, db layer
+and scheduler can be exercised and benchmarked without a Gemini key.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, List, Any, Iterator, Optional
+
+from backend.attachments import LocalAttachmentStore
+from backend.prompt import get_step_prompt
+from backend.vision_client import build_gemini_request
+
+MOCK_MODEL_NAME = "mock-vision"
+
+STEP_NAMES = ["validation", "ocr", "intake", "normalize", "audit", "schedule_final", "history_summary"]
+
+DEFAULT_RESPONSES = {
+    "validation": json.dumps({"is_prescription": True, "confidence": 0.95, "reason": "Contains Rx, medicine names and dosages."}),
+    "ocr": "Rx\nTab Amoxicillin 500mg 1-0-1 x 5 days after food\nTab Paracetamol 650mg SOS\nCap Omeprazole 20mg OD before breakfast x 14 days",
+    "intake": json.dumps({
+        "schema_version": "intake-1",
+        "is_prescription": True,
+        "confidence": 0.95,
+        "reason": "Contains Rx, medicine names and dosages.",
+        "raw_text": "Rx\nTab Amoxicillin 500mg 1-0-1 x 5 days after food\nTab Paracetamol 650mg SOS\nCap Omeprazole 20mg OD before breakfast x 14 days"
+    }),
+    "normalize": json.dumps({
+        "patient_name": None,
+        "doctor_name": None,
+        "date": None,
+        "medicines": [
+            {"name": "Amoxicillin 500mg", "dosage": "500mg", "frequency": "1-0-1", "timing": ["morning", "night"], "duration_days": 5, "instructions": "After food", "confidence": 0.92},
+            {"name": "Paracetamol 650mg", "dosage": "650mg", "frequency": "SOS", "timing": [], "duration_days": 3, "instructions": "If fever", "confidence": 0.9},
+            {"name": "Omeprazole 20mg", "dosage": "20mg", "frequency": "OD", "timing": ["morning"], "duration_days": 14, "instructions": "Before breakfast", "confidence": 0.88}
+        ],
+        "overall_confidence": 0.9
+    }),
+    "audit": json.dumps({"ambiguities": [], "safety_flags": [], "is_safe_to_display": True}),
+    "schedule_final": json.dumps({"schedule": []}),
+    "history_summary": "The user asked what each medicine is for and how to take it; the assistant explained Amoxicillin, Paracetamol and Omeprazole usage.",
+    "chat": "Note: This is an AI explanation, not medical advice. Amoxicillin is an antibiotic taken twice daily after food for five days. Paracetamol is used only when needed for fever. Omeprazole reduces stomach acid and is taken every morning before breakfast."
+}
+
+
+class MockVisionError(RuntimeError):
+    """Injected failure raised by MockVisionClient (treated as transient)."""
+    retryable = True
+
+
+class MockVisionClient:
+    """
+    Drop-in replacement for VisionLLMClient.stream().
+    
+    Configuration (constructor args or environment):
+        recording: JSON file mapping step name -> response text (VISION_MOCK_RECORDING)
+        first_token_latency: Seconds before the first chunk (VISION_MOCK_FIRST_TOKEN_LATENCY)
+        token_latency: Seconds between chunks (VISION_MOCK_TOKEN_LATENCY)
+        failure_rate: Probability a call raises MockVisionError (VISION_MOCK_FAILURE_RATE)
+        seed: RNG seed for reproducible failure injection (VISION_MOCK_SEED)
+    """
+
+    def __init__(
+        self,
+        model_name: str = MOCK_MODEL_NAME,
+        recording: Optional[str] = None,
+        first_token_latency: Optional[float] = None,
+        token_latency: Optional[float] = None,
+        failure_rate: Optional[float] = None,
+        seed: Optional[int] = None
+    ):
+        self.model_name = model_name
+        self.responses = dict(DEFAULT_RESPONSES)
+        recording = recording or os.getenv("VISION_MOCK_RECORDING")
+        if recording:
+            with open(recording, encoding="utf-8") as f:
+                self.responses.update(json.load(f))
+        self.first_token_latency = _setting(first_token_latency, "VISION_MOCK_FIRST_TOKEN_LATENCY", 0.0)
+        self.token_latency = _setting(token_latency, "VISION_MOCK_TOKEN_LATENCY", 0.0)
+        self.failure_rate = _setting(failure_rate, "VISION_MOCK_FAILURE_RATE", 0.0)
+        seed = seed if seed is not None else os.getenv("VISION_MOCK_SEED")
+        self._random = random.Random(int(seed) if seed is not None else None)
+        self._lock = threading.Lock()
+        self.calls = {}
+        # Emulates the Gemini File API: images referenced across turns upload once
+        self.attachments = LocalAttachmentStore()
+        self.last_payload_bytes = 0
+
+    def stream(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: int = 1024,
+        **kwargs
+    ) -> Iterator[str]:
+        """Yield the recorded response for the detected step, chunk by chunk."""
+        step = self.detect_step(messages)
+        _, _, payload_bytes = build_gemini_request(messages, self.attachments)
+        with self._lock:
+            self.last_payload_bytes = payload_bytes
+            self.calls[step] = self.calls.get(step, 0) + 1
+            fail = self._random.random() < self.failure_rate
+            fail_at = self._random.randint(0, 3) if fail else None
+        
+        if self.first_token_latency:
+            time.sleep(self.first_token_latency)
+        
+        for i, token in enumerate(_tokenize(self.responses.get(step, ""))):
+            if fail_at is not None and i >= fail_at:
+                raise MockVisionError(f"Injected failure in step '{step}' after {i} chunks")
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            yield token
+        
+        if fail_at is not None:
+            raise MockVisionError(f"Injected failure in step '{step}'")
+
+    @staticmethod
+    def detect_step(messages: List[Dict[str, Any]]) -> str:
+        """Identify the reasoning step from the system prompt; anything else is chat."""
+        system_text = ""
+        for msg in messages:
+            if msg.get("role") == "system":
+                content = msg.get("content", "")
+                if isinstance(content, list):
+                    system_text += "".join(p.get("text", "") for p in content if p.get("type") == "text")
+                else:
+                    system_text += str(content)
+        for step in STEP_NAMES:
+            if get_step_prompt(step) and system_text.startswith(get_step_prompt(step)):
+                return step
+        return "chat"
+
+
+def _setting(value, env_name, default):
+    if value is not None:
+        return value
+    return float(os.getenv(env_name, str(default)))
+
+
+def _tokenize(text: str) -> List[str]:
+    """Split into word-ish chunks, keeping whitespace, like a streaming model."""
+    return re.findall(r"\S+\s*|\s+", text)
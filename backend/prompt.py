@@ -2,6 +2,11 @@
 Multi-step medical reasoning prompts and chat modes.
 Optimized for structured extraction and patient safety.
 """
+import hashlib
+
+# Bump when prompt semantics change in a way the text hash would not capture
+# (e.g. response post-processing). Part of the LLM response cache key.
+PROMPT_VERSION = "1"
 
 # --- STEP 0: PRESCRIPTION VALIDATION ---
 VALIDATION_PROMPT = """You are a medical document classifier.
@@ -38,6 +43,43 @@ STRICT RULES:
 - Do not structure yet, just give a raw text dump.
 """
 
+# --- STEP 0+1 COMBINED: VALIDATION + RAW OCR (optional, one image call) ---
+# Bump INTAKE_SCHEMA_VERSION whenever the response shape below changes;
+# responses with another version are discarded and the two-call path is used.
+INTAKE_SCHEMA_VERSION = "intake-1"
+
+INTAKE_PROMPT = f"""You are a medical document classifier and OCR specialist.
+First decide if the uploaded image is a valid doctor's medical prescription.
+If it is, transcribe EVERY piece of text from it.
+
+A valid prescription typically contains:
+- Medicine names and dosages
+- Signature or clinic stamp
+- Medical abbreviations (Rx, 1-0-1, etc.)
+
+NOT prescriptions:
+- Selfies, nature, or objects
+- Medicine strips/bottles
+- Lab reports or bills
+- Discharge summaries
+
+TRANSCRIPTION RULES (only if it is a prescription):
+- Transcribe EXACTLY what is written, line by line.
+- If a word is illegible, use [UNCLEAR].
+- Do not structure yet, just give a raw text dump.
+- If it is NOT a prescription, "raw_text" must be "".
+
+JSON SCHEMA:
+{{
+  "schema_version": "{INTAKE_SCHEMA_VERSION}",
+  "is_prescription": true | false,
+  "confidence": number,
+  "reason": "short explanation",
+  "raw_text": "full transcription, newlines as \\n"
+}}
+RETURN ONLY JSON.
+"""
+
 # --- STEP 2: ENTITY NORMALIZATION (JSON) ---
 NORMALIZATION_PROMPT = """You are a medical data architect.
 Convert the following raw OCR text from a prescription into a structured JSON object.
@@ -143,15 +185,34 @@ JSON SCHEMA:
 STRICT: Return ONLY the JSON object. No prose. No markdown code blocks.
 """
 
+# --- CHAT HISTORY COMPACTION ---
+# Folds older chat turns into a rolling summary so prompt size stays bounded.
+HISTORY_SUMMARY_PROMPT = """You are summarizing a conversation between a user and a medical prescription assistant.
+Merge the previous summary (if any) with the new conversation turns into ONE concise summary.
+
+RULES:
+1. Keep every fact the user stated (allergies, conditions, confirmed corrections to medicine names or dosages).
+2. Keep the questions already answered and the key points of each answer.
+3. Do NOT add new medical advice or information that is not in the conversation.
+4. Plain text, at most 150 words. No disclaimers.
+"""
+
 def get_step_prompt(step_name: str) -> str:
     prompts = {
         "validation": VALIDATION_PROMPT,
         "ocr": OCR_PROMPT,
+        "intake": INTAKE_PROMPT,
         "normalize": NORMALIZATION_PROMPT,
         "audit": AUDIT_PROMPT,
-        "schedule_final": SCHEDULE_FINAL_PROMPT
+        "schedule_final": SCHEDULE_FINAL_PROMPT,
+        "history_summary": HISTORY_SUMMARY_PROMPT
     }
     return prompts.get(step_name, "")
 
+def get_prompt_version(step_name: str) -> str:
+    """Version tag for a step prompt: PROMPT_VERSION plus a hash of its text."""
+    digest = hashlib.sha256(get_step_prompt(step_name).encode("utf-8")).hexdigest()[:12]
+    return f"{PROMPT_VERSION}:{digest}"
+
 def get_mode_prompt(mode: str) -> str:
     return MODE_PROMPTS.get(mode, "You are a helpful medical assistant.")
\ No newline at end of file
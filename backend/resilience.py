@@ -0,0 +1,249 @@
+"""
+Resilience layer for model calls: a shared token-bucket rate limiter,
+jittered exponential retries for transient errors, per-call deadlines and
+a circuit breaker with half-open probing.
+
+ResilientClient wraps any client exposing stream(messages, **kwargs); it is
+applied once per shared client in get_vision_client(), so every session,
+background job and batch worker draws from the same limits.
+"""
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, List
+
+from telemetry.tracing import current_span, increment, set_gauge
+
+RATE_PER_MINUTE = float(os.getenv("LLM_RATE_PER_MINUTE", "0"))  # 0 = unlimited
+RATE_BURST = int(os.getenv("LLM_RATE_BURST", "4"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+CALL_DEADLINE_SECONDS = float(os.getenv("LLM_CALL_DEADLINE_SECONDS", "120"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# HTTP statuses worth retrying (google.api_core exceptions carry .code)
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class LLMUnavailableError(RuntimeError):
+    """The model could not be reached in time (circuit open, deadline or retries exhausted)."""
+
+
+class LLMResponseError(RuntimeError):
+    """The model answered, but with nothing usable (empty or blocked response)."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Transient transport/server errors: 429, 5xx, timeouts, dropped connections."""
+    if getattr(exc, "retryable", False):
+        return True
+    code = getattr(exc, "code", None)
+    if isinstance(code, int) and code in RETRYABLE_STATUS:
+        return True
+    return isinstance(exc, (ConnectionError, TimeoutError))
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate_per_minute` sustained, `burst` at once."""
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline: float = None) -> bool:
+        """
+        Block until a token is available.
+
+        Returns:
+            False if the deadline (time.monotonic()) would pass first.
+        """
+        if self.rate <= 0:
+            return True
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            increment("llm_rate_limited_waits")
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures; after
+    `reset_seconds` a single half-open probe decides whether to close again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self._publish()
+
+    def allow(self) -> bool:
+        """Whether a call may proceed now (claims the probe slot when half-open)."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    return False
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                if self.state != self.OPEN:
+                    self._transition(self.OPEN)
+
+    def release_probe(self):
+        """Give back the half-open probe slot without judging the call (e.g. it was cancelled)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _transition(self, state: str):
+        self.state = state
+        increment("llm_circuit_transitions", breaker=self.name, state=state)
+        self._publish()
+
+    def _publish(self):
+        set_gauge("llm_circuit_open", 0 if self.state == self.CLOSED else 1, breaker=self.name)
+
+
+class ResilientClient:
+    """
+    Wraps a streaming client with rate limiting, retries, a deadline and a
+    circuit breaker. Retries only happen before the first chunk is yielded,
+    so callers never see duplicated output.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        limiter: TokenBucket,
+        breaker: CircuitBreaker,
+        max_retries: int = MAX_RETRIES,
+        deadline_seconds: float = CALL_DEADLINE_SECONDS
+    ):
+        self.client = client
+        self.limiter = limiter
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.deadline_seconds = deadline_seconds
+
+    def __getattr__(self, name):
+        # model_name, attachments, calls, ... of the wrapped client
+        return getattr(self.client, name)
+
+    def stream(self, messages: List[Dict[str, Any]], **kwargs) -> Iterator[str]:
+        deadline = time.monotonic() + self.deadline_seconds
+        attempt = 0
+        while True:
+            if not self.limiter.acquire(deadline):
+                increment("llm_calls", result="deadline")
+                raise LLMUnavailableError("Rate limit wait would exceed the call deadline")
+            if not self.breaker.allow():
+                increment("llm_calls", result="circuit_open")
+                raise LLMUnavailableError(f"Model temporarily unavailable (circuit {self.breaker.name} open)")
+
+            chunks = self.client.stream(messages=messages, timeout=max(1.0, deadline - time.monotonic()), **kwargs)
+            try:
+                first = next(chunks, None)
+            except Exception as e:
+                if not is_retryable(e):
+                    # Request errors (e.g. 400) say nothing about upstream health
+                    self.breaker.record_success()
+                    increment("llm_calls", result="error")
+                    raise
+                self.breaker.record_failure()
+                attempt += 1
+                if attempt > self.max_retries:
+                    increment("llm_calls", result="error")
+                    raise LLMUnavailableError(f"Model call failed after {attempt} attempts: {e}") from e
+                delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+                delay = random.uniform(0, delay)  # full jitter
+                if time.monotonic() + delay > deadline:
+                    increment("llm_calls", result="deadline")
+                    raise LLMUnavailableError(f"Model call deadline exceeded after {attempt} attempts: {e}") from e
+                increment("llm_retries", error=type(e).__name__)
+                current_span().set("retries", attempt)
+                time.sleep(delay)
+                continue
+            break
+
+        # Committed to this attempt: stream the rest, failures are final
+        try:
+            if first is not None:
+                yield first
+            for chunk in chunks:
+                yield chunk
+        except GeneratorExit:
+            # Caller stopped early (e.g. cancelled stage); neither a success nor a failure
+            self.breaker.release_probe()
+            raise
+        except Exception as e:
+            self.breaker.record_failure()
+            increment("llm_calls", result="error")
+            if is_retryable(e):
+                raise LLMUnavailableError(f"Model stream interrupted: {e}") from e
+            raise
+        self.breaker.record_success()
+        increment("llm_calls", result="ok")
+
+
+_limiters = {}
+_breakers = {}
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str = "llm") -> TokenBucket:
+    """Process-wide token bucket for a named upstream (LLM_RATE_PER_MINUTE, LLM_RATE_BURST)."""
+    with _shared_lock:
+        if name not in _limiters:
+            _limiters[name] = TokenBucket(RATE_PER_MINUTE, RATE_BURST)
+        return _limiters[name]
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Process-wide circuit breaker for a named upstream."""
+    with _shared_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def make_resilient(client: Any, name: str) -> ResilientClient:
+    """Wrap a client with the shared limiter and the breaker for `name`."""
+    return ResilientClient(client, get_rate_limiter(), get_circuit_breaker(name))
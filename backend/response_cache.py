@@ -0,0 +1,161 @@
+"""
+Persistent, content-addressed cache for deterministic reasoning-step responses.
+Keyed on prompt version, step name, input hashes, model name and generation params.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", "llm_cache.db"))
+CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+CACHE_ENABLED = os.getenv("LLM_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+
+
+def hash_text(text: str) -> str:
+    """SHA-256 hex digest of a text input."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed response cache with TTL and LRU size eviction.
+    
+    Safe to share across Streamlit sessions: a single connection is
+    guarded by a lock.
+    """
+
+    def __init__(
+        self,
+        path: Path = CACHE_PATH,
+        ttl_seconds: int = CACHE_TTL_SECONDS,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        enabled: bool = CACHE_ENABLED
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @staticmethod
+    def make_key(
+        prompt_version: str,
+        step: str,
+        model_name: str,
+        input_hash: str,
+        image_hash: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Build a content-addressed key from all inputs that affect the response."""
+        material = json.dumps({
+            "prompt_version": prompt_version,
+            "step": step,
+            "model": model_name,
+            "input": input_hash,
+            "image": image_hash,
+            "params": params or {}
+        }, sort_keys=True)
+        return hash_text(material)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached response, or None on miss/expiry/bypass."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            conn = self._get_conn()
+            row = conn.execute(
+                "SELECT response, created_at FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            with conn:
+                conn.execute("UPDATE llm_responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, step: str, response: str):
+        """Store a response and evict expired / least recently used entries."""
+        if not self.enabled or not response:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._get_conn()
+            with conn:
+                conn.execute("""
+                    INSERT OR REPLACE INTO llm_responses (key, step, response, created_at, accessed_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (key, step, response, now, now))
+                conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl_seconds,))
+                conn.execute("""
+                    DELETE FROM llm_responses WHERE key IN (
+                        SELECT key FROM llm_responses
+                        ORDER BY accessed_at DESC
+                        LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+
+    def clear(self):
+        """Drop every cached response."""
+        with self._lock:
+            conn = self._get_conn()
+            with conn:
+                conn.execute("DELETE FROM llm_responses")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current entry count."""
+        entries = 0
+        if self.enabled:
+            with self._lock:
+                entries = self._get_conn().execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries
+        }
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL;")
+            with self._conn:
+                self._conn.execute("""
+                    CREATE TABLE IF NOT EXISTS llm_responses (
+                        key TEXT PRIMARY KEY,
+                        step TEXT NOT NULL,
+                        response TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        accessed_at REAL NOT NULL
+                    )
+                """)
+                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_accessed ON llm_responses(accessed_at)")
+        return self._conn
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Process-wide cache instance shared by all VisionChain objects."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+        return _shared_cache
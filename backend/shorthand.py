@@ -0,0 +1,238 @@
+"""
+Rule-based pre-normalizer for prescription shorthand.
+
+Parses OCR lines such as "Tab Amox 500mg 1-0-1 x 5d AC" into the
+NORMALIZATION_PROMPT medicine schema (dosage, 1-0-1 / BD / TDS / HS / SOS,
+duration, food relation) with a confidence per field. A line counts as
+parsed only when every token is accounted for; anything else (free text,
+[UNCLEAR] tokens, missing dosage or frequency) is left for the model, with
+whatever fields were found passed along as a hint.
+"""
+import re
+from typing import Any, Dict, Optional, Tuple
+
+from scheduler.rules import ABBREVIATIONS, FOUR_TIMES_ABBREVIATIONS, AS_NEEDED, PHRASES, INTERVAL, parse_frequency, medicine_key
+
+FORMS = {
+    "tab", "tabs", "tablet", "cap", "caps", "capsule", "syp", "syr", "syrup", "susp",
+    "inj", "injection", "oint", "ointment", "cream", "gel", "drops", "drop", "inh", "sachet"
+}
+# Words that only join other fields ("x 5 days", "for 1 week")
+CONNECTORS = {"x", "×", "for", "and", "then", "daily", "-", "/", ",", ";", ":"}
+HEADER = re.compile(r"^\s*(rx|r/x|℞)\s*:?\s*$", re.IGNORECASE)
+HEADER_FIELDS = [
+    ("doctor_name", re.compile(r"^\s*(?:dr\b\.?|doctor\b)\s*:?\s*(.+)$", re.IGNORECASE)),
+    ("patient_name", re.compile(r"^\s*(?:patient|pt|name)\s*(?:name)?\s*[:.-]\s*(.+)$", re.IGNORECASE)),
+    ("date", re.compile(r"^\s*date\s*[:.-]?\s*(.+)$", re.IGNORECASE)),
+]
+BULLET = re.compile(r"^\s*(?:\d{1,2}[.)]|[-•*])\s+")
+
+DOSE_NOTATION = re.compile(r"(?<![\w-])[0-9½¼.]+\s*-\s*[0-9½¼.]+\s*-\s*[0-9½¼.]+(?:\s*-\s*[0-9½¼.]+)?(?![\w-])")
+DOSAGE = re.compile(
+    r"(?<![\w.])(\d+(?:\.\d+)?(?:\s*/\s*\d+(?:\.\d+)?)?)\s*(mg|mcg|µg|gm|g|ml|iu|units?|%)(?![a-z])",
+    re.IGNORECASE
+)
+DURATION = re.compile(
+    r"(?:(?<![\w])(?:x|×|for)\s*)?(?<![\w.])(\d+)\s*(d|days?|w|wks?|weeks?|m|months?)(?![a-z])",
+    re.IGNORECASE
+)
+DURATION_DAYS = {"d": 1, "w": 7, "m": 30}
+FOOD = [
+    (re.compile(r"\b(?:on\s+(?:an\s+)?)?empty\s+stomach\b", re.IGNORECASE), "On an empty stomach"),
+    (re.compile(r"\bbefore\s+(breakfast|lunch|dinner)\b", re.IGNORECASE), None),
+    (re.compile(r"\bafter\s+(breakfast|lunch|dinner)\b", re.IGNORECASE), None),
+    (re.compile(r"\bbefore\s+(?:food|meals?)\b|\bA/?C\b", re.IGNORECASE), "Before food"),
+    (re.compile(r"\bafter\s+(?:food|meals?)\b|\bP/?C\b", re.IGNORECASE), "After food"),
+    (re.compile(r"\bwith\s+(?:food|meals?|milk)\b", re.IGNORECASE), "With food"),
+    # Conditions for as-needed doses ("SOS if fever")
+    (re.compile(r"\b(?:if|for|in case of)\s+(?:fever|pain|headache|vomiting|nausea|cough|acidity|loose motions?)\b", re.IGNORECASE), None),
+]
+AS_NEEDED_PHRASE = re.compile(r"\b(" + "|".join(sorted(AS_NEEDED, key=len, reverse=True)) + r")\b", re.IGNORECASE)
+# "ON"/"OM" are ordinary words in lower case; only the capitalised forms count
+CASE_SENSITIVE_ABBREVIATIONS = {"on", "om"}
+ABBREVIATION = re.compile(
+    r"\b(" + "|".join(sorted(set(ABBREVIATIONS) | FOUR_TIMES_ABBREVIATIONS | {"sos", "prn"}, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE
+)
+
+FIELD_CONFIDENCE = {"dosage": 0.95, "frequency": 0.95, "duration_days": 0.95, "instructions": 0.9}
+NAME_CONFIDENCE_UNVERIFIED = 0.75  # clean line, name not in the lexicon
+NAME_CONFIDENCE_SUSPECT = 0.6  # close to, but not, a known name
+
+
+def parse_line(line: str, lexicon=None) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    Parse one prescription line.
+
+    Args:
+        line: A single OCR line
+        lexicon: Optional MedicineLexicon used to score the name
+
+    Returns:
+        (medicine, complete): the fields found (None if the line has no
+        medicine signal at all) and whether the whole line was understood.
+    """
+    text = BULLET.sub("", line).strip()
+    if "[unclear]" in text.lower():
+        medicine, _ = parse_line(re.sub(r"\[unclear\]", " ", text, flags=re.IGNORECASE), lexicon)
+        return medicine, False
+
+    spans = []
+    fields = {}
+    confidence = {}
+
+    def take(pattern, field, value_fn):
+        for m in pattern.finditer(text):
+            if field in fields or _overlaps(spans, m.span()):
+                continue
+            value = value_fn(m)
+            if value is None:
+                continue
+            fields[field] = value
+            confidence[field] = FIELD_CONFIDENCE[field]
+            spans.append(m.span())
+
+    instructions = []
+    for pattern, label in FOOD:
+        for m in pattern.finditer(text):
+            if not _overlaps(spans, m.span()):
+                instructions.append(label or m.group(0).strip().capitalize())
+                spans.append(m.span())
+    if instructions:
+        fields["instructions"] = "; ".join(instructions)
+        confidence["instructions"] = FIELD_CONFIDENCE["instructions"]
+
+    take(DOSE_NOTATION, "frequency", lambda m: re.sub(r"\s+", "", m.group(0)))
+    take(DURATION, "duration_days", lambda m: int(m.group(1)) * DURATION_DAYS[m.group(2)[0].lower()])
+    take(DOSAGE, "dosage", lambda m: re.sub(r"\s+", "", m.group(1)) + m.group(2).lower().replace("µg", "mcg"))
+    take(ABBREVIATION, "frequency", _abbreviation)
+    take(AS_NEEDED_PHRASE, "frequency", lambda m: m.group(0).strip().capitalize())
+    for pattern, _ in PHRASES:
+        take(pattern, "frequency", lambda m: m.group(0).strip().capitalize())
+    take(INTERVAL, "frequency", lambda m: m.group(0).strip())
+
+    # Leading dosage form, then the name up to the first recognized field
+    words = list(re.finditer(r"\S+", text))
+    form_end = 0
+    if words and words[0].group(0).lower().rstrip(".") in FORMS:
+        form_end = words[0].end()
+    first_field = min((start for start, _ in spans), default=len(text))
+    name = text[form_end:first_field].strip(" .,-:")
+    leftovers = [
+        w.group(0) for w in words
+        if w.start() >= first_field and not _overlaps(spans, w.span()) and w.group(0).lower().strip(".,") not in CONNECTORS
+    ]
+
+    if not form_end and "dosage" not in fields and "frequency" not in fields:
+        # Durations or food notes alone ("Review after 1 week") are not a medicine
+        return None, False
+
+    slots = parse_frequency(fields.get("frequency")) if "frequency" in fields else None
+    medicine = {
+        "name": f"{name} {fields['dosage']}" if name and "dosage" in fields else (name or None),
+        "dosage": fields.get("dosage"),
+        "frequency": fields.get("frequency"),
+        "timing": list(slots) if slots else [],
+        "duration_days": fields.get("duration_days"),
+        "instructions": fields.get("instructions")
+    }
+    if name:
+        confidence["name"] = _name_confidence(name, lexicon)
+    medicine["field_confidence"] = confidence
+    medicine["confidence"] = round(min(confidence.values()), 2) if confidence else 0.0
+
+    complete = bool(name) and "dosage" in fields and slots is not None and not leftovers and any(c.isalpha() for c in name)
+    return medicine, complete
+
+
+def prenormalize(raw_ocr: str, lexicon=None) -> Dict[str, Any]:
+    """
+    Pre-normalize a whole OCR transcription.
+
+    Returns:
+        {"extraction": partial NORMALIZATION schema with the parsed medicines
+         (None entries are placeholders for unparsed lines, in line order),
+         "unparsed": [(line, hint or None)] for lines the model must read,
+         "notes": lines with no medicine signal (advice, clinic details)}.
+    """
+    extraction = {"patient_name": None, "doctor_name": None, "date": None, "medicines": []}
+    unparsed = []
+    notes = []
+    for line in (raw_ocr or "").splitlines():
+        if not line.strip() or HEADER.match(line):
+            continue
+        header = next(((field, m) for field, pattern in HEADER_FIELDS for m in [pattern.match(line)] if m), None)
+        if header and extraction[header[0]] is None:
+            extraction[header[0]] = header[1].group(1).strip()
+            continue
+        medicine, complete = parse_line(line, lexicon)
+        if complete:
+            extraction["medicines"].append(medicine)
+        elif medicine is not None or "[unclear]" in line.lower() or _names_medicine(line, lexicon):
+            extraction["medicines"].append(None)
+            unparsed.append((line.strip(), medicine))
+        else:
+            notes.append(line.strip())
+    return {"extraction": extraction, "unparsed": unparsed, "notes": notes}
+
+
+def merge_extraction(pre: Dict[str, Any], model_extraction: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Combine locally parsed medicines with the model's reading of the
+    unparsed lines. Model medicines fill the unparsed lines' slots when the
+    counts line up, otherwise they follow the local ones.
+    """
+    local = pre["extraction"]
+    # The model sometimes repeats lines it was not asked about
+    known = {medicine_key(m["name"]) for m in local["medicines"] if m is not None}
+    model_medicines = [
+        m for m in model_extraction.get("medicines") or []
+        if isinstance(m, dict) and medicine_key(m.get("name")) not in known
+    ]
+    slots = local["medicines"]
+    if len(model_medicines) == slots.count(None):
+        filled = iter(model_medicines)
+        medicines = [m if m is not None else next(filled) for m in slots]
+    else:
+        medicines = [m for m in slots if m is not None] + model_medicines
+    
+    merged = {field: local[field] or model_extraction.get(field) for field in ("patient_name", "doctor_name", "date")}
+    merged["medicines"] = medicines
+    merged["overall_confidence"] = overall_confidence(medicines, default=model_extraction.get("overall_confidence", 0))
+    return merged
+
+
+def overall_confidence(medicines, default: float = 0) -> float:
+    """Mean per-medicine confidence (the schema's overall_confidence)."""
+    scores = [m.get("confidence", 0) for m in medicines if isinstance(m, dict)]
+    return round(sum(scores) / len(scores), 2) if scores else default
+
+
+def _abbreviation(m) -> Optional[str]:
+    token = m.group(1)
+    if token.lower() in CASE_SENSITIVE_ABBREVIATIONS and not token.isupper():
+        return None
+    return token.upper()
+
+
+def _overlaps(spans, span) -> bool:
+    return any(start < span[1] and span[0] < end for start, end in spans)
+
+
+def _names_medicine(line: str, lexicon) -> bool:
+    """Whether a line without dosage/frequency still mentions a known medicine."""
+    if lexicon is None:
+        return False
+    return any(
+        lexicon.is_confident(lexicon.lookup(word))
+        for word in re.findall(r"[A-Za-z]{4,}", line)
+    )
+
+
+def _name_confidence(name: str, lexicon) -> float:
+    if lexicon is None:
+        return NAME_CONFIDENCE_UNVERIFIED
+    candidates = lexicon.lookup(name)
+    if lexicon.is_confident(candidates):
+        return round(candidates[0]["score"], 2)
+    return NAME_CONFIDENCE_SUSPECT if candidates else NAME_CONFIDENCE_UNVERIFIED
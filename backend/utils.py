@@ -2,35 +2,261 @@
 Image utility functions for encoding and processing.
 """
 import base64
+import hashlib
+import os
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
 from io import BytesIO
+from typing import Any, Callable, Dict, Union
+from dotenv import load_dotenv
 from PIL import Image
 
+from telemetry.tracing import span
 
-def encode_image_to_base64(image: Image.Image) -> str:
+load_dotenv()
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+# EXIF orientation -> transpose operation (same mapping as ImageOps.exif_transpose)
+_ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+@dataclass(frozen=True)
+class ImagePreprocessConfig:
+    """
+    Settings for the payload sent to the vision model.
+    The stored original (and its hash) is never affected.
+    """
+    enabled: bool = True
+    max_edge: int = 2048
+    grayscale: bool = False
+    format: str = "JPEG"
+    quality: int = 85
+
+    @classmethod
+    def from_env(cls) -> "ImagePreprocessConfig":
+        return cls(
+            enabled=os.getenv("IMAGE_PREPROCESS_DISABLED", "").lower() not in ("1", "true", "yes"),
+            max_edge=int(os.getenv("IMAGE_MAX_EDGE", "2048")),
+            grayscale=os.getenv("IMAGE_GRAYSCALE", "").lower() in ("1", "true", "yes"),
+            format=os.getenv("IMAGE_FORMAT", "JPEG").upper(),
+            quality=int(os.getenv("IMAGE_QUALITY", "85"))
+        )
+
+    def cache_tag(self) -> str:
+        """Short signature of the settings, for cache keys derived from the original digest."""
+        if not self.enabled:
+            return "original"
+        return f"{self.max_edge}:{int(self.grayscale)}:{self.format}:{self.quality}"
+
+
+PREPROCESS_CONFIG = ImagePreprocessConfig.from_env()
+
+
+def image_digest(png_bytes: bytes, orientation: int = 1) -> str:
+    """
+    Image hash of encoded PNG bytes. PNG drops EXIF, so a non-default
+    orientation is folded in: the same pixels shown rotated are a
+    different prescription image.
+    """
+    digest = hashlib.sha256(png_bytes)
+    if orientation != 1:
+        digest.update(f":orientation={orientation}".encode("ascii"))
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    """
+    Immutable, encode-once view of an uploaded image.
+    
+    Holds the PNG bytes, their SHA-256 digest (the image hash used for
+    storage and dedup; see image_digest) and the MIME type. The base64 data URI, the Gemini
+    blob and the decoded PIL image are built lazily and at most once.
+    The bytes themselves may be supplied up front (payload) or fetched on
+    first access (loader), e.g. from the on-disk image store.
+    """
+    digest: str
+    mime_type: str = "image/png"
+    payload: bytes = field(default=None, repr=False, compare=False)
+    loader: Callable[[], bytes] = field(default=None, repr=False, compare=False)
+    # EXIF orientation of the upload; PNG encoding drops EXIF, so keep it here
+    orientation: int = field(default=1, compare=False)
+    # Set on derived payloads (see preprocess_image)
+    source_digest: str = field(default=None, compare=False)
+    source_bytes: int = field(default=None, compare=False)
+
+    @classmethod
+    def from_pil(cls, image: Image.Image) -> "PreparedImage":
+        """Encode a PIL image to PNG once and hash the result."""
+        buffered = BytesIO()
+        with span("image.encode_png", width=image.width, height=image.height) as trace:
+            image.save(buffered, format="PNG")
+            trace.set("payload_bytes", buffered.tell())
+        orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+        return cls(
+            payload=buffered.getvalue(),
+            digest=image_digest(buffered.getvalue(), orientation),
+            orientation=orientation
+        )
+
+    @classmethod
+    def from_bytes(
+        cls, data: bytes, mime_type: str = "image/png", digest: str = None, orientation: int = 1
+    ) -> "PreparedImage":
+        """
+        Wrap already-encoded bytes (e.g. from the DB). Pass digest to skip
+        rehashing, and the stored orientation (stored PNGs carry no EXIF).
+        """
+        return cls(
+            payload=data, digest=digest or hashlib.sha256(data).hexdigest(),
+            mime_type=mime_type, orientation=orientation
+        )
+
+    @classmethod
+    def lazy(
+        cls, digest: str, loader: Callable[[], bytes], mime_type: str = "image/png", orientation: int = 1
+    ) -> "PreparedImage":
+        """Reference an image by digest; bytes are loaded on first access."""
+        return cls(digest=digest, loader=loader, mime_type=mime_type, orientation=orientation)
+
+    @cached_property
+    def data(self) -> bytes:
+        if self.payload is not None:
+            return self.payload
+        return self.loader()
+
+    @cached_property
+    def base64(self) -> str:
+        return base64.b64encode(self.data).decode('utf-8')
+
+    @cached_property
+    def data_uri(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+    @property
+    def blob(self) -> Dict[str, Any]:
+        """Inline-data part for the Gemini API (raw bytes, no base64 round trip)."""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+    @cached_property
+    def image(self) -> Image.Image:
+        """Decoded PIL image, for callers that need pixels."""
+        return Image.open(BytesIO(self.data))
+
+    @cached_property
+    def api_image(self) -> "PreparedImage":
+        """Downscaled / recompressed payload for the vision model (built once)."""
+        return preprocess_image(self, PREPROCESS_CONFIG)
+
+    @property
+    def api_cache_tag(self) -> str:
+        """Identifies the model payload without building it: original digest, orientation + settings."""
+        return f"{self.digest}:o{self.orientation}:{PREPROCESS_CONFIG.cache_tag()}"
+
+    @property
+    def bytes_saved(self) -> int:
+        """Bytes saved relative to the source image (0 for originals)."""
+        if self.source_bytes is None:
+            return 0
+        return self.source_bytes - len(self.data)
+
+
+def preprocess_image(image: PreparedImage, config: ImagePreprocessConfig = PREPROCESS_CONFIG) -> PreparedImage:
+    """
+    Build the model payload for an image: EXIF orientation fix, max-edge
+    resize, optional grayscale and lossy re-encoding.
+    
+    Args:
+        image: Original PreparedImage (kept unchanged for storage and hashing)
+        config: Preprocessing settings
+        
+    Returns:
+        A new PreparedImage carrying source_digest/source_bytes for savings
+        accounting, or the original if preprocessing is disabled or would not
+        make the payload smaller.
+    """
+    if not config.enabled:
+        return image
+    
+    with span("image.preprocess", source_bytes=len(image.data), format=config.format) as trace:
+        pil_image = Image.open(BytesIO(image.data))
+        pil_image.load()
+        if image.orientation in _ORIENTATION_TRANSPOSE:
+            pil_image = pil_image.transpose(_ORIENTATION_TRANSPOSE[image.orientation])
+        
+        if max(pil_image.size) > config.max_edge:
+            pil_image.thumbnail((config.max_edge, config.max_edge), Image.Resampling.LANCZOS)
+        
+        if config.grayscale:
+            pil_image = pil_image.convert("L")
+        elif pil_image.mode not in ("RGB", "L"):
+            pil_image = pil_image.convert("RGB")
+        
+        buffered = BytesIO()
+        pil_image.save(buffered, format=config.format, quality=config.quality)
+        payload = buffered.getvalue()
+        trace.set("payload_bytes", len(payload))
+    
+    if len(payload) >= len(image.data) and image.orientation == 1:
+        return image
+    
+    return PreparedImage(
+        payload=payload,
+        digest=hashlib.sha256(payload).hexdigest(),
+        mime_type=Image.MIME[config.format],
+        source_digest=image.digest,
+        source_bytes=len(image.data)
+    )
+
+
+@lru_cache(maxsize=16)
+def prepare_uploaded_image(raw_bytes: bytes) -> PreparedImage:
+    """
+    Build a PreparedImage from raw upload bytes (any format PIL can read).
+    
+    Memoized on the raw bytes so Streamlit reruns with the same upload do not
+    decode and re-encode the image again.
+    """
+    return PreparedImage.from_pil(Image.open(BytesIO(raw_bytes)))
+
+
+def as_prepared_image(image: Union[Image.Image, PreparedImage]) -> PreparedImage:
+    """Accept either a PIL image or a PreparedImage."""
+    if isinstance(image, PreparedImage):
+        return image
+    return PreparedImage.from_pil(image)
+
+
+def encode_image_to_base64(image: Union[Image.Image, PreparedImage]) -> str:
     """
     Convert PIL Image to base64 string for API transmission.
     
     Args:
-        image: PIL Image object
+        image: PIL Image object or PreparedImage
         
     Returns:
         Base64 encoded string of the image
     """
-    buffered = BytesIO()
-    image.save(buffered, format="PNG")
-    img_bytes = buffered.getvalue()
-    return base64.b64encode(img_bytes).decode('utf-8')
+    return as_prepared_image(image).base64
 
 
-def prepare_image_for_api(image: Image.Image) -> str:
+def prepare_image_for_api(image: Union[Image.Image, PreparedImage]) -> str:
     """
     Prepare image for Vision API by encoding to base64.
     
     Args:
-        image: PIL Image object
+        image: PIL Image object or PreparedImage
         
     Returns:
         Data URI string with base64 encoded image
     """
-    base64_image = encode_image_to_base64(image)
-    return f"data:image/png;base64,{base64_image}"
\ No newline at end of file
+    return as_prepared_image(image).data_uri
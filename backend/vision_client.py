@@ -4,113 +4,242 @@ Handles streaming communication with Gemini Vision API.
 """
 import os
 import base64
-from typing import Dict, List, Any, Iterator
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Any, Iterator, Tuple
 from dotenv import load_dotenv
 import google.generativeai as genai
 
+from backend.attachments import AttachmentStore, get_attachment_store
+from backend.resilience import LLMResponseError, make_resilient
+from telemetry.tracing import start_span, increment
+
 load_dotenv()
 
+DEFAULT_MODEL_NAME = "gemini-2.0-flash"
+MODEL_CACHE_SIZE = 32
+
+# OpenAI-style roles -> Gemini content roles
+GEMINI_ROLES = {"user": "user", "assistant": "model"}
+
+# genai.configure() resets the SDK's shared transport, so call it once per key
+_configured_api_key = None
+_configure_lock = threading.Lock()
+
+# Shared clients, keyed by (model name, API key)
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _configure(api_key: str):
+    global _configured_api_key
+    with _configure_lock:
+        if _configured_api_key != api_key:
+            genai.configure(api_key=api_key)
+            _configured_api_key = api_key
+
+
+def get_vision_client(model_name: str = DEFAULT_MODEL_NAME) -> "VisionLLMClient":
+    """
+    Process-wide VisionLLMClient for a model.
+    
+    Clients are stateless between calls, so one instance is shared by all
+    Streamlit sessions and chains; setup (env read, SDK configuration,
+    model construction) is paid once per process and the SDK keeps reusing
+    its underlying HTTP connections.
+    
+    Set VISION_BACKEND=mock to get the offline MockVisionClient instead.
+    The returned client is wrapped in a ResilientClient.
+    """
+    backend = os.getenv("VISION_BACKEND", "gemini").lower()
+    key = (backend, model_name, os.getenv("VISION_API_KEY"))
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                if backend == "mock":
+                    from backend.mock_client import MockVisionClient
+                    client = MockVisionClient()
+                else:
+                    client = VisionLLMClient(model_name)
+                # Shared rate limit, retries and circuit breaker (backend.resilience)
+                client = make_resilient(client, name=f"{backend}:{model_name}")
+                _clients[key] = client
+    return client
+
+
+def build_gemini_request(
+    messages: List[Dict[str, Any]],
+    attachments: AttachmentStore
+) -> Tuple[str, List[Dict[str, Any]], int]:
+    """
+    Convert OpenAI-format messages to Gemini request pieces.
+    
+    System messages become the system instruction; user/assistant messages
+    become alternating "user"/"model" turns (consecutive turns of the same
+    role are merged). Content parts:
+        {"type": "text", "text": str}
+        {"type": "image", "image": PreparedImage}      -> inline bytes
+        {"type": "image_ref", "image": PreparedImage}  -> attachments.part_for()
+        {"type": "image_url", "image_url": {"url": data URI}}
+    
+    Returns:
+        (system_instruction, contents, payload_bytes)
+    """
+    system_prompt = ""
+    contents = []
+    payload_bytes = 0
+
+    for msg in messages:
+        role = msg.get("role", "user")
+        content = msg.get("content", "")
+        if not isinstance(content, list):
+            content = [{"type": "text", "text": str(content)}]
+
+        if role == "system":
+            for part in content:
+                if part.get("type") == "text":
+                    system_prompt += part["text"] + "\n"
+            continue
+
+        parts = []
+        for part in content:
+            part_type = part.get("type")
+            if part_type == "text":
+                parts.append(part["text"])
+                payload_bytes += len(part["text"].encode("utf-8"))
+            elif part_type == "image":
+                # PreparedImage: raw bytes already available
+                blob = part["image"].blob
+                parts.append(blob)
+                payload_bytes += len(blob["data"])
+            elif part_type == "image_ref":
+                ref = attachments.part_for(part["image"])
+                parts.append(ref)
+                payload_bytes += attachments.payload_bytes(ref)
+            elif part_type == "image_url":
+                image_url = part["image_url"]["url"]
+                # Handle base64 data URI
+                if image_url.startswith("data:image"):
+                    header, b64data = image_url.split(",", 1)
+                    mime_type = header.split(";")[0].split(":")[1]
+                    image_bytes = base64.b64decode(b64data)
+                    parts.append({"mime_type": mime_type, "data": image_bytes})
+                    payload_bytes += len(image_bytes)
+        if not parts:
+            continue
+
+        gemini_role = GEMINI_ROLES.get(role, "user")
+        if contents and contents[-1]["role"] == gemini_role:
+            contents[-1]["parts"].extend(parts)
+        else:
+            contents.append({"role": gemini_role, "parts": parts})
+
+    system_instruction = system_prompt.strip()
+    payload_bytes += len(system_instruction.encode("utf-8"))
+    return system_instruction, contents, payload_bytes
+
 
 class VisionLLMClient:
     """
     Gemini-based wrapper for vision model.
     Drop-in replacement for the Qubrid client.
+    Prefer get_vision_client() over constructing this directly.
     """
 
-    def __init__(self):
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME):
         self.api_key = os.getenv("VISION_API_KEY")
-        self.model_name = "gemini-2.0-flash"  
+        self.model_name = model_name
 
         if not self.api_key:
             raise ValueError("VISION_API_KEY must be set in .env file")
 
-        genai.configure(api_key=self.api_key)
+        _configure(self.api_key)
         self.model = genai.GenerativeModel(self.model_name)
+        self.attachments = get_attachment_store()
+        # Models per system instruction; chat prompts embed per-prescription context
+        self._models = OrderedDict()
+        self._models_lock = threading.Lock()
 
     def stream(
         self,
         messages: List[Dict[str, Any]],
         temperature: float = 0.7,
         max_tokens: int = 1024,
+        timeout: float = None,
         **kwargs
     ) -> Iterator[str]:
         """
         Stream tokens from Gemini API.
-        Converts OpenAI-format messages to Gemini format.
+        Converts OpenAI-format messages to a Gemini system instruction plus
+        multi-turn contents (see build_gemini_request).
+        
+        Raises:
+            LLMResponseError: if the response was blocked or produced no text.
         """
-        # Extract system prompt
-        system_prompt = ""
-        gemini_parts = []
-
-        for msg in messages:
-            role = msg.get("role", "user")
-            content = msg.get("content", "")
-
-            if role == "system":
-                # Collect system prompt as text
-                if isinstance(content, list):
-                    for part in content:
-                        if part.get("type") == "text":
-                            system_prompt += part["text"] + "\n"
-                else:
-                    system_prompt += str(content) + "\n"
-
-            elif role == "user":
-                if isinstance(content, list):
-                    for part in content:
-                        if part.get("type") == "text":
-                            gemini_parts.append(part["text"])
-                        elif part.get("type") == "image_url":
-                            image_url = part["image_url"]["url"]
-                            # Handle base64 data URI
-                            if image_url.startswith("data:image"):
-                                header, b64data = image_url.split(",", 1)
-                                mime_type = header.split(";")[0].split(":")[1]
-                                image_bytes = base64.b64decode(b64data)
-                                gemini_parts.append({
-                                    "mime_type": mime_type,
-                                    "data": image_bytes
-                                })
-                else:
-                    gemini_parts.append(str(content))
-
-            elif role == "assistant":
-                # Skip assistant messages for now (single turn)
-                pass
-
-        # Prepend system prompt to first text part
-        if system_prompt:
-            gemini_parts.insert(0, system_prompt)
-
-        # Build Gemini-format contents
-        gemini_contents = []
-        for part in gemini_parts:
-            if isinstance(part, str):
-                gemini_contents.append(part)
-            elif isinstance(part, dict):
-                # Image part
-                import google.generativeai as genai_img
-                gemini_contents.append(
-                    genai_img.protos.Blob(
-                        mime_type=part["mime_type"],
-                        data=part["data"]
-                    )
-                )
+        system_instruction, contents, payload_bytes = build_gemini_request(messages, self.attachments)
 
         generation_config = genai.types.GenerationConfig(
             temperature=temperature,
             max_output_tokens=max_tokens,
         )
 
-        response = self.model.generate_content(
-            gemini_contents,
-            generation_config=generation_config,
-            stream=True
-        )
-
-        for chunk in response:
-            try:
-                if chunk.text:
-                    yield chunk.text
-            except Exception:
-                continue
+        trace = start_span("llm.stream", model=self.model_name, payload_bytes=payload_bytes, turns=len(contents))
+        trace_started = time.perf_counter()
+        try:
+            response = self._model_for(system_instruction).generate_content(
+                contents,
+                generation_config=generation_config,
+                stream=True,
+                request_options={"timeout": timeout} if timeout else None
+            )
+
+            first_chunk = True
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunk without text parts (e.g. only a finish reason)
+                    continue
+                if text:
+                    if first_chunk:
+                        trace.set("first_chunk_ms", round((time.perf_counter() - trace_started) * 1000, 2))
+                        first_chunk = False
+                    yield text
+            
+            self._record_usage(trace, response)
+            if first_chunk:
+                block_reason = getattr(getattr(response, "prompt_feedback", None), "block_reason", None)
+                raise LLMResponseError(f"Model returned no text (block reason: {block_reason or 'none'})")
+        except Exception as e:
+            trace.finish(error=type(e).__name__)
+            raise
+        finally:
+            trace.finish()
+
+    def _model_for(self, system_instruction: str):
+        """GenerativeModel bound to a system instruction (small LRU, no network)."""
+        if not system_instruction:
+            return self.model
+        with self._models_lock:
+            model = self._models.pop(system_instruction, None)
+            if model is None:
+                model = genai.GenerativeModel(self.model_name, system_instruction=system_instruction)
+            self._models[system_instruction] = model
+            while len(self._models) > MODEL_CACHE_SIZE:
+                self._models.popitem(last=False)
+        return model
+
+    def _record_usage(self, trace, response):
+        """Copy token counts from Gemini's usage metadata onto the span and counters."""
+        usage = getattr(response, "usage_metadata", None)
+        if not usage:
+            return
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        trace.set("prompt_tokens", prompt_tokens)
+        trace.set("output_tokens", output_tokens)
+        increment("llm_prompt_tokens", prompt_tokens, model=self.model_name)
+        increment("llm_output_tokens", output_tokens, model=self.model_name)
@@ -0,0 +1,227 @@
+"""
+End-to-end latency benchmarks against the offline mock vision backend.
+
+Times upload -> restore, full analysis, chat turn streaming, schedule
+generation and PDF export over a corpus of synthetic prescription images,
+plus medicine-lexicon lookups against the bundled names padded with
+synthetic ones, and prints (or writes) the results as JSON for comparison
+across commits.
+
+Usage:
+    python -m benchmarks.latency --iterations 20 --lexicon-size 100000 --output bench.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+MEDICINE_LINES = [
+    "Tab Amoxicillin 500mg 1-0-1 x 5 days after food",
+    "Tab Paracetamol 650mg SOS",
+    "Cap Omeprazole 20mg OD before breakfast x 14 days",
+    "Tab Cetirizine 10mg HS x 7 days",
+    "Syp Ambroxol 5ml TDS x 5 days",
+    "Tab Metformin 500mg BD with meals",
+]
+
+
+def make_synthetic_images(count, seed=0):
+    """Render prescription-like PNG uploads at phone-photo sizes."""
+    from PIL import Image, ImageDraw
+    rng = random.Random(seed)
+    sizes = [(1240, 1754), (2480, 3508), (3024, 4032)]
+    images = []
+    for i in range(count):
+        width, height = sizes[i % len(sizes)]
+        image = Image.new("RGB", (width, height), "white")
+        draw = ImageDraw.Draw(image)
+        y = height // 10
+        draw.text((width // 12, y), f"Dr. Synthetic #{i}   Rx", fill="black")
+        for line in rng.sample(MEDICINE_LINES, k=rng.randint(2, len(MEDICINE_LINES))):
+            y += height // 20
+            draw.text((width // 12, y), line, fill="black")
+        # Light noise so every image hashes differently and compresses like a photo
+        for _ in range(2000):
+            draw.point((rng.randrange(width), rng.randrange(height)), fill=(rng.randrange(256),) * 3)
+        buffered = BytesIO()
+        image.save(buffered, format="JPEG", quality=90)
+        images.append(buffered.getvalue())
+    return images
+
+
+def make_synthetic_names(count, seed=0):
+    """Pronounceable drug-like names (e.g. "Trafoxine") to pad the lexicon."""
+    rng = random.Random(seed)
+    onsets = list("bcdfghjklmnprstvxz") + ["br", "cl", "pr", "tr", "st", "ph", "th", "fl", "gr", "qu"]
+    endings = ["ine", "ol", "am", "ide", "ate", "in", "an", "one", "ax", "il", "en", "ix", "ium", "ic"]
+    names = set()
+    while len(names) < count:
+        stem = "".join(rng.choice(onsets) + rng.choice("aeiou") for _ in range(rng.randint(2, 4)))
+        names.add((stem + rng.choice(endings)).capitalize())
+    return sorted(names)
+
+
+def misspell(name, rng):
+    """One random substitution, deletion or insertion."""
+    word = name.lower()
+    i = rng.randrange(len(word))
+    op = rng.choice("sdi")
+    if op == "s":
+        return word[:i] + rng.choice("aeiourtnlsc") + word[i + 1:]
+    if op == "d":
+        return word[:i] + word[i + 1:]
+    return word[:i] + rng.choice("aeiou") + word[i:]
+
+
+def run_lexicon(size, seed, lookups=300):
+    from backend.lexicon import MedicineLexicon, LEXICON_PATH
+    
+    with open(LEXICON_PATH, encoding="utf-8") as f:
+        bundled = [line.split(",")[0] for line in f.read().splitlines()[1:] if line]
+    rng = random.Random(seed)
+    t0 = time.perf_counter()
+    lexicon = MedicineLexicon([(name, "") for name in bundled + make_synthetic_names(size, seed)])
+    build_ms = (time.perf_counter() - t0) * 1000
+    
+    samples = {"lexicon_exact_lookup": [], "lexicon_fuzzy_lookup": []}
+    for _ in range(lookups):
+        name = rng.choice(bundled)
+        for sample, query in (("lexicon_exact_lookup", name), ("lexicon_fuzzy_lookup", misspell(name, rng))):
+            t0 = time.perf_counter()
+            lexicon.lookup(query)
+            samples[sample].append((time.perf_counter() - t0) * 1000)
+    results = {name: summarize(values) for name, values in samples.items()}
+    results["lexicon_build"] = {"names": len(lexicon), "ms": round(build_ms, 1)}
+    return results
+
+
+def summarize(samples_ms):
+    ordered = sorted(samples_ms)
+    p95_index = max(0, int(round(0.95 * len(ordered))) - 1)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(statistics.median(ordered), 3),
+        "p95_ms": round(ordered[p95_index], 3),
+        "min_ms": round(ordered[0], 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def run(iterations, seed):
+    # Import after the working directory and env are set up: DB, image store
+    # and cache paths are resolved at import time.
+    from langchain_core.chat_history import InMemoryChatMessageHistory
+    from backend.chain import VisionChain
+    from backend.utils import prepare_uploaded_image
+    from services.ingest_pipeline import IngestPipeline
+    from services.conversation_restore import restore_conversation_by_hash
+    from services.schedule_service import load_or_generate_schedule
+    from scheduler.pdf_export import generate_schedule_pdf
+    
+    uploads = make_synthetic_images(iterations, seed=seed)
+    samples = {name: [] for name in [
+        "prepare_image", "full_analysis", "upload_restore", "chat_time_to_first_token",
+        "chat_turn", "schedule_generation", "pdf_export"
+    ]}
+    
+    for raw in uploads:
+        t0 = time.perf_counter()
+        image = prepare_uploaded_image(raw)
+        samples["prepare_image"].append((time.perf_counter() - t0) * 1000)
+        
+        chain = VisionChain(InMemoryChatMessageHistory(), use_cache=False)
+        t0 = time.perf_counter()
+        prescription_id, analysis = IngestPipeline(image, chain).run()
+        samples["full_analysis"].append((time.perf_counter() - t0) * 1000)
+        
+        t0 = time.perf_counter()
+        restored = restore_conversation_by_hash(image.digest)
+        _ = restored[2].data
+        samples["upload_restore"].append((time.perf_counter() - t0) * 1000)
+        
+        chain.prescription_id = prescription_id
+        t0 = time.perf_counter()
+        first = None
+        for _chunk in chain.stream_with_mode(
+            image=restored[2],
+            user_query="What is each medicine for?",
+            mode="Explain Prescription",
+            extraction_context=analysis["extraction"]
+        ):
+            if first is None:
+                first = time.perf_counter()
+        samples["chat_time_to_first_token"].append((first - t0) * 1000)
+        samples["chat_turn"].append((time.perf_counter() - t0) * 1000)
+        
+        t0 = time.perf_counter()
+        schedule = load_or_generate_schedule(prescription_id, analysis["extraction"], chain)
+        samples["schedule_generation"].append((time.perf_counter() - t0) * 1000)
+        
+        t0 = time.perf_counter()
+        generate_schedule_pdf(schedule)
+        samples["pdf_export"].append((time.perf_counter() - t0) * 1000)
+    
+    return {name: summarize(values) for name, values in samples.items() if values}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10, help="Synthetic prescriptions to process")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Mock seconds between streamed chunks")
+    parser.add_argument("--first-token-latency", type=float, default=0.0, help="Mock seconds before the first chunk")
+    parser.add_argument("--lexicon-size", type=int, default=100000, help="Synthetic names added to the lexicon (0 = skip)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+    
+    output = Path(args.output).resolve() if args.output else None
+    sys.path.insert(0, str(REPO_ROOT))
+    
+    with tempfile.TemporaryDirectory(prefix="rx-bench-") as workdir:
+        os.chdir(workdir)
+        os.environ["VISION_BACKEND"] = "mock"
+        os.environ["VISION_MOCK_TOKEN_LATENCY"] = str(args.token_latency)
+        os.environ["VISION_MOCK_FIRST_TOKEN_LATENCY"] = str(args.first_token_latency)
+        os.environ["VISION_MOCK_FAILURE_RATE"] = "0"
+        os.environ["VISION_MOCK_SEED"] = str(args.seed)
+        os.environ["LLM_CACHE_PATH"] = os.path.join(workdir, "llm_cache.db")
+        os.environ["IMAGE_STORE_DIR"] = os.path.join(workdir, "image_store")
+        
+        results = {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": vars(args),
+            "results": run(args.iterations, args.seed)
+        }
+        if args.lexicon_size:
+            results["results"].update(run_lexicon(args.lexicon_size, args.seed))
+        os.chdir(REPO_ROOT)
+    
+    payload = json.dumps(results, indent=2)
+    if output:
+        output.write_text(payload)
+    else:
+        print(payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,23 @@
 import uuid
-from db.connection import get_connection
+from db.connection import pooled_connection
+from telemetry.tracing import traced
 
+@traced("db.save_chat_message")
 def save_chat_message(prescription_id, role, content):
     """Save a single chat message linked to a prescription."""
     message_id = str(uuid.uuid4())
-    conn = get_connection()
-    try:
+    with pooled_connection() as conn:
         with conn:
             conn.execute("""
                 INSERT INTO chat_messages (id, prescription_id, role, content)
                 VALUES (?, ?, ?, ?)
             """, (message_id, prescription_id, role, content))
-        return message_id
-    finally:
-        conn.close()
+    return message_id
 
+@traced("db.get_chat_history")
 def get_chat_history(prescription_id):
     """Retrieve all chat messages for a specific prescription."""
-    conn = get_connection()
-    try:
+    with pooled_connection() as conn:
         cursor = conn.execute("""
             SELECT id, role, content, created_at 
             FROM chat_messages 
@@ -26,14 +25,11 @@ def get_chat_history(prescription_id):
             ORDER BY created_at ASC
         """, (prescription_id,))
         return [dict(row) for row in cursor.fetchall()]
-    finally:
-        conn.close()
 
+@traced("db.clear_chat_history")
 def clear_chat_history(prescription_id):
     """Clear all chat messages for a prescription (Reset Chat)."""
-    conn = get_connection()
-    try:
+    with pooled_connection() as conn:
         with conn:
             conn.execute("DELETE FROM chat_messages WHERE prescription_id = ?", (prescription_id,))
-    finally:
-        conn.close()
+            conn.execute("DELETE FROM conversation_summaries WHERE prescription_id = ?", (prescription_id,))
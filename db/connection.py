@@ -1,19 +1,126 @@
+import atexit
 import sqlite3
 import os
+import threading
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Iterator
+from db.image_store import put_image
 
 DB_PATH = Path("medical_ai.db")
 
-def get_connection():
-    """Create a database connection and initialize schema if needed."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+# Connection tuning (overridable via environment)
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "-16000"))  # negative = KiB
+MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "128"))
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))  # idle connections kept for reuse
+
+
+class ConnectionPool:
+    """
+    Bounded checkout/return pool of long-lived SQLite connections.
+    
+    connection() lends an idle connection and takes it back when the block
+    exits, so connections (with their pragmas and prepared-statement caches)
+    outlive the thread that used them; Streamlit runs each rerun on a new
+    thread. Up to max_idle connections are kept; extra ones opened during a
+    burst of concurrent callers are closed on return. Nested use on one
+    thread reuses the connection it already holds. The schema is initialized
+    once per process.
+    """
+
+    def __init__(self, path: Path = None, max_idle: int = POOL_SIZE):
+        self.path = path
+        self.max_idle = max_idle
+        self._idle = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Check out a connection for the duration of the block."""
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            yield held
+            return
+        conn = self._checkout()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._checkin(conn)
+
+    def close_all(self):
+        """Close every idle connection (call on shutdown); checked-out ones close on return."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._schema_ready = False
+        for conn in idle:
+            conn.close()
+
+    def _checkout(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._open()
+
+    def _checkin(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            # Never hand a half-finished transaction to the next borrower
+            conn.rollback()
+        with self._lock:
+            if self._schema_ready and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path or DB_PATH,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS};")
+        conn.execute(f"PRAGMA synchronous={SYNCHRONOUS};")
+        conn.execute(f"PRAGMA cache_size={CACHE_SIZE};")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE};")
+        # Enforces the schema's ON DELETE CASCADE (chat messages go with their prescription)
+        conn.execute("PRAGMA foreign_keys=ON;")
+        
+        with self._lock:
+            if not self._schema_ready:
+                # WAL mode is persistent in the DB file; enable it once
+                conn.execute("PRAGMA journal_mode=WAL;")
+                _init_schema(conn)
+                _migrate_inline_images(conn)
+                self._schema_ready = True
+        return conn
+
+
+_pool = ConnectionPool()
+atexit.register(_pool.close_all)
+
+def pooled_connection():
+    """
+    Check out a pooled database connection for a with-block:
     
-    # Enable WAL mode for better concurrency in Streamlit
-    conn.execute("PRAGMA journal_mode=WAL;")
+        with pooled_connection() as conn:
+            conn.execute(...)
     
-    _init_schema(conn)
-    return conn
+    The schema is initialized on first use. Do not close the connection or
+    keep it past the block; use close_all_connections() on shutdown.
+    """
+    return _pool.connection()
+
+def close_all_connections():
+    """Close all idle pooled connections."""
+    _pool.close_all()
 
 def _init_schema(conn):
     """Initialize the database schema."""
@@ -23,9 +130,10 @@ def _init_schema(conn):
             CREATE TABLE IF NOT EXISTS prescriptions (
                 id TEXT PRIMARY KEY,
                 image_hash TEXT UNIQUE NOT NULL,
-                image_data BLOB NOT NULL,
+                image_data BLOB NOT NULL DEFAULT X'',  -- legacy; images live in db.image_store
                 extraction_json TEXT NOT NULL,
                 audit_json TEXT NOT NULL,
+                orientation INTEGER NOT NULL DEFAULT 1,  -- EXIF orientation (PNG drops EXIF)
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         """)
@@ -42,11 +150,130 @@ def _init_schema(conn):
             )
         """)
         
+        # Lightweight sidebar index (no extraction payloads)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS prescription_summaries (
+                prescription_id TEXT PRIMARY KEY,
+                created_at DATETIME NOT NULL,
+                title TEXT NOT NULL,
+                medicine_count INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY (prescription_id) REFERENCES prescriptions (id) ON DELETE CASCADE
+            )
+        """)
+        
+        # Change counters, bumped by triggers on every write from any process
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS data_versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("INSERT OR IGNORE INTO data_versions (name) VALUES ('prescription_summaries')")
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_summaries_{event.lower()}
+                AFTER {event} ON prescription_summaries
+                BEGIN
+                    UPDATE data_versions SET version = version + 1 WHERE name = 'prescription_summaries';
+                END
+            """)
+        
+        # Generated schedules, keyed by the extraction they were built from
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schedules (
+                prescription_id TEXT NOT NULL,
+                extraction_hash TEXT NOT NULL,
+                schedule_hash TEXT NOT NULL,
+                schedule_json TEXT NOT NULL,
+                pdf_data BLOB,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (prescription_id, extraction_hash),
+                FOREIGN KEY (prescription_id) REFERENCES prescriptions (id) ON DELETE CASCADE
+            )
+        """)
+        
+        # Rolling summary of older chat turns (see backend.context_budget)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS conversation_summaries (
+                prescription_id TEXT PRIMARY KEY,
+                covered_messages INTEGER NOT NULL,
+                covered_hash TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (prescription_id) REFERENCES prescriptions (id) ON DELETE CASCADE
+            )
+        """)
+        
+        # Cross-process single-flight leases for ingest (see services.single_flight)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_leases (
+                image_hash TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        
+        # Background ingest jobs (see services.jobs)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                id TEXT PRIMARY KEY,
+                image_hash TEXT NOT NULL,
+                orientation INTEGER NOT NULL DEFAULT 1,
+                status TEXT NOT NULL,  -- queued | running | done | rejected | failed
+                stage TEXT NOT NULL,
+                progress REAL NOT NULL DEFAULT 0,
+                prescription_id TEXT,
+                result_json TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                available_at REAL NOT NULL DEFAULT 0,  -- retry backoff: not claimed before this
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at REAL NOT NULL
+            )
+        """)
+        _add_column(conn, "ingest_jobs", "available_at", "REAL NOT NULL DEFAULT 0")
+        if _add_column(conn, "prescriptions", "orientation", "INTEGER NOT NULL DEFAULT 1"):
+            # Recover orientations recorded by the ingest jobs that created the rows
+            conn.execute("""
+                UPDATE prescriptions SET orientation = (
+                    SELECT j.orientation FROM ingest_jobs j
+                    WHERE j.prescription_id = prescriptions.id
+                    ORDER BY j.updated_at DESC LIMIT 1
+                )
+                WHERE id IN (SELECT prescription_id FROM ingest_jobs WHERE prescription_id IS NOT NULL)
+            """)
+        
         # Index for faster lookup
         conn.execute("CREATE INDEX IF NOT EXISTS idx_prescriptions_hash ON prescriptions(image_hash)")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_prescription_id ON chat_messages(prescription_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_prescription_created ON chat_messages(prescription_id, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_schedules_hash ON schedules(schedule_hash)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_summaries_created ON prescription_summaries(created_at DESC, prescription_id DESC)")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active_hash ON ingest_jobs(image_hash) WHERE status IN ('queued', 'running')")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON ingest_jobs(status, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_hash ON ingest_jobs(image_hash, created_at)")
+
+def _add_column(conn, table, column, definition):
+    """Add a column to an existing table if it is missing. Returns True if added."""
+    columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column in columns:
+        return False
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
+
+def _migrate_inline_images(conn):
+    """Move legacy inline image BLOBs into the content-addressed image store (idempotent)."""
+    rows = conn.execute("SELECT id, image_hash FROM prescriptions WHERE length(image_data) > 0").fetchall()
+    for row in rows:
+        blob = conn.execute("SELECT image_data FROM prescriptions WHERE id = ?", (row["id"],)).fetchone()[0]
+        put_image(row["image_hash"], bytes(blob))
+        with conn:
+            conn.execute("UPDATE prescriptions SET image_data = X'' WHERE id = ?", (row["id"],))
 
 if __name__ == "__main__":
     # Test initialization
-    get_connection().close()
+    with pooled_connection():
+        pass
+    close_all_connections()
     print("Database initialized successfully.")
@@ -0,0 +1,28 @@
+from db.connection import pooled_connection
+from telemetry.tracing import traced
+
+@traced("db.get_conversation_summary")
+def get_conversation_summary(prescription_id):
+    """Return the rolling chat summary record for a prescription, or None."""
+    with pooled_connection() as conn:
+        row = conn.execute("""
+            SELECT covered_messages, covered_hash, summary
+            FROM conversation_summaries
+            WHERE prescription_id = ?
+        """, (prescription_id,)).fetchone()
+        return dict(row) if row else None
+
+@traced("db.save_conversation_summary")
+def save_conversation_summary(prescription_id, covered_messages, covered_hash, summary):
+    """Store the summary of the first covered_messages chat messages."""
+    with pooled_connection() as conn:
+        with conn:
+            conn.execute("""
+                INSERT INTO conversation_summaries (prescription_id, covered_messages, covered_hash, summary)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(prescription_id) DO UPDATE SET
+                    covered_messages = excluded.covered_messages,
+                    covered_hash = excluded.covered_hash,
+                    summary = excluded.summary,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (prescription_id, covered_messages, covered_hash, summary))
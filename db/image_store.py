@@ -0,0 +1,58 @@
+"""
+Content-addressed on-disk store for prescription images.
+Files are keyed by the SHA-256 image hash, so writes are idempotent.
+"""
+import os
+import re
+import tempfile
+from pathlib import Path
+from telemetry.tracing import span
+
+IMAGE_STORE_DIR = Path(os.getenv("IMAGE_STORE_DIR", "image_store"))
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+def image_path(image_hash):
+    """Path of an image in the store (two-level fan-out by hash prefix)."""
+    if not _HASH_RE.match(image_hash):
+        raise ValueError(f"Invalid image hash: {image_hash!r}")
+    return IMAGE_STORE_DIR / image_hash[:2] / f"{image_hash}.png"
+
+def has_image(image_hash):
+    return image_path(image_hash).exists()
+
+def put_image(image_hash, image_bytes):
+    """Write image bytes under their hash (atomic; no-op if already stored)."""
+    path = image_path(image_hash)
+    if path.exists():
+        return path
+    with span("image_store.put", payload_bytes=len(image_bytes)):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(image_bytes)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+    return path
+
+def read_image(image_hash):
+    """Read image bytes from the store. Returns None if missing."""
+    path = image_path(image_hash)
+    with span("image_store.read") as trace:
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        trace.set("payload_bytes", len(data))
+        return data
+
+def delete_image(image_hash):
+    """Remove an image from the store, if present."""
+    try:
+        image_path(image_hash).unlink()
+    except FileNotFoundError:
+        pass
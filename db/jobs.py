@@ -0,0 +1,136 @@
+import json
+import time
+import uuid
+from db.connection import pooled_connection
+from telemetry.tracing import traced
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["result"] = json.loads(job.pop("result_json") or "{}")
+    return job
+
+@traced("db.create_job")
+def create_job(image_hash, orientation=1):
+    """
+    Queue an ingest job for an image already in the image store.
+    Idempotent while a job for the same hash is queued or running: the
+    active job is returned instead of a new one.
+    """
+    with pooled_connection() as conn:
+        with conn:
+            conn.execute("""
+                INSERT INTO ingest_jobs (id, image_hash, orientation, status, stage, updated_at)
+                VALUES (?, ?, ?, 'queued', 'queued', ?)
+                ON CONFLICT(image_hash) WHERE status IN ('queued', 'running') DO NOTHING
+            """, (str(uuid.uuid4()), image_hash, orientation, time.time()))
+    return get_latest_job(image_hash)
+
+@traced("db.get_job")
+def get_job(job_id):
+    """Retrieve a job by id, or None."""
+    with pooled_connection() as conn:
+        row = conn.execute("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row)
+
+@traced("db.get_latest_job")
+def get_latest_job(image_hash):
+    """Most recent job for an image hash, or None."""
+    with pooled_connection() as conn:
+        row = conn.execute("""
+            SELECT * FROM ingest_jobs
+            WHERE image_hash = ?
+            ORDER BY created_at DESC, rowid DESC
+            LIMIT 1
+        """, (image_hash,)).fetchone()
+        return _row_to_job(row)
+
+@traced("db.claim_next_job")
+def claim_next_job(worker_id):
+    """
+    Atomically move the oldest queued job that is due (past its retry
+    backoff) to running for worker_id. Returns it or None.
+    """
+    now = time.time()
+    with pooled_connection() as conn:
+        with conn:
+            row = conn.execute("""
+                UPDATE ingest_jobs
+                SET status = 'running', worker = ?, attempts = attempts + 1, updated_at = ?
+                WHERE id = (
+                    SELECT id FROM ingest_jobs
+                    WHERE status = 'queued' AND available_at <= ?
+                    ORDER BY created_at, rowid
+                    LIMIT 1
+                )
+                RETURNING *
+            """, (worker_id, now, now)).fetchone()
+    return _row_to_job(row)
+
+@traced("db.update_job_progress")
+def update_job_progress(job_id, stage, progress):
+    """Record the current stage; also serves as the worker heartbeat."""
+    with pooled_connection() as conn:
+        with conn:
+            conn.execute("""
+                UPDATE ingest_jobs SET stage = ?, progress = MAX(progress, ?), updated_at = ?
+                WHERE id = ? AND status = 'running'
+            """, (stage, progress, time.time(), job_id))
+
+@traced("db.update_job_partial")
+def update_job_partial(job_id, result):
+    """Store a partial result (e.g. medicines read so far) on a running job."""
+    with pooled_connection() as conn:
+        with conn:
+            conn.execute("""
+                UPDATE ingest_jobs SET result_json = ?, updated_at = ?
+                WHERE id = ? AND status = 'running'
+            """, (json.dumps(result), time.time(), job_id))
+
+@traced("db.finish_job")
+def finish_job(job_id, status, prescription_id=None, result=None, error=None):
+    """Mark a job done, rejected or failed."""
+    with pooled_connection() as conn:
+        with conn:
+            conn.execute("""
+                UPDATE ingest_jobs
+                SET status = ?, stage = ?, progress = 1.0, prescription_id = ?,
+                    result_json = ?, error = ?, updated_at = ?
+                WHERE id = ?
+            """, (status, status, prescription_id, json.dumps(result or {}), error, time.time(), job_id))
+
+@traced("db.requeue_job")
+def requeue_job(job_id, error=None, delay=0):
+    """Put a failed attempt back in the queue after delay seconds, keeping the last error."""
+    now = time.time()
+    with pooled_connection() as conn:
+        with conn:
+            conn.execute("""
+                UPDATE ingest_jobs
+                SET status = 'queued', stage = 'queued', worker = NULL, result_json = NULL, error = ?,
+                    available_at = ?, updated_at = ?
+                WHERE id = ?
+            """, (error, now + delay, now, job_id))
+
+@traced("db.requeue_stale_jobs")
+def requeue_stale_jobs(stale_seconds, max_attempts):
+    """
+    Recover jobs whose worker died (no heartbeat for stale_seconds): requeue
+    them, or fail them once they have used max_attempts. Returns the number
+    of jobs requeued.
+    """
+    cutoff = time.time() - stale_seconds
+    with pooled_connection() as conn:
+        with conn:
+            conn.execute("""
+                UPDATE ingest_jobs
+                SET status = 'failed', stage = 'failed', error = 'Worker lost too many times', updated_at = ?
+                WHERE status = 'running' AND updated_at < ? AND attempts >= ?
+            """, (time.time(), cutoff, max_attempts))
+            cursor = conn.execute("""
+                UPDATE ingest_jobs
+                SET status = 'queued', stage = 'queued', worker = NULL, result_json = NULL, updated_at = ?
+                WHERE status = 'running' AND updated_at < ?
+            """, (time.time(), cutoff))
+    return cursor.rowcount
@@ -0,0 +1,29 @@
+import time
+from db.connection import pooled_connection
+from telemetry.tracing import traced
+
+@traced("db.acquire_lease")
+def acquire_lease(image_hash, owner, ttl_seconds):
+    """
+    Take the ingest lease for an image hash if it is free or expired.
+    Returns True if owner now holds the lease.
+    """
+    now = time.time()
+    with pooled_connection() as conn:
+        with conn:
+            cursor = conn.execute("""
+                INSERT INTO ingest_leases (image_hash, owner, expires_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(image_hash) DO UPDATE SET
+                    owner = excluded.owner,
+                    expires_at = excluded.expires_at
+                WHERE ingest_leases.expires_at < ? OR ingest_leases.owner = excluded.owner
+            """, (image_hash, owner, now + ttl_seconds, now))
+    return cursor.rowcount == 1
+
+@traced("db.release_lease")
+def release_lease(image_hash, owner):
+    """Release a lease held by owner (no-op if it expired and was taken over)."""
+    with pooled_connection() as conn:
+        with conn:
+            conn.execute("DELETE FROM ingest_leases WHERE image_hash = ? AND owner = ?", (image_hash, owner))
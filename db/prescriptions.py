@@ -1,33 +1,56 @@
 import json
+import threading
 import uuid
-from db.connection import get_connection
+from db.connection import pooled_connection
+from db.image_store import put_image, read_image, delete_image
+from telemetry.tracing import traced
 
-def save_prescription(image_hash, image_data, extraction_dict, audit_dict):
-    """Save a new prescription record."""
+SIDEBAR_PAGE_SIZE = 20
+
+# In-process cache of summary pages, invalidated on insert/update/delete and
+# whenever data_versions shows a write from another process (e.g. services.batch)
+_summary_cache = {}
+_summary_cache_version = None
+_summary_cache_lock = threading.Lock()
+_summaries_backfilled = False
+
+@traced("db.save_prescription")
+def save_prescription(image_hash, image_data, extraction_dict, audit_dict, orientation=1):
+    """
+    Save a new prescription record. Image bytes go to the image store;
+    orientation is the upload's EXIF orientation (the stored PNG has none).
+    Idempotent per image hash: if the image was already saved (e.g. by a
+    concurrent upload), the existing record is kept and its id returned.
+    """
     prescription_id = str(uuid.uuid4())
-    conn = get_connection()
-    try:
+    put_image(image_hash, image_data)
+    with pooled_connection() as conn:
         with conn:
-            conn.execute("""
-                INSERT INTO prescriptions (id, image_hash, image_data, extraction_json, audit_json)
-                VALUES (?, ?, ?, ?, ?)
+            cursor = conn.execute("""
+                INSERT INTO prescriptions (id, image_hash, image_data, extraction_json, audit_json, orientation)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(image_hash) DO NOTHING
             """, (
                 prescription_id,
                 image_hash,
-                image_data,
+                b"",
                 json.dumps(extraction_dict),
-                json.dumps(audit_dict)
+                json.dumps(audit_dict),
+                orientation
             ))
-        return prescription_id
-    finally:
-        conn.close()
+            if cursor.rowcount == 0:
+                row = conn.execute("SELECT id FROM prescriptions WHERE image_hash = ?", (image_hash,)).fetchone()
+                return row["id"]
+            _upsert_summary(conn, prescription_id, extraction_dict)
+    _invalidate_summary_cache()
+    return prescription_id
 
+@traced("db.get_prescription_by_hash")
 def get_prescription_by_hash(image_hash):
-    """Retrieve a prescription by its image hash."""
-    conn = get_connection()
-    try:
+    """Retrieve a prescription by its image hash (metadata only; see load_image_bytes)."""
+    with pooled_connection() as conn:
         cursor = conn.execute("""
-            SELECT id, image_data, extraction_json, audit_json, created_at 
+            SELECT id, image_hash, extraction_json, audit_json, orientation, created_at 
             FROM prescriptions 
             WHERE image_hash = ?
         """, (image_hash,))
@@ -37,27 +60,114 @@ def get_prescription_by_hash(image_hash):
             data["extraction"] = json.loads(data["extraction_json"])
             data["audit"] = json.loads(data["audit_json"])
             return data
+    return None
+
+@traced("db.get_prescription_with_history")
+def get_prescription_with_history(prescription_id):
+    """
+    Load a prescription and its chat history in a single indexed query.
+    
+    Returns:
+        (record, history) where history is a list of {role, content, created_at}
+        dicts in insertion order, or None if the prescription does not exist.
+    """
+    with pooled_connection() as conn:
+        rows = conn.execute("""
+            SELECT p.id, p.image_hash, p.extraction_json, p.audit_json, p.orientation, p.created_at,
+                   m.role AS message_role, m.content AS message_content, m.created_at AS message_created_at
+            FROM prescriptions p
+            LEFT JOIN chat_messages m ON m.prescription_id = p.id
+            WHERE p.id = ?
+            ORDER BY m.created_at ASC, m.rowid ASC
+        """, (prescription_id,)).fetchall()
+    if not rows:
         return None
-    finally:
-        conn.close()
+    
+    first = rows[0]
+    record = {
+        "id": first["id"],
+        "image_hash": first["image_hash"],
+        "orientation": first["orientation"],
+        "created_at": first["created_at"],
+        "extraction": json.loads(first["extraction_json"]),
+        "audit": json.loads(first["audit_json"])
+    }
+    history = [
+        {"role": row["message_role"], "content": row["message_content"], "created_at": row["message_created_at"]}
+        for row in rows if row["message_role"] is not None
+    ]
+    return record, history
 
-def get_all_prescriptions():
-    """Retrieve all prescription metadata for the sidebar."""
-    conn = get_connection()
-    try:
-        cursor = conn.execute("""
-            SELECT id, image_hash, extraction_json, created_at 
-            FROM prescriptions 
-            ORDER BY created_at DESC
-        """)
-        return [dict(row) for row in cursor.fetchall()]
-    finally:
-        conn.close()
+@traced("db.load_image_bytes")
+def load_image_bytes(image_hash):
+    """Load image bytes from the image store, falling back to a legacy inline BLOB."""
+    image_bytes = read_image(image_hash)
+    if image_bytes is not None:
+        return image_bytes
+    with pooled_connection() as conn:
+        row = conn.execute(
+            "SELECT image_data FROM prescriptions WHERE image_hash = ?", (image_hash,)
+        ).fetchone()
+    return bytes(row["image_data"]) if row else None
+
+@traced("db.list_prescription_summaries")
+def list_prescription_summaries(limit=SIDEBAR_PAGE_SIZE, cursor=None):
+    """
+    Keyset-paginated sidebar index, newest first.
+    
+    Args:
+        limit: Page size
+        cursor: (created_at, id) of the last item of the previous page, or None
+        
+    Returns:
+        (summaries, next_cursor) where next_cursor is None on the last page.
+        Each summary has id, created_at, title and medicine_count.
+    """
+    global _summary_cache_version
+    cache_key = (limit, tuple(cursor) if cursor else None)
+    _ensure_summaries_backfilled()
+    with pooled_connection() as conn:
+        version = conn.execute(
+            "SELECT version FROM data_versions WHERE name = 'prescription_summaries'"
+        ).fetchone()["version"]
+        with _summary_cache_lock:
+            if version != _summary_cache_version:
+                _summary_cache.clear()
+                _summary_cache_version = version
+            elif cache_key in _summary_cache:
+                return _summary_cache[cache_key]
+        
+        if cursor:
+            rows = conn.execute("""
+                SELECT prescription_id AS id, created_at, title, medicine_count
+                FROM prescription_summaries
+                WHERE (created_at, prescription_id) < (?, ?)
+                ORDER BY created_at DESC, prescription_id DESC
+                LIMIT ?
+            """, (cursor[0], cursor[1], limit + 1)).fetchall()
+        else:
+            rows = conn.execute("""
+                SELECT prescription_id AS id, created_at, title, medicine_count
+                FROM prescription_summaries
+                ORDER BY created_at DESC, prescription_id DESC
+                LIMIT ?
+            """, (limit + 1,)).fetchall()
+    
+    summaries = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = (summaries[-1]["created_at"], summaries[-1]["id"])
+    
+    result = (summaries, next_cursor)
+    with _summary_cache_lock:
+        if version == _summary_cache_version:
+            _summary_cache[cache_key] = result
+    return result
 
+@traced("db.update_prescription_data")
 def update_prescription_data(prescription_id, extraction_dict, audit_dict):
     """Update extraction and audit data (e.g., after ambiguity resolution)."""
-    conn = get_connection()
-    try:
+    with pooled_connection() as conn:
         with conn:
             conn.execute("""
                 UPDATE prescriptions 
@@ -68,14 +178,68 @@ def update_prescription_data(prescription_id, extraction_dict, audit_dict):
                 json.dumps(audit_dict),
                 prescription_id
             ))
-    finally:
-        conn.close()
+            _upsert_summary(conn, prescription_id, extraction_dict)
+    _invalidate_summary_cache()
 
+@traced("db.delete_prescription")
 def delete_prescription(prescription_id):
-    """Delete a prescription and its associated chat history."""
-    conn = get_connection()
-    try:
+    """Delete a prescription, its associated chat history and finished ingest jobs."""
+    with pooled_connection() as conn:
+        row = conn.execute("SELECT image_hash FROM prescriptions WHERE id = ?", (prescription_id,)).fetchone()
         with conn:
+            conn.execute("DELETE FROM prescription_summaries WHERE prescription_id = ?", (prescription_id,))
+            conn.execute("DELETE FROM schedules WHERE prescription_id = ?", (prescription_id,))
+            conn.execute("DELETE FROM conversation_summaries WHERE prescription_id = ?", (prescription_id,))
             conn.execute("DELETE FROM prescriptions WHERE id = ?", (prescription_id,))
-    finally:
-        conn.close()
+            if row:
+                # Finished jobs would otherwise point re-uploads at the deleted record
+                conn.execute("""
+                    DELETE FROM ingest_jobs WHERE image_hash = ? AND status NOT IN ('queued', 'running')
+                """, (row["image_hash"],))
+    if row:
+        # image_hash is UNIQUE, so no other prescription references this file
+        delete_image(row["image_hash"])
+    _invalidate_summary_cache()
+
+def derive_title(extraction_dict):
+    """Short sidebar title from the extracted medicine names."""
+    medicines = (extraction_dict or {}).get("medicines") or []
+    names = [m.get("name") for m in medicines if m.get("name")]
+    if not names:
+        return "Prescription"
+    title = names[0]
+    if len(names) > 1:
+        title += f" +{len(names) - 1}"
+    return title
+
+def _upsert_summary(conn, prescription_id, extraction_dict):
+    medicines = (extraction_dict or {}).get("medicines") or []
+    conn.execute("""
+        INSERT INTO prescription_summaries (prescription_id, created_at, title, medicine_count)
+        SELECT id, created_at, ?, ? FROM prescriptions WHERE id = ?
+        ON CONFLICT(prescription_id) DO UPDATE SET
+            title = excluded.title,
+            medicine_count = excluded.medicine_count
+    """, (derive_title(extraction_dict), len(medicines), prescription_id))
+
+def _invalidate_summary_cache():
+    with _summary_cache_lock:
+        _summary_cache.clear()
+
+def _ensure_summaries_backfilled():
+    """One-time index build for prescriptions saved before the summary table existed."""
+    global _summaries_backfilled
+    if _summaries_backfilled:
+        return
+    with pooled_connection() as conn:
+        rows = conn.execute("""
+            SELECT p.id, p.extraction_json
+            FROM prescriptions p
+            LEFT JOIN prescription_summaries s ON s.prescription_id = p.id
+            WHERE s.prescription_id IS NULL
+        """).fetchall()
+        if rows:
+            with conn:
+                for row in rows:
+                    _upsert_summary(conn, row["id"], json.loads(row["extraction_json"]))
+    _summaries_backfilled = True
@@ -0,0 +1,56 @@
+import hashlib
+import json
+from db.connection import pooled_connection
+from telemetry.tracing import traced
+
+def content_hash(data):
+    """Stable SHA-256 of a JSON-serializable value (extraction or schedule)."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+@traced("db.get_schedule")
+def get_schedule(prescription_id, extraction_hash):
+    """Return the stored schedule list for this exact extraction, or None."""
+    with pooled_connection() as conn:
+        row = conn.execute("""
+            SELECT schedule_json FROM schedules
+            WHERE prescription_id = ? AND extraction_hash = ?
+        """, (prescription_id, extraction_hash)).fetchone()
+        if row:
+            return json.loads(row["schedule_json"])
+    return None
+
+@traced("db.save_schedule")
+def save_schedule(prescription_id, extraction_hash, schedule):
+    """Store a generated schedule. Returns its schedule hash."""
+    schedule_hash = content_hash(schedule)
+    with pooled_connection() as conn:
+        with conn:
+            conn.execute("""
+                INSERT INTO schedules (prescription_id, extraction_hash, schedule_hash, schedule_json)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(prescription_id, extraction_hash) DO UPDATE SET
+                    schedule_hash = excluded.schedule_hash,
+                    schedule_json = excluded.schedule_json,
+                    pdf_data = NULL
+            """, (prescription_id, extraction_hash, schedule_hash, json.dumps(schedule)))
+    return schedule_hash
+
+@traced("db.get_schedule_pdf")
+def get_schedule_pdf(schedule_hash):
+    """Return previously rendered PDF bytes for a schedule hash, or None."""
+    with pooled_connection() as conn:
+        row = conn.execute("""
+            SELECT pdf_data FROM schedules
+            WHERE schedule_hash = ? AND pdf_data IS NOT NULL
+            LIMIT 1
+        """, (schedule_hash,)).fetchone()
+        if row:
+            return bytes(row["pdf_data"])
+    return None
+
+@traced("db.save_schedule_pdf")
+def save_schedule_pdf(schedule_hash, pdf_bytes):
+    """Attach rendered PDF bytes to every stored schedule with this hash."""
+    with pooled_connection() as conn:
+        with conn:
+            conn.execute("UPDATE schedules SET pdf_data = ? WHERE schedule_hash = ?", (pdf_bytes, schedule_hash))
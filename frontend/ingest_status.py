@@ -0,0 +1,74 @@
+import streamlit as st
+from backend.utils import PreparedImage
+from db.prescriptions import get_prescription_by_hash
+from services.conversation_restore import restore_conversation_by_hash
+from services.jobs import submit_ingest, get_ingest_status, JOB_POLL_SECONDS
+from frontend.session_utils import load_into_session
+from frontend.ui_components import render_medicine_cards
+
+STAGE_LABELS = {
+    "queued": "Waiting for a worker",
+    "validation": "Verifying image",
+    "intake": "Verifying and reading image",
+    "ocr": "Reading handwriting",
+    "normalize": "Structuring medicines",
+    "lexicon": "Matching medicine names",
+    "audit": "Safety & ambiguity audit",
+    "persist": "Saving"
+}
+
+
+def track_ingest_job(image: PreparedImage):
+    """
+    Queue an uploaded image for background analysis (once) and follow it.
+
+    While the job runs, a fragment polls its stage/progress without rerunning
+    the page. When it finishes the prescription is loaded into the session
+    and the app reruns; rejections and failures are shown in place.
+    """
+    job = get_ingest_status(image_hash=image.digest)
+    if job is None or (job["status"] == "done" and get_prescription_by_hash(image.digest) is None):
+        # No job yet, or the prescription it produced has since been deleted
+        job = submit_ingest(image)
+
+    if job["status"] in ("queued", "running"):
+        # Poll only while the job is active
+        st.fragment(run_every=JOB_POLL_SECONDS)(_render_job_progress)(image.digest)
+    else:
+        _render_job_progress(image.digest)
+        # Rejections are not cached (see VisionChain.validate_image), so a retry re-checks the image
+        retry_label = {"failed": "🔁 Retry analysis", "rejected": "🔁 Re-check this image"}.get(job["status"])
+        if retry_label and st.button(retry_label, key=f"retry_{image.digest}"):
+            submit_ingest(image)
+            st.rerun()
+
+
+def _render_job_progress(image_hash: str):
+    job = get_ingest_status(image_hash=image_hash)
+    status = job["status"]
+
+    if status in ("queued", "running"):
+        label = STAGE_LABELS.get(job["stage"], job["stage"])
+        with st.status("🔍 Analyzing prescription in the background...", expanded=True):
+            st.progress(job["progress"], text=f"{label}...")
+            st.caption("You can keep this tab open or come back later; the analysis continues on the server.")
+        # Medicines streamed out of normalization so far
+        partial = job["result"].get("medicines")
+        if partial:
+            render_medicine_cards({"medicines": partial}, partial=True)
+
+    elif status == "done":
+        restored = restore_conversation_by_hash(image_hash)
+        if restored:
+            p_id, img_hash, image, analysis, history = restored
+            analysis["timings"] = job["result"].get("timings", {})
+            load_into_session(p_id, img_hash, image, analysis, history)
+            st.rerun()
+        st.error("❌ Analysis finished but the record could not be loaded.")
+
+    elif status == "rejected":
+        validation = job["result"].get("validation", {})
+        st.error(f"❌ This image does not appear to be a medical prescription.\n\nReason: {validation.get('reason', 'Unknown')}")
+
+    else:
+        st.error(f"❌ Analysis failed: {job.get('error') or 'Unknown error'}")
@@ -1,12 +1,10 @@
 import streamlit as st
 from typing import Dict, Any
-from PIL import Image
 import time
-from services.utils import calculate_image_hash
-from services.image_validation import validate_prescription
-from services.extraction_service import perform_extraction
-from services.conversation_restore import restore_conversation_by_hash
-from db.prescriptions import delete_prescription, get_all_prescriptions
+from backend.resilience import LLMUnavailableError, LLMResponseError
+from backend.utils import prepare_uploaded_image
+from services.conversation_restore import restore_conversation_by_hash, restore_conversation_by_id
+from db.prescriptions import delete_prescription
 from db.chat import get_chat_history
 from frontend.ui_components import (
     render_sidebar, 
@@ -17,6 +15,8 @@ from frontend.ui_components import (
     render_unresolvable_card
 )
 from frontend.session_utils import load_into_session
+from frontend.ingest_status import track_ingest_job
+from frontend.stream_renderer import StreamRenderer
 
 def render_prescription_page(model_config: Dict[str, Any], uploaded_file: Any):
     """Main Prescription Analyzer page logic."""
@@ -34,33 +34,23 @@ def render_prescription_page(model_config: Dict[str, Any], uploaded_file: Any):
 
     # 1. Handle New Upload
     if uploaded_file is not None:
-        image = Image.open(uploaded_file)
-        img_hash = calculate_image_hash(image)
+        image = prepare_uploaded_image(uploaded_file.getvalue())
+        img_hash = image.digest
         
         # Check if already processed
         if st.session_state.get("active_img_hash") != img_hash:
-            with st.status("🔍 Checking for existing record...", expanded=True) as status:
-                restored = restore_conversation_by_hash(img_hash)
-                
-                if restored:
+            restored = restore_conversation_by_hash(img_hash)
+            
+            if restored:
+                with st.status("🔍 Checking for existing record...", expanded=True) as status:
                     st.write("✅ Existing prescription found. Restoring history...")
                     load_into_session(*restored)
                     status.update(label="Restoration Complete!", state="complete", expanded=False)
-                else:
-                    st.write("🧐 Verifying new image...")
-                    is_valid, validation = validate_prescription(image)
-                    
-                    if not is_valid:
-                        st.error(f"❌ This image does not appear to be a medical prescription.\n\nReason: {validation.get('reason', 'Unknown')}")
-                        status.update(label="Access Blocked", state="error", expanded=False)
-                        st.stop()
-                    
-                    st.write("🪄 Extraction in progress...")
-                    p_id, analysis = perform_extraction(image, st.session_state.vision_chain)
-                    load_into_session(p_id, img_hash, image, analysis, [])
-                    status.update(label="Analysis Complete!", state="complete", expanded=False)
+                st.rerun()
             
-            st.rerun()
+            # New image: analysis runs in the background job queue
+            track_ingest_job(image)
+            st.stop()
 
     # 2. Main content area
     if st.session_state.get("prescription_id"):
@@ -70,14 +60,9 @@ def render_prescription_page(model_config: Dict[str, Any], uploaded_file: Any):
 
 def _switch_to_prescription(p_id):
     """Switch to a specific prescription by ID."""
-    from db.prescriptions import get_all_prescriptions
-    all_p = get_all_prescriptions()
-    target = next((p for p in all_p if p["id"] == p_id), None)
-    if target:
-        from services.conversation_restore import restore_conversation_by_hash
-        restored = restore_conversation_by_hash(target["image_hash"])
-        if restored:
-            load_into_session(*restored)
+    restored = restore_conversation_by_id(p_id)
+    if restored:
+        load_into_session(*restored)
 
 def _render_active_prescription(chat_mode, model_config):
     """Render the active prescription work area."""
@@ -90,10 +75,11 @@ def _render_active_prescription(chat_mode, model_config):
         render_medicine_cards(st.session_state.active_analysis["extraction"])
     with col2:
         with st.expander("🖼️ View Original Prescription", expanded=False):
-            st.image(st.session_state.active_image, width="stretch")
+            st.image(st.session_state.active_image.data, width="stretch")
         render_transparency_panel(
             audit_data, 
-            st.session_state.vision_chain.vision_client.model_name
+            st.session_state.vision_chain.vision_client.model_name,
+            st.session_state.active_analysis.get("timings")
         )
 
     st.divider()
@@ -119,7 +105,6 @@ def _render_active_prescription(chat_mode, model_config):
         # Stream response
         with st.chat_message("assistant", avatar="🤖"):
             message_placeholder = st.empty()
-            full_response = ""
             response = st.session_state.vision_chain.stream_with_mode(
                 image=st.session_state.active_image,
                 user_query=user_query,
@@ -128,10 +113,12 @@ def _render_active_prescription(chat_mode, model_config):
                 ambiguity_state=ambiguity_state,
                 **model_config
             )
-            for chunk in response:
-                full_response += chunk
-                message_placeholder.markdown(full_response + "▌")
-            message_placeholder.markdown(full_response)
+            try:
+                StreamRenderer(message_placeholder, surface="chat").render(response)
+            except (LLMUnavailableError, LLMResponseError) as e:
+                message_placeholder.error(f"⚠️ The assistant could not answer right now. Please try again.\n\n{e}")
+                st.session_state.chat_history.append(st.session_state.vision_chain.memory.messages[-1]) # User
+                st.stop()
         
         # Persist - VisionChain already handled DB saving, we just need to refresh UI
         st.session_state.chat_history.append(st.session_state.vision_chain.memory.messages[-2]) # User
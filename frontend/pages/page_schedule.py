@@ -1,14 +1,12 @@
 import streamlit as st
 from typing import Dict, Any
-from PIL import Image
 import time
 import json
-from services.utils import calculate_image_hash
+from backend.resilience import LLMUnavailableError, LLMResponseError
 from services.conversation_restore import restore_conversation_by_hash
-from services.image_validation import validate_prescription
-from services.extraction_service import perform_extraction
+from backend.utils import prepare_uploaded_image
 from scheduler.readiness import calculate_schedule_readiness
-from scheduler.pdf_export import generate_schedule_pdf
+from services.schedule_service import load_or_generate_schedule, get_schedule_pdf_bytes
 from frontend.ui_components import (
     render_sidebar, 
     render_welcome_screen,
@@ -21,6 +19,7 @@ from frontend.schedule_ui import (
     render_schedule_transparency
 )
 from frontend.session_utils import load_into_session
+from frontend.ingest_status import track_ingest_job
 
 def render_schedule_page(model_config: Dict[str, Any], sidebar_file: Any):
     """Page 2 orchestrator: Smart Prescription Schedule."""
@@ -47,30 +46,22 @@ def render_schedule_page(model_config: Dict[str, Any], sidebar_file: Any):
         
     # Process new upload (either from sidebar or local)
     if uploaded_file and not st.session_state.get("prescription_id"):
-            image = Image.open(uploaded_file)
-            img_hash = calculate_image_hash(image)
+            image = prepare_uploaded_image(uploaded_file.getvalue())
+            img_hash = image.digest
             
-            with st.status("🔍 Analyzing Prescription...", expanded=True) as status:
-                # CHECK FOR DUPLICATE / EXISTING RECORD
-                restored = restore_conversation_by_hash(img_hash)
-                
-                if restored:
+            # CHECK FOR DUPLICATE / EXISTING RECORD
+            restored = restore_conversation_by_hash(img_hash)
+            
+            if restored:
+                with st.status("🔍 Analyzing Prescription...", expanded=True) as status:
                     st.write("✅ Existing record found. Loading data...")
                     load_into_session(*restored)
                     status.update(label="Data Restored", state="complete")
-                else:
-                    st.write("🧐 Verifying image...")
-                    is_valid, validation = validate_prescription(image)
-                    if not is_valid:
-                        st.error(f"❌ Rejected: {validation.get('reason', 'Invalid prescription')}")
-                        st.stop()
-                        
-                    st.write("🪄 Running extraction pipeline...")
-                    p_id, analysis = perform_extraction(image, st.session_state.vision_chain)
-                    load_into_session(p_id, img_hash, image, analysis, [])
-                    status.update(label="Initial Extraction Complete", state="complete")
-                    
-            st.rerun()
+                st.rerun()
+            
+            # New image: analysis runs in the background job queue
+            track_ingest_job(image)
+            st.stop()
     
     # 2. Main Workflow Area
     if st.session_state.get("prescription_id"):
@@ -123,11 +114,20 @@ def render_schedule_page(model_config: Dict[str, Any], sidebar_file: Any):
         
         # State: Ready -> Generate Table
         else:
-            # Generate the actual schedule JSON if not already done
+            # Load the stored schedule (or generate it) if not already in session
             if not st.session_state.get("schedule_generated"):
                 with st.spinner("⏳ Synthesizing your daily timeline..."):
-                    schedule_data = st.session_state.vision_chain.generate_final_schedule(extraction)
-                    st.session_state.final_schedule = schedule_data.get("schedule", [])
+                    try:
+                        st.session_state.final_schedule = load_or_generate_schedule(
+                            st.session_state.prescription_id,
+                            extraction,
+                            st.session_state.vision_chain
+                        )
+                    except (LLMUnavailableError, LLMResponseError) as e:
+                        st.error(f"⚠️ The schedule could not be generated right now. Please try again.\n\n{e}")
+                        if st.button("🔁 Retry schedule generation", key="retry_schedule"):
+                            st.rerun()
+                        st.stop()
                     st.session_state.schedule_generated = True
             
             # Show Table & Timeline
@@ -137,7 +137,7 @@ def render_schedule_page(model_config: Dict[str, Any], sidebar_file: Any):
             st.divider()
             col1, col2 = st.columns([1, 2])
             with col1:
-                pdf_bytes = generate_schedule_pdf(st.session_state.final_schedule)
+                pdf_bytes = get_schedule_pdf_bytes(st.session_state.final_schedule)
                 st.download_button(
                     label="📥 Download Schedule as PDF",
                     data=pdf_bytes,
@@ -0,0 +1,93 @@
+"""
+Throttled rendering of streamed model output.
+
+StreamRenderer coalesces chunks into frames (at most one placeholder update
+per STREAM_FRAME_MS, or sooner once STREAM_FRAME_CHARS are pending) and
+buffers text in a list, so long answers cost a bounded number of websocket
+deltas instead of one per token. Time-to-first-token and tokens/sec are
+recorded on a "ui.stream" span.
+"""
+import os
+import time
+from typing import Any, Iterable
+
+from backend.context_budget import estimate_tokens
+from telemetry.tracing import span, set_gauge
+
+FRAME_MS = float(os.getenv("STREAM_FRAME_MS", "50"))
+FRAME_CHARS = int(os.getenv("STREAM_FRAME_CHARS", "400"))
+CURSOR = "▌"
+
+
+class StreamRenderer:
+    """
+    Render a chunk stream into a Streamlit placeholder (anything with .markdown).
+
+    Usage:
+        renderer = StreamRenderer(st.empty(), surface="chat")
+        text = renderer.render(chain.stream_with_mode(...))
+    """
+
+    def __init__(self, placeholder: Any, surface: str = "chat", frame_ms: float = FRAME_MS, frame_chars: int = FRAME_CHARS):
+        self.placeholder = placeholder
+        self.surface = surface
+        self.frame_seconds = frame_ms / 1000.0
+        self.frame_chars = frame_chars
+        self.parts = []
+        self.frames = 0
+        self.ttft_ms = None
+        self.tokens_per_second = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def render(self, chunks: Iterable[str]) -> str:
+        """
+        Consume the stream, updating the placeholder frame by frame.
+
+        Returns:
+            The full text. If the stream raises, the text received so far
+            stays in the placeholder and the exception propagates.
+        """
+        with span("ui.stream", surface=self.surface) as trace:
+            started = time.perf_counter()
+            first_at = None
+            last_frame = 0.0
+            pending = 0
+            try:
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    now = time.perf_counter()
+                    if first_at is None:
+                        first_at = now
+                        self.ttft_ms = (now - started) * 1000
+                    self.parts.append(chunk)
+                    pending += len(chunk)
+                    # The first chunk is shown at once; later ones are batched
+                    if self.frames == 0 or pending >= self.frame_chars or now - last_frame >= self.frame_seconds:
+                        self._frame(self.text + CURSOR)
+                        last_frame = now
+                        pending = 0
+            finally:
+                text = self.text
+                if first_at is not None:
+                    elapsed = time.perf_counter() - first_at
+                    tokens = estimate_tokens(text)
+                    self.tokens_per_second = tokens / elapsed if elapsed > 0 else None
+                    trace.set("ttft_ms", round(self.ttft_ms, 1))
+                    trace.set("tokens", tokens)
+                    set_gauge("stream_ttft_ms", self.ttft_ms, surface=self.surface)
+                    if self.tokens_per_second is not None:
+                        trace.set("tokens_per_second", round(self.tokens_per_second, 1))
+                        set_gauge("stream_tokens_per_second", self.tokens_per_second, surface=self.surface)
+                trace.set("frames", self.frames)
+                trace.set("response_chars", len(text))
+
+        self._frame(text)
+        return text
+
+    def _frame(self, text: str):
+        self.placeholder.markdown(text)
+        self.frames += 1
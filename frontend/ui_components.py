@@ -4,7 +4,9 @@ Streamlit UI components - Sidebar, Cards, Panels.
 import streamlit as st
 import time
 from typing import Dict, Any, List
-from db.prescriptions import get_all_prescriptions, delete_prescription, update_prescription_data
+from db.prescriptions import list_prescription_summaries, delete_prescription, update_prescription_data
+from backend.response_cache import get_response_cache
+from telemetry.tracing import span_summary, recent_spans
 
 
 def render_welcome_screen():
@@ -26,17 +28,25 @@ def render_welcome_screen():
         """)
 
 
-def render_medicine_cards(extraction: Dict[str, Any]):
-    """Render extracted medicines as cards with confidence indicators."""
+def render_medicine_cards(extraction: Dict[str, Any], partial: bool = False):
+    """
+    Render extracted medicines as cards with confidence indicators.
+
+    With partial=True (medicines streamed before normalization finished)
+    the overall confidence is not known yet and is left out.
+    """
     if not extraction or "medicines" not in extraction:
         return
 
     st.subheader("Extracted Medications")
     
-    # Overall Confidence Meter
-    conf = extraction.get("overall_confidence", 0)
-    conf_color = "green" if conf >= 0.8 else "orange" if conf >= 0.6 else "red"
-    st.progress(conf, text=f"Overall Extraction Confidence: {int(conf*100)}%")
+    if partial:
+        st.caption(f"Read {len(extraction['medicines'])} so far, still reading the prescription...")
+    else:
+        # Overall Confidence Meter
+        conf = extraction.get("overall_confidence", 0)
+        conf_color = "green" if conf >= 0.8 else "orange" if conf >= 0.6 else "red"
+        st.progress(conf, text=f"Overall Extraction Confidence: {int(conf*100)}%")
 
     cols = st.columns(2)
     for i, med in enumerate(extraction["medicines"]):
@@ -63,7 +73,7 @@ def render_medicine_cards(extraction: Dict[str, Any]):
             """, unsafe_allow_html=True)
 
 
-def render_transparency_panel(audit_data: Dict[str, Any], model_name: str):
+def render_transparency_panel(audit_data: Dict[str, Any], model_name: str, timings: Dict[str, float] = None):
     """Render the AI Transparency Panel in the sidebar."""
     st.sidebar.divider()
     with st.sidebar.expander("🔬 AI Transparency Panel", expanded=True):
@@ -86,6 +96,14 @@ def render_transparency_panel(audit_data: Dict[str, Any], model_name: str):
         st.caption("3. Schedule Inference")
         st.caption("4. Safety & Ambiguity Audit")
         
+        if timings:
+            st.write("**Stage Timings:**")
+            for stage, seconds in timings.items():
+                st.caption(f"• {stage}: {seconds:.2f}s")
+        
+        if audit_data.get("source") == "lexicon":
+            st.caption("✅ All medicine names exactly matched the offline lexicon; model audit skipped.")
+        
         if audit_data.get("safety_flags"):
             st.warning("Safety Considerations detected in extraction.")
         
@@ -103,6 +121,29 @@ def render_transparency_panel(audit_data: Dict[str, Any], model_name: str):
         st.info("💡 Always verify AI results with the physical prescription.")
 
 
+def render_trace_panel():
+    """Render per-stage latency (recent spans) and LLM cache stats in the sidebar."""
+    summary = span_summary()
+    if not summary:
+        return
+    
+    with st.sidebar.expander("⏱️ Performance Traces", expanded=False):
+        st.caption("Recent spans in this process (count · p50 · p95)")
+        for stats in sorted(summary, key=lambda item: -item["p95_ms"]):
+            st.caption(f"• {stats['span']}: {stats['count']} · {stats['p50_ms']:.0f}ms · {stats['p95_ms']:.0f}ms")
+        
+        last_stream = next((s for s in recent_spans() if s["name"] == "ui.stream"), None)
+        if last_stream and "ttft_ms" in last_stream["attributes"]:
+            attrs = last_stream["attributes"]
+            st.write("**Last Streamed Reply:**")
+            st.caption(f"First token: {attrs['ttft_ms']:.0f}ms · {attrs.get('tokens_per_second', 0):.0f} tokens/s · {attrs['frames']} frames")
+        
+        cache_stats = get_response_cache().stats()
+        st.write("**LLM Response Cache:**")
+        st.caption(f"Hit rate: {cache_stats['hit_rate']:.0%} ({cache_stats['hits']} hits, {cache_stats['misses']} misses)")
+        st.caption(f"Entries: {cache_stats['entries']}")
+
+
 def render_unresolvable_card(extraction: Dict[str, Any], audit_data: Dict[str, Any]):
     """Render a dedicated Assisted Clarification Card for UNRESOLVABLE state."""
     st.markdown("""
@@ -237,13 +278,23 @@ def render_sidebar() -> Dict[str, Any]:
     # Previous Conversations from DB
     st.sidebar.subheader("💬 Conversations")
     
-    db_convs = get_all_prescriptions()
+    # Keyset-paginated index; "Load more" extends the number of pages shown
+    if "sidebar_pages" not in st.session_state:
+        st.session_state.sidebar_pages = 1
+    
+    db_convs = []
+    cursor = None
+    for _ in range(st.session_state.sidebar_pages):
+        page, cursor = list_prescription_summaries(cursor=cursor)
+        db_convs.extend(page)
+        if cursor is None:
+            break
     active_id = st.session_state.get("prescription_id")
     
     if db_convs:
         for conv in db_convs:
             conv_id = conv["id"]
-            title = f"📷 {conv['created_at'][:16]}" # Placeholder title from date
+            title = f"📷 {conv['title']} · {conv['created_at'][:16]}"
             is_active = conv_id == active_id
             
             col1, col2 = st.sidebar.columns([4, 1])
@@ -273,6 +324,11 @@ def render_sidebar() -> Dict[str, Any]:
                         st.session_state.chat_memory.clear()
                     
                     st.rerun()
+        
+        if cursor is not None:
+            if st.sidebar.button("Load more", key="load_more_convs", width="stretch"):
+                st.session_state.sidebar_pages += 1
+                st.rerun()
     else:
         st.sidebar.info("No conversations")
     
@@ -1,5 +1,4 @@
 from fpdf import FPDF
-import datetime
 from typing import List, Dict, Any
 
 class SchedulePDF(FPDF):
@@ -7,9 +6,7 @@ class SchedulePDF(FPDF):
         self.set_font('helvetica', 'B', 16)
         self.set_text_color(154, 27, 116) # Brand Color #9a1b74
         self.cell(0, 10, 'Personalized Medication Schedule', 0, 1, 'C')
-        self.set_font('helvetica', 'I', 10)
-        self.set_text_color(100)
-        self.cell(0, 10, f'Generated on: {datetime.datetime.now().strftime("%Y-%m-%d %H:%M")}', 0, 1, 'C')
+        # No render timestamp: PDFs are cached per schedule and reused across sessions
         self.ln(5)
 
     def footer(self):
@@ -28,15 +28,16 @@ def calculate_schedule_readiness(extraction: Dict[str, Any]) -> Dict[str, Any]:
                 missing.append({"medicine": med_name, "field": field})
             
         # Check for low confidence
-        # Note: If a med has a total confidence, we use that as a proxy for all fields
-        # unless field-level confidence is added in the future.
+        # Per-field scores (from the shorthand parser) take precedence; otherwise
+        # the medicine's total confidence is used as a proxy for every field.
+        # Name confidence is not a scheduling field and is left to the audit.
         m_conf = med.get("confidence", 1.0)
-        if m_conf < CONFIDENCE_THRESHOLD:
-            # Only add to low_conf if not already in missing
-            already_missing = [m["field"] for m in missing if m["medicine"] == med_name]
-            for field in REQUIRED_FIELDS:
-                if field not in already_missing:
-                    low_conf.append({"medicine": med_name, "field": field})
+        field_conf = med.get("field_confidence") or {}
+        # Only add to low_conf if not already in missing
+        already_missing = [m["field"] for m in missing if m["medicine"] == med_name]
+        for field in REQUIRED_FIELDS:
+            if field not in already_missing and field_conf.get(field, m_conf) < CONFIDENCE_THRESHOLD:
+                low_conf.append({"medicine": med_name, "field": field})
 
     return {
         "is_ready": len(missing) == 0 and len(low_conf) == 0,
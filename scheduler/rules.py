@@ -0,0 +1,215 @@
+"""
+Deterministic schedule engine for well-formed extractions.
+Maps frequency / timing notation to morning, afternoon and night slots so
+the LLM is only needed for entries it cannot parse.
+"""
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+SLOTS = ("morning", "afternoon", "night")
+
+# Medical abbreviations -> slots
+ABBREVIATIONS = {
+    "od": ("morning",),
+    "qd": ("morning",),
+    "om": ("morning",),
+    "qam": ("morning",),
+    "on": ("night",),
+    "hs": ("night",),
+    "qhs": ("night",),
+    "qpm": ("night",),
+    "bd": ("morning", "night"),
+    "bid": ("morning", "night"),
+    "tds": ("morning", "afternoon", "night"),
+    "tid": ("morning", "afternoon", "night"),
+}
+# Abbreviations naming a time of day rather than a dose count
+TIME_ABBREVIATIONS = {"om", "qam", "on", "hs", "qhs", "qpm"}
+# Four doses a day have no slot to land in; these always go to the LLM
+FOUR_TIMES_ABBREVIATIONS = {"qds", "qid"}
+
+AS_NEEDED = {"prn", "sos", "as needed", "as required", "when required", "if needed"}
+
+# Plain-language dose counts, checked in order (None: more doses than slots)
+COUNT_PHRASES = [
+    (re.compile(r"\b(once|one time|1 time|1x)\s*(a|per|every)?\s*(day|daily)\b"), ("morning",)),
+    (re.compile(r"\b(twice|two times|2 times|2x)\s*(a|per|every)?\s*(day|daily)\b"), ("morning", "night")),
+    (re.compile(r"\b(thrice|three times|3 times|3x)\s*(a|per|every)?\s*(day|daily)\b"), SLOTS),
+    (re.compile(r"\b(four times|4 times|4x)\s*(a|per|every)?\s*(day|daily)\b"), None),
+]
+# Plain-language times of day
+TIME_PHRASES = [
+    (re.compile(r"\b(at bed ?time|before (sleep|bed)|at night|every night|nightly)\b"), ("night",)),
+    (re.compile(r"\b(in the morning|every morning|morning only)\b"), ("morning",)),
+    (re.compile(r"\b(in the afternoon|after lunch|with lunch)\b"), ("afternoon",)),
+]
+PHRASES = COUNT_PHRASES + TIME_PHRASES
+
+# "every 8 hours", "q8h"
+INTERVAL = re.compile(r"\b(?:every|q)\s*(\d{1,2})\s*(?:h|hr|hrs|hours?)\b")
+INTERVAL_SLOTS = {24: ("morning",), 12: ("morning", "night"), 8: SLOTS}
+
+# "1-0-1", "1-1-1", "½-0-½", "1-0-0-1" (morning-afternoon-evening-night)
+DOSE_PATTERN = re.compile(r"^\s*([0-9½¼.]+)\s*-\s*([0-9½¼.]+)\s*-\s*([0-9½¼.]+)(?:\s*-\s*([0-9½¼.]+))?\s*$")
+
+DURATION = re.compile(r"^\s*(\d+)\s*(d|day|days)?\s*$", re.IGNORECASE)
+
+
+def parse_frequency(frequency: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """
+    Parse a frequency string into the slots it covers.
+    
+    Returns:
+        Tuple of slot names, () for as-needed (PRN/SOS), or None if
+        unparseable, more than three doses a day, or a dose count that
+        disagrees with the times of day given ("twice daily at night").
+    """
+    if not frequency:
+        return None
+    text = str(frequency).strip().lower()
+    
+    match = DOSE_PATTERN.match(text)
+    if match:
+        morning, afternoon, third, fourth = match.groups()
+        night = fourth if fourth is not None else third
+        evening = third if fourth is not None else "0"
+        if _is_dose(evening) and _is_dose(night):
+            # Evening and night share the night slot; keep both doses for the LLM
+            return None
+        slots = []
+        if _is_dose(morning):
+            slots.append("morning")
+        if _is_dose(afternoon):
+            slots.append("afternoon")
+        if _is_dose(night) or _is_dose(evening):
+            slots.append("night")
+        return tuple(slots) if slots else None
+    
+    normalized = re.sub(r"[().,]", " ", text).strip()
+    if normalized in AS_NEEDED or any(re.search(rf"\b{re.escape(p)}\b", normalized) for p in AS_NEEDED):
+        return ()
+    
+    tokens = normalized.split()
+    if any(t in FOUR_TIMES_ABBREVIATIONS for t in tokens):
+        return None
+    counts = {ABBREVIATIONS[t] for t in tokens if t in ABBREVIATIONS and t not in TIME_ABBREVIATIONS}
+    times = [ABBREVIATIONS[t] for t in tokens if t in TIME_ABBREVIATIONS]
+    
+    for pattern, slots in COUNT_PHRASES:
+        if pattern.search(normalized):
+            if slots is None:
+                return None
+            counts.add(slots)
+            break
+    match = INTERVAL.search(normalized)
+    if match:
+        if int(match.group(1)) not in INTERVAL_SLOTS:
+            return None
+        counts.add(INTERVAL_SLOTS[int(match.group(1))])
+    times += [slots for pattern, slots in TIME_PHRASES if pattern.search(normalized)]
+    
+    if len(counts) > 1:
+        return None
+    time_slots = tuple(s for s in SLOTS if any(s in t for t in times))
+    if counts and time_slots:
+        # "once daily at night": the time of day decides the slot
+        count_slots = next(iter(counts))
+        return time_slots if len(time_slots) == len(count_slots) else None
+    if counts:
+        return next(iter(counts))
+    return time_slots or None
+
+
+def parse_timing(timing: Any) -> Optional[Tuple[str, ...]]:
+    """Normalize an extraction "timing" list; None if empty or containing unknown slots."""
+    if not isinstance(timing, list) or not timing:
+        return None
+    slots = set()
+    for item in timing:
+        value = str(item).strip().lower()
+        if value == "evening":
+            value = "night"
+        if value not in SLOTS:
+            return None
+        slots.add(value)
+    return tuple(s for s in SLOTS if s in slots)
+
+
+def parse_duration(duration: Any) -> Optional[int]:
+    """Duration in days as an int, or None if not a plain day count."""
+    if isinstance(duration, bool):
+        return None
+    if isinstance(duration, (int, float)):
+        return int(duration) if duration > 0 else None
+    if isinstance(duration, str):
+        match = DURATION.match(duration)
+        if match and int(match.group(1)) > 0:
+            return int(match.group(1))
+    return None
+
+
+def build_schedule_entry(medicine: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Build one SCHEDULE_FINAL_PROMPT entry from an extracted medicine.
+    
+    Returns:
+        The schedule entry, or None if the medicine needs LLM interpretation.
+    """
+    name = medicine.get("name")
+    duration_days = parse_duration(medicine.get("duration_days"))
+    if not name or duration_days is None:
+        return None
+    
+    frequency_slots = parse_frequency(medicine.get("frequency"))
+    timing_slots = parse_timing(medicine.get("timing"))
+    if timing_slots and frequency_slots and timing_slots != frequency_slots:
+        # Conflicting notation: let the model (and the user) sort it out
+        return None
+    slots = timing_slots if timing_slots is not None else frequency_slots
+    if slots is None:
+        return None
+    
+    instructions = medicine.get("instructions") or ""
+    if frequency_slots == () and "as needed" not in instructions.lower():
+        instructions = f"As needed. {instructions}".strip()
+    
+    return {
+        "medicine": name,
+        "morning": "morning" in slots,
+        "afternoon": "afternoon" in slots,
+        "night": "night" in slots,
+        "dosage": str(medicine.get("dosage") or ""),
+        "instructions": instructions,
+        "duration_days": duration_days
+    }
+
+
+def build_local_schedule(extraction: Dict[str, Any]) -> Tuple[List[Optional[Dict[str, Any]]], List[int]]:
+    """
+    Build schedule entries for every medicine the rules can handle.
+    
+    Returns:
+        (entries, unresolved) where entries is aligned with
+        extraction["medicines"] (None where unparsed) and unresolved lists the
+        indices that still need the LLM.
+    """
+    entries = []
+    unresolved = []
+    for i, med in enumerate(extraction.get("medicines", [])):
+        entry = build_schedule_entry(med)
+        entries.append(entry)
+        if entry is None:
+            unresolved.append(i)
+    return entries, unresolved
+
+
+def medicine_key(name: Any) -> str:
+    """Case-, space- and punctuation-insensitive medicine name for matching entries."""
+    return re.sub(r"[^0-9a-z]+", "", str(name or "").lower())
+
+
+def _is_dose(value: str) -> bool:
+    try:
+        return float(value.replace("½", "0.5").replace("¼", "0.25")) > 0
+    except ValueError:
+        return False
@@ -0,0 +1,174 @@
+"""
+Headless batch ingestion of prescription scans.
+
+Walks a directory (recursively) or a .zip archive, deduplicates images by
+their image hash, runs the analysis pipeline on a bounded worker pool with
+a request rate limit, stores results via save_prescription and appends one
+JSON line per image to a report.
+
+Re-running with the same report resumes: images already stored in the DB,
+or already rejected in the report, are skipped without model calls.
+
+Usage:
+    python -m services.batch scans/ --report batch_report.jsonl --workers 4 --rate 30
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Iterator, Tuple
+
+from PIL import Image, UnidentifiedImageError
+from langchain_core.chat_history import InMemoryChatMessageHistory
+
+from backend.chain import VisionChain
+from backend.resilience import TokenBucket
+from backend.utils import PreparedImage
+from db.prescriptions import get_prescription_by_hash
+from services.ingest_pipeline import IngestPipeline
+from services.utils import calculate_image_hash
+from telemetry.tracing import span, increment
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff"}
+
+
+def iter_sources(source: Path) -> Iterator[Tuple[str, bytes]]:
+    """Yield (name, raw bytes) for every image file in a directory tree or zip archive."""
+    if source.is_file() and zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in sorted(archive.infolist(), key=lambda i: i.filename):
+                if not info.is_dir() and Path(info.filename).suffix.lower() in IMAGE_EXTENSIONS:
+                    yield f"{source.name}:{info.filename}", archive.read(info)
+    elif source.is_dir():
+        for path in sorted(source.rglob("*")):
+            if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS:
+                yield str(path), path.read_bytes()
+    elif source.is_file():
+        yield str(source), source.read_bytes()
+    else:
+        raise FileNotFoundError(source)
+
+
+def load_rejected_hashes(report_path: Path) -> set:
+    """Image hashes a previous run already rejected (not stored in the DB)."""
+    rejected = set()
+    if not report_path.exists():
+        return rejected
+    with open(report_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # truncated last line after an interrupted run
+            if record.get("status") == "rejected" and record.get("image_hash"):
+                rejected.add(record["image_hash"])
+    return rejected
+
+
+class BatchIngest:
+    """Runs the ingest pipeline over many images and writes the JSONL report."""
+
+    def __init__(self, report_path: Path, workers: int = 4, rate_per_minute: float = 30):
+        self.report_path = report_path
+        self.workers = workers
+        self.limiter = TokenBucket(rate_per_minute, burst=workers)
+        self.skip_hashes = load_rejected_hashes(report_path)
+        self.seen = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._report = None
+
+    def run(self, source: Path) -> Dict[str, int]:
+        """Process every image under source. Returns counts per status."""
+        # Bound in-flight items so large archives are not read into memory at once
+        in_flight = threading.BoundedSemaphore(self.workers * 2)
+        with open(self.report_path, "a", encoding="utf-8") as self._report, \
+                ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch") as executor:
+            for name, raw in iter_sources(source):
+                in_flight.acquire()
+                future = executor.submit(self._process, name, raw)
+                future.add_done_callback(lambda _: in_flight.release())
+        return dict(self.counts)
+
+    def _process(self, name: str, raw: bytes):
+        started = time.perf_counter()
+        record = {"source": name, "image_hash": None, "status": None}
+        try:
+            with span("batch.item", source=name):
+                self._ingest(raw, record)
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["seconds"] = round(time.perf_counter() - started, 4)
+        self._write(record)
+
+    def _ingest(self, raw: bytes, record: Dict[str, Any]):
+        try:
+            image = PreparedImage.from_pil(Image.open(BytesIO(raw)))
+        except (UnidentifiedImageError, OSError):
+            record["status"] = "unreadable"
+            return
+        image_hash = calculate_image_hash(image)
+        record["image_hash"] = image_hash
+
+        with self._lock:
+            duplicate_of = self.seen.get(image_hash)
+            if duplicate_of is None:
+                self.seen[image_hash] = record["source"]
+        if duplicate_of is not None:
+            record["status"] = "duplicate"
+            record["duplicate_of"] = duplicate_of
+            return
+        if image_hash in self.skip_hashes:
+            record["status"] = "skipped_rejected"
+            return
+        existing = get_prescription_by_hash(image_hash)
+        if existing:
+            record["status"] = "skipped_existing"
+            record["prescription_id"] = existing["id"]
+            return
+
+        # Pace new analyses; individual model calls also share the
+        # process-wide limiter and circuit breaker (backend.resilience)
+        self.limiter.acquire()
+        chain = VisionChain(InMemoryChatMessageHistory())
+        prescription_id, analysis = IngestPipeline(image, chain).run()
+        record["timings"] = analysis.get("timings", {})
+        if prescription_id is None:
+            record["status"] = "rejected"
+            record["reason"] = analysis["validation"].get("reason")
+            return
+        record["status"] = "saved"
+        record["prescription_id"] = prescription_id
+        record["medicine_count"] = len(analysis["extraction"].get("medicines") or [])
+        record["ambiguity_state"] = analysis.get("ambiguity_state", "CLEAR")
+
+    def _write(self, record: Dict[str, Any]):
+        increment("batch_items", status=record["status"])
+        with self._lock:
+            self.counts[record["status"]] = self.counts.get(record["status"], 0) + 1
+            self._report.write(json.dumps(record) + "\n")
+            self._report.flush()
+        print(f"[{record['status']}] {record['source']} ({record['seconds']:.2f}s)", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", type=Path, help="Directory of scans, a .zip archive, or a single image")
+    parser.add_argument("--report", type=Path, default=Path("batch_report.jsonl"), help="JSONL report (appended; used to resume)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent pipeline runs")
+    parser.add_argument("--rate", type=float, default=30, help="Max new analyses started per minute (0 = unlimited)")
+    args = parser.parse_args(argv)
+
+    counts = BatchIngest(args.report, workers=args.workers, rate_per_minute=args.rate).run(args.source)
+    print(json.dumps(counts, sort_keys=True))
+    return 1 if counts.get("error") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,44 @@
-from db.prescriptions import get_prescription_by_hash
+from db.prescriptions import get_prescription_by_hash, get_prescription_with_history, load_image_bytes
 from db.chat import get_chat_history
-from services.utils import bytes_to_image
+from backend.utils import PreparedImage
 from langchain_core.messages import HumanMessage, AIMessage
+from telemetry.tracing import traced
 
+@traced("services.restore_conversation_by_hash")
 def restore_conversation_by_hash(image_hash):
     """
     Check for existing prescription by hash and restore state.
-    Returns (prescription_id, image, analysis, chat_history) or None.
+    Returns (prescription_id, image_hash, image, analysis, chat_history) or None.
     """
     db_record = get_prescription_by_hash(image_hash)
     if not db_record:
         return None
     
+    # Fetch chat history from DB
+    db_history = get_chat_history(db_record["id"])
+    return _build_restored_state(db_record, db_history)
+
+@traced("services.restore_conversation_by_id")
+def restore_conversation_by_id(prescription_id):
+    """
+    Restore state for a known prescription id (e.g. sidebar switch).
+    Record and chat history come from one indexed query; the image is lazy.
+    Returns (prescription_id, image_hash, image, analysis, chat_history) or None.
+    """
+    loaded = get_prescription_with_history(prescription_id)
+    if not loaded:
+        return None
+    db_record, db_history = loaded
+    return _build_restored_state(db_record, db_history)
+
+def _build_restored_state(db_record, db_history):
     prescription_id = db_record["id"]
-    image = bytes_to_image(db_record["image_data"])
+    image_hash = db_record["image_hash"]
+    
+    # Image bytes are loaded from the image store only when first needed
+    image = PreparedImage.lazy(
+        image_hash, lambda: load_image_bytes(image_hash), orientation=db_record.get("orientation") or 1
+    )
     
     analysis = {
         "extraction": db_record["extraction"],
@@ -21,9 +46,6 @@ def restore_conversation_by_hash(image_hash):
         "validation": db_record["audit"].get("validation", {"is_prescription": True, "confidence": 1.0})
     }
     
-    # Fetch chat history from DB
-    db_history = get_chat_history(prescription_id)
-    
     # Format for LangChain/UI
     chat_history = []
     for msg in db_history:
@@ -1,16 +1,12 @@
-from backend.chain import VisionChain
 from db.prescriptions import save_prescription
-from services.utils import calculate_image_hash, image_to_bytes
+from services.utils import calculate_image_hash, image_to_bytes, image_orientation
+from telemetry.tracing import traced
 
-def perform_extraction(image, vision_chain: VisionChain):
-    """
-    Perform full 4-step extraction and save to DB.
-    Assume validation has already passed.
-    """
-    analysis = vision_chain.analyze_prescription(image)
-    
+@traced("services.save_analysis")
+def save_analysis(image, analysis, image_hash=None):
+    """Persist a completed analysis together with its image. Returns the prescription id."""
     # Calculate hash and bytes for storage
-    img_hash = calculate_image_hash(image)
+    img_hash = image_hash or calculate_image_hash(image)
     img_bytes = image_to_bytes(image)
     
     # Inject ambiguity_state into audit for storage
@@ -18,11 +14,10 @@ def perform_extraction(image, vision_chain: VisionChain):
     audit_data["ambiguity_state"] = analysis.get("ambiguity_state", "CLEAR")
     
     # Save to database
-    prescription_id = save_prescription(
+    return save_prescription(
         image_hash=img_hash,
         image_data=img_bytes,
         extraction_dict=analysis["extraction"],
-        audit_dict=audit_data
+        audit_dict=audit_data,
+        orientation=image_orientation(image)
     )
-    
-    return prescription_id, analysis
@@ -0,0 +1,103 @@
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+from PIL import Image
+
+from backend.chain import VisionChain, STAGE_EXECUTOR
+from backend.utils import PreparedImage, as_prepared_image
+from db.image_store import put_image
+from services.conversation_restore import restore_conversation_by_hash
+from services.extraction_service import save_analysis
+from services.single_flight import single_flight
+from telemetry.tracing import traced
+
+
+class IngestPipeline:
+    """
+    Single-pass ingest of a newly uploaded prescription image.
+    
+    Each reasoning stage runs exactly once per upload: the validation verdict
+    is available early (so the UI can reject non-prescriptions before the
+    expensive steps), and the same verdict is reused when the remaining
+    stages run and the completed analysis is persisted.
+    
+    Concurrent runs for the same image (other sessions or processes) are
+    deduplicated: one leader runs the pipeline and the others reuse its
+    result.
+    """
+
+    def __init__(self, image: Union[Image.Image, PreparedImage], vision_chain: VisionChain):
+        self.image = as_prepared_image(image)
+        self.vision_chain = vision_chain
+        self.image_hash = self.image.digest
+        self.validation = None
+
+    def validate(self) -> Tuple[bool, Dict[str, Any]]:
+        """
+        Run Step 0 (classification) once and cache the verdict.
+        
+        Returns:
+            (is_valid, validation) tuple.
+        """
+        if self.validation is None:
+            self.validation = self.vision_chain.validate_image(self.image)
+        return VisionChain.passes_gate(self.validation), self.validation
+
+    @traced("pipeline.ingest")
+    def run(
+        self,
+        on_validated: Callable[[Dict[str, Any]], None] = None,
+        on_medicine: Callable[[Dict[str, Any]], None] = None
+    ) -> Tuple[Optional[str], Dict[str, Any]]:
+        """
+        Complete the analysis and save it to the DB.
+        
+        If validate() was not called yet, validation and OCR run concurrently
+        and on_validated fires as soon as the gate passes. The image is
+        written to the image store while the reasoning stages run, and
+        on_medicine receives each medicine as normalization streams it.
+        
+        Returns:
+            (prescription_id, analysis) tuple; prescription_id is None if the
+            image was rejected by the safety gate (see analysis["validation"]).
+        """
+        return single_flight(
+            self.image_hash,
+            leader=lambda: self.find_existing() or self._run(on_validated, on_medicine),
+            existing=self.find_existing
+        )
+
+    def find_existing(self) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """(prescription_id, analysis) if this image is already stored, else None."""
+        restored = restore_conversation_by_hash(self.image_hash)
+        if restored is None:
+            return None
+        prescription_id, _, _, analysis, _ = restored
+        return prescription_id, analysis
+
+    def _run(self, on_validated=None, on_medicine=None) -> Tuple[Optional[str], Dict[str, Any]]:
+        store_futures = []
+        
+        def _on_validated(validation):
+            # Persist the image while the remaining stages run
+            store_futures.append(STAGE_EXECUTOR.submit(put_image, self.image_hash, self.image.data))
+            if on_validated:
+                on_validated(validation)
+        
+        if self.validation is None:
+            analysis = self.vision_chain.analyze_prescription(
+                self.image, on_validated=_on_validated, on_medicine=on_medicine
+            )
+            self.validation = analysis["validation"]
+        else:
+            if VisionChain.passes_gate(self.validation):
+                _on_validated(self.validation)
+            analysis = self.vision_chain.complete_analysis(self.image, self.validation, on_medicine=on_medicine)
+        
+        if not VisionChain.passes_gate(self.validation):
+            return None, analysis
+        
+        timings = analysis.setdefault("timings", {})
+        with self.vision_chain.track_stage(timings, "persist"):
+            for future in store_futures:
+                future.result()
+            prescription_id = save_analysis(self.image, analysis, image_hash=self.image_hash)
+        return prescription_id, analysis
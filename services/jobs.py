@@ -0,0 +1,198 @@
+"""
+Background ingest queue.
+
+Uploads are written to the image store and queued in the ingest_jobs table;
+a per-process worker pool claims jobs and runs the IngestPipeline, recording
+stage and progress as it goes. The Streamlit script only submits and polls,
+so reruns and browser refreshes never restart or block on model calls, and
+jobs left running by a dead process are picked up again on startup.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from langchain_core.chat_history import InMemoryChatMessageHistory
+
+from backend.chain import VisionChain
+from backend.utils import PreparedImage
+from db.image_store import put_image, read_image, delete_image
+from db.jobs import (
+    create_job, get_job, get_latest_job, claim_next_job,
+    update_job_progress, update_job_partial, finish_job, requeue_job, requeue_stale_jobs
+)
+from db.prescriptions import get_prescription_by_hash
+from services.ingest_pipeline import IngestPipeline
+from telemetry.tracing import span, increment
+
+JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "4"))
+JOB_POLL_SECONDS = float(os.getenv("INGEST_JOB_POLL_SECONDS", "1.0"))
+JOB_STALE_SECONDS = int(os.getenv("INGEST_JOB_STALE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("INGEST_JOB_MAX_ATTEMPTS", "3"))
+# Failed attempts wait RETRY_BACKOFF * 2^(attempt-1) seconds before the next one
+JOB_RETRY_BACKOFF_SECONDS = float(os.getenv("INGEST_JOB_RETRY_BACKOFF_SECONDS", "5"))
+# Cap on the dispatcher's pause after repeated database errors
+JOB_DISPATCH_MAX_BACKOFF_SECONDS = float(os.getenv("INGEST_JOB_DISPATCH_MAX_BACKOFF_SECONDS", "30"))
+
+logger = logging.getLogger(__name__)
+
+# Approximate completion when each stage starts (UI progress bar)
+STAGE_PROGRESS = {
+    "queued": 0.0,
+    "validation": 0.05,
+    "intake": 0.05,
+    "ocr": 0.15,
+    "normalize": 0.5,
+    "lexicon": 0.7,
+    "audit": 0.75,
+    "persist": 0.95
+}
+
+
+class JobQueue:
+    """Per-process worker pool for ingest jobs stored in SQLite."""
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.worker_id = uuid.uuid4().hex
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest-job")
+        self._slots = threading.BoundedSemaphore(workers)
+        self._wakeup = threading.Event()
+        self._dispatcher = None
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Recover stale jobs and start the dispatcher thread (idempotent)."""
+        with self._lock:
+            if self._dispatcher is not None:
+                return
+            self._sweep()
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="ingest-dispatcher", daemon=True)
+            self._dispatcher.start()
+
+    def submit(self, image: PreparedImage) -> Dict[str, Any]:
+        """
+        Persist the image and queue it for analysis.
+
+        Returns:
+            The job record (an already-active job for the same image is reused).
+        """
+        put_image(image.digest, image.data)
+        job = create_job(image.digest, orientation=image.orientation)
+        increment("ingest_jobs", event="submitted")
+        self._wakeup.set()
+        return job
+
+    def _dispatch_loop(self):
+        errors = 0
+        while True:
+            try:
+                self._dispatch_once()
+                errors = 0
+            except Exception:
+                # e.g. "database is locked": back off instead of losing the thread
+                errors += 1
+                increment("ingest_jobs", event="dispatch_error")
+                logger.exception("Ingest dispatcher error (%d in a row); retrying", errors)
+                time.sleep(min(JOB_POLL_SECONDS * 2 ** errors, JOB_DISPATCH_MAX_BACKOFF_SECONDS))
+
+    def _dispatch_once(self):
+        self._slots.acquire()
+        try:
+            job = claim_next_job(self.worker_id)
+        except Exception:
+            self._slots.release()
+            raise
+        if job is None:
+            self._slots.release()
+            self._wakeup.wait(JOB_POLL_SECONDS)
+            self._wakeup.clear()
+            if time.monotonic() - self._last_sweep > JOB_STALE_SECONDS / 2:
+                self._sweep()
+            return
+        self._executor.submit(self._execute, job)
+
+    def _sweep(self):
+        """Take over jobs whose worker died (no heartbeat for JOB_STALE_SECONDS)."""
+        self._last_sweep = time.monotonic()
+        recovered = requeue_stale_jobs(JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS)
+        if recovered:
+            increment("ingest_jobs", recovered, event="recovered")
+
+    def _execute(self, job: Dict[str, Any]):
+        try:
+            with span("jobs.execute", job_id=job["id"], attempt=job["attempts"]):
+                self._run_job(job)
+        except Exception as e:
+            increment("ingest_jobs", event="failed")
+            if job["attempts"] >= JOB_MAX_ATTEMPTS:
+                finish_job(job["id"], "failed", error=f"{type(e).__name__}: {e}")
+            else:
+                delay = JOB_RETRY_BACKOFF_SECONDS * 2 ** (job["attempts"] - 1)
+                requeue_job(job["id"], error=f"{type(e).__name__}: {e}", delay=delay)
+        finally:
+            self._slots.release()
+            self._wakeup.set()
+
+    def _run_job(self, job: Dict[str, Any]):
+        image_hash = job["image_hash"]
+        data = read_image(image_hash)
+        if data is None:
+            finish_job(job["id"], "failed", error="Image missing from image store")
+            return
+        image = PreparedImage(payload=data, digest=image_hash, orientation=job["orientation"])
+
+        def on_stage(stage):
+            update_job_progress(job["id"], stage, STAGE_PROGRESS.get(stage, 0.0))
+
+        medicines = []
+
+        def on_medicine(medicine):
+            # Let pollers render cards while normalization is still streaming
+            medicines.append(medicine)
+            update_job_partial(job["id"], {"medicines": medicines})
+
+        chain = VisionChain(InMemoryChatMessageHistory(), on_stage=on_stage)
+        prescription_id, analysis = IngestPipeline(image, chain).run(on_medicine=on_medicine)
+
+        if prescription_id is None:
+            # Rejected images are not kept unless another record uses them
+            if get_prescription_by_hash(image_hash) is None:
+                delete_image(image_hash)
+            finish_job(job["id"], "rejected", result={"validation": analysis.get("validation", {})})
+            increment("ingest_jobs", event="rejected")
+            return
+
+        finish_job(job["id"], "done", prescription_id=prescription_id, result={"timings": analysis.get("timings", {})})
+        increment("ingest_jobs", event="done")
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide JobQueue, started on first use."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue()
+                _queue.start()
+    return _queue
+
+
+def submit_ingest(image: PreparedImage) -> Dict[str, Any]:
+    """Queue an uploaded image for background analysis. Returns the job record."""
+    return get_job_queue().submit(image)
+
+
+def get_ingest_status(image_hash: str = None, job_id: str = None) -> Optional[Dict[str, Any]]:
+    """Current job record by id, or the latest job for an image hash."""
+    if job_id:
+        return get_job(job_id)
+    return get_latest_job(image_hash)
@@ -0,0 +1,49 @@
+import threading
+from collections import OrderedDict
+from backend.chain import VisionChain
+from db.schedules import content_hash, get_schedule, save_schedule, get_schedule_pdf, save_schedule_pdf
+from scheduler.pdf_export import generate_schedule_pdf
+from telemetry.tracing import traced
+
+PDF_CACHE_SIZE = 32
+
+# Rendered PDFs by schedule hash (in front of the DB copy)
+_pdf_cache = OrderedDict()
+_pdf_cache_lock = threading.Lock()
+
+@traced("services.load_or_generate_schedule")
+def load_or_generate_schedule(prescription_id, extraction, vision_chain: VisionChain):
+    """
+    Return the schedule for this prescription's current extraction.
+    The model is only called when no schedule is stored for this exact extraction.
+    """
+    extraction_hash = content_hash(extraction)
+    schedule = get_schedule(prescription_id, extraction_hash)
+    if schedule is not None:
+        return schedule
+    
+    schedule = vision_chain.generate_final_schedule(extraction).get("schedule", [])
+    if schedule:
+        # Empty results usually mean a failed call; don't pin them
+        save_schedule(prescription_id, extraction_hash, schedule)
+    return schedule
+
+@traced("services.get_schedule_pdf_bytes")
+def get_schedule_pdf_bytes(schedule):
+    """Rendered PDF for a schedule, rendered at most once per schedule hash."""
+    schedule_hash = content_hash(schedule)
+    with _pdf_cache_lock:
+        if schedule_hash in _pdf_cache:
+            _pdf_cache.move_to_end(schedule_hash)
+            return _pdf_cache[schedule_hash]
+    
+    pdf_bytes = get_schedule_pdf(schedule_hash)
+    if pdf_bytes is None:
+        pdf_bytes = generate_schedule_pdf(schedule)
+        save_schedule_pdf(schedule_hash, pdf_bytes)
+    
+    with _pdf_cache_lock:
+        _pdf_cache[schedule_hash] = pdf_bytes
+        while len(_pdf_cache) > PDF_CACHE_SIZE:
+            _pdf_cache.popitem(last=False)
+    return pdf_bytes
@@ -0,0 +1,86 @@
+"""
+Single-flight coordination for work keyed by image hash.
+
+Within a process, concurrent callers for the same key share one Future:
+the first runs the work, the rest wait for its result. Across processes
+(several Streamlit servers on one DB), a lease row in ingest_leases elects
+the leader; other processes poll until the leader's result is visible or
+the lease is released or expires.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, TypeVar
+
+from db.leases import acquire_lease, release_lease
+from telemetry.tracing import span, increment
+
+T = TypeVar("T")
+
+LEASE_SECONDS = int(os.getenv("INGEST_LEASE_SECONDS", "300"))
+POLL_INTERVAL = float(os.getenv("INGEST_LEASE_POLL_SECONDS", "0.5"))
+
+# Identifies this process as a lease owner
+_OWNER = uuid.uuid4().hex
+
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def single_flight(key: str, leader: Callable[[], T], existing: Callable[[], Optional[T]]) -> T:
+    """
+    Run leader() at most once at a time per key, across threads and processes.
+
+    Args:
+        key: Image hash (or any stable key)
+        leader: Does the work; called only while holding the lease
+        existing: Returns the already-stored result or None; polled by
+            cross-process followers while another process holds the lease
+
+    Returns:
+        The leader's result (shared with in-process followers) or the
+        stored result observed by a cross-process follower.
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _inflight[key] = future
+
+    if not is_leader:
+        increment("single_flight_requests", role="follower")
+        with span("single_flight.wait", key=key[:12]):
+            return future.result()
+
+    increment("single_flight_requests", role="leader")
+    try:
+        result = _run_with_lease(key, leader, existing)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def _run_with_lease(key: str, leader: Callable[[], T], existing: Callable[[], Optional[T]]) -> T:
+    while True:
+        if acquire_lease(key, _OWNER, LEASE_SECONDS):
+            try:
+                return leader()
+            finally:
+                release_lease(key, _OWNER)
+
+        # Another process is working on it; reuse its result once stored
+        with span("single_flight.poll", key=key[:12]):
+            result = existing()
+        if result is not None:
+            increment("single_flight_requests", role="remote_follower")
+            return result
+        time.sleep(POLL_INTERVAL)
@@ -1,20 +1,30 @@
-import hashlib
 from PIL import Image
 import io
+from backend.utils import PreparedImage, EXIF_ORIENTATION_TAG, image_digest
 
-def calculate_image_hash(image: Image.Image) -> str:
-    """Calculate SHA-256 hash of a PIL image."""
+def calculate_image_hash(image) -> str:
+    """Calculate SHA-256 hash of a PIL image (or return a PreparedImage's digest)."""
+    if isinstance(image, PreparedImage):
+        return image.digest
     img_byte_arr = io.BytesIO()
     # Save as PNG to ensure consistent byte representation
     image.save(img_byte_arr, format='PNG')
-    return hashlib.sha256(img_byte_arr.getvalue()).hexdigest()
+    return image_digest(img_byte_arr.getvalue(), image_orientation(image))
 
-def image_to_bytes(image: Image.Image) -> bytes:
-    """Convert PIL image to bytes."""
+def image_to_bytes(image) -> bytes:
+    """Convert PIL image (or PreparedImage) to bytes."""
+    if isinstance(image, PreparedImage):
+        return image.data
     img_byte_arr = io.BytesIO()
     image.save(img_byte_arr, format='PNG')
     return img_byte_arr.getvalue()
 
+def image_orientation(image) -> int:
+    """EXIF orientation of a PIL image (or a PreparedImage's recorded one)."""
+    if isinstance(image, PreparedImage):
+        return image.orientation
+    return image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+
 def bytes_to_image(image_bytes: bytes) -> Image.Image:
     """Convert bytes to PIL image."""
     return Image.open(io.BytesIO(image_bytes))
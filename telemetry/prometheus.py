@@ -0,0 +1,45 @@
+"""
+Minimal Prometheus scrape endpoint for telemetry.tracing metrics.
+Started once per process when METRICS_PORT is set; binds to METRICS_HOST
+(loopback by default, so metrics are not exposed on every interface).
+"""
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telemetry.tracing import prometheus_text
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+_server = None
+_server_lock = threading.Lock()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = None, host: str = None):
+    """Serve /metrics on a daemon thread (idempotent). Returns the server or None."""
+    global _server
+    port = port or int(os.getenv("METRICS_PORT", "0"))
+    host = host or METRICS_HOST
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    return _server
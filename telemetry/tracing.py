@@ -0,0 +1,283 @@
+"""
+Lightweight tracing and metrics for the reasoning pipeline, db layer and UI.
+
+Spans record wall-clock duration plus free-form attributes (payload bytes,
+token counts, cache hits...). Finished spans go to an in-memory ring buffer
+(for the debug panel), to aggregated histograms (for the Prometheus text
+endpoint) and optionally to a JSONL or SQLite sink:
+
+    TRACE_SINK=jsonl:traces.jsonl
+    TRACE_SINK=sqlite:traces.db
+"""
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+TRACING_ENABLED = os.getenv("TRACING_DISABLED", "").lower() not in ("1", "true", "yes")
+TRACE_SINK = os.getenv("TRACE_SINK", "")
+RECENT_SPANS = int(os.getenv("TRACE_RECENT_SPANS", "500"))
+
+# Histogram buckets in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_local = threading.local()
+_lock = threading.Lock()
+_recent = deque(maxlen=RECENT_SPANS)
+_histograms = {}
+_counters = {}
+_gauges = {}
+_sink = None
+
+
+class Span:
+    """A timed operation with attributes; use via span() or @traced."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "duration", "attributes", "error", "_started")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attributes):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.start = time.time()
+        self.duration = None
+        self.attributes = dict(attributes)
+        self.error = None
+        self._started = time.perf_counter()
+
+    def set(self, key: str, value: Any):
+        """Attach an attribute (e.g. payload_bytes, prompt_tokens, cache_hit)."""
+        self.attributes[key] = value
+
+    def finish(self, error: str = None):
+        """Stop the clock and record the span (idempotent)."""
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if error:
+            self.error = error
+        _record(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+class _NoopSpan:
+    def set(self, key, value):
+        pass
+
+    def finish(self, error=None):
+        pass
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """Time a block; nested spans share the enclosing trace id."""
+    if not TRACING_ENABLED:
+        yield _NoopSpan()
+        return
+    parent = getattr(_local, "current", None)
+    current = Span(name, parent, **attributes)
+    _local.current = current
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        _local.current = parent
+        current.finish()
+
+
+def start_span(name: str, **attributes):
+    """
+    Start a span that is not made current; call .finish() when done.
+    Use this across generator yields, where a with-block would leak into
+    the caller's context.
+    """
+    if not TRACING_ENABLED:
+        return _NoopSpan()
+    return Span(name, getattr(_local, "current", None), **attributes)
+
+
+def traced(name: str = None):
+    """Decorator form of span(); defaults to module.function as the span name."""
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span():
+    """The innermost active span in this thread (or a no-op span)."""
+    return getattr(_local, "current", None) or _NoopSpan()
+
+
+def increment(name: str, value: float = 1, **labels):
+    """Increment a counter (exported as a Prometheus counter)."""
+    if not TRACING_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels):
+    """Set a gauge to its current value (exported as a Prometheus gauge)."""
+    if not TRACING_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _gauges[key] = value
+
+
+def recent_spans(limit: int = None) -> List[Dict[str, Any]]:
+    """Most recent finished spans, newest first."""
+    with _lock:
+        spans = list(_recent)
+    spans.reverse()
+    return [s.to_dict() for s in spans[:limit]]
+
+
+def span_summary() -> List[Dict[str, Any]]:
+    """Per-span-name count, mean and approximate p50/p95 over recent spans."""
+    by_name = {}
+    with _lock:
+        for s in _recent:
+            by_name.setdefault(s.name, []).append(s.duration * 1000)
+    summary = []
+    for name, durations in sorted(by_name.items()):
+        durations.sort()
+        summary.append({
+            "span": name,
+            "count": len(durations),
+            "mean_ms": round(sum(durations) / len(durations), 2),
+            "p50_ms": round(durations[len(durations) // 2], 2),
+            "p95_ms": round(durations[min(len(durations) - 1, int(0.95 * len(durations)))], 2)
+        })
+    return summary
+
+
+def prometheus_text() -> str:
+    """Render histograms and counters in the Prometheus text exposition format."""
+    lines = [
+        "# HELP rx_span_duration_seconds Duration of traced operations.",
+        "# TYPE rx_span_duration_seconds histogram"
+    ]
+    with _lock:
+        histograms = {k: (list(v[0]), v[1], v[2]) for k, v in _histograms.items()}
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+    for name, (bucket_counts, total, count) in sorted(histograms.items()):
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS, bucket_counts):
+            cumulative += bucket_count
+            lines.append(f'rx_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'rx_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {count}')
+        lines.append(f'rx_span_duration_seconds_sum{{span="{name}"}} {total:.6f}')
+        lines.append(f'rx_span_duration_seconds_count{{span="{name}"}} {count}')
+    
+    seen_types = set()
+    for (name, labels), value in sorted(counters.items()):
+        metric = f"rx_{name}_total"
+        if metric not in seen_types:
+            lines.append(f"# TYPE {metric} counter")
+            seen_types.add(metric)
+        label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+        lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+    
+    for (name, labels), value in sorted(gauges.items()):
+        metric = f"rx_{name}"
+        if metric not in seen_types:
+            lines.append(f"# TYPE {metric} gauge")
+            seen_types.add(metric)
+        label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+        lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _record(finished: Span):
+    with _lock:
+        _recent.append(finished)
+        bucket_counts, total, count = _histograms.get(finished.name, ([0] * len(BUCKETS), 0.0, 0))
+        for i, bound in enumerate(BUCKETS):
+            if finished.duration <= bound:
+                bucket_counts[i] += 1
+                break
+        _histograms[finished.name] = (bucket_counts, total + finished.duration, count + 1)
+    sink = _get_sink()
+    if sink is not None:
+        sink.write(finished.to_dict())
+
+
+class JsonlSink:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict[str, Any]):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class SqliteSink:
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS spans (
+                    span_id TEXT PRIMARY KEY,
+                    trace_id TEXT NOT NULL,
+                    parent_id TEXT,
+                    name TEXT NOT NULL,
+                    start REAL NOT NULL,
+                    duration_ms REAL NOT NULL,
+                    attributes TEXT NOT NULL,
+                    error TEXT
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_spans_name ON spans(name, start)")
+
+    def write(self, record: Dict[str, Any]):
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO spans VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (record["span_id"], record["trace_id"], record["parent_id"], record["name"],
+                     record["start"], record["duration_ms"], json.dumps(record["attributes"], default=str),
+                     record["error"])
+                )
+
+
+def _get_sink():
+    global _sink
+    if _sink is None and TRACE_SINK:
+        kind, _, path = TRACE_SINK.partition(":")
+        with _lock:
+            if _sink is None:
+                _sink = SqliteSink(path) if kind == "sqlite" else JsonlSink(path)
+    return _sink
@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from backend.lexicon import LEXICON_PATH, MedicineLexicon, _pattern_bits, edit_distance
+from benchmarks.latency import make_synthetic_names, misspell
+
+
+@pytest.fixture(scope="module")
+def lexicon():
+    return MedicineLexicon.from_csv(LEXICON_PATH)
+
+
+@pytest.mark.parametrize("query, name, match, confident", [
+    ("Paracetamol", "Paracetamol", "exact", True),
+    ("Tab PARACETAMOL 500mg", "Paracetamol", "exact", True),
+    ("Paracetmol", "Paracetamol", "phonetic", True),
+    ("Seftriaxone", "Ceftriaxone", "phonetic", True),
+    ("Fenosibrate", "Fenofibrate", "fuzzy", True),
+    ("Metfornim", "Metformin", "fuzzy", False),
+    ("Amoxycilin", "Amoxicillin", "phonetic", False),
+    # Fragments next to [UNCLEAR] are only ever partial matches
+    ("Amox[UNCLEAR]", "Amoxicillin", "prefix", False),
+    ("Amox[UNCLEAR]lin", "Amoxicillin", "prefix", False),
+    # One known word of a multi-word name is not the whole name
+    ("Amoxicillin Clavulanate", "Amoxicillin", "word", False),
+    ("Augmentin Duo", "Augmentin", "word", False),
+])
+def test_lookup(lexicon, query, name, match, confident):
+    candidates = lexicon.lookup(query)
+    assert (candidates[0]["name"], candidates[0]["match"]) == (name, match)
+    assert lexicon.is_confident(candidates) == confident
+
+
+@pytest.mark.parametrize("query", ["Xqzvbn", "", "Tab 500mg", "[UNCLEAR]"])
+def test_lookup_miss(lexicon, query):
+    assert lexicon.lookup(query) == []
+
+
+def test_lookup_ranks_and_limits(lexicon):
+    candidates = lexicon.lookup("Amox[UNCLEAR]")
+    assert len(candidates) > 1
+    assert [c["score"] for c in candidates] == sorted((c["score"] for c in candidates), reverse=True)
+    assert lexicon.lookup("Amox[UNCLEAR]", limit=1) == candidates[:1]
+
+
+def test_lookup_at_scale(lexicon):
+    # The postings scan is capped; real names must still win among 100k look-alikes
+    bundled = list(lexicon.names)
+    padded = MedicineLexicon([(name, "") for name in bundled + make_synthetic_names(100000, 0)])
+    rng = random.Random(0)
+    queries = [(name, misspell(name, rng)) for name in rng.sample(bundled, 200)]
+    hits = sum(bool(c) and c[0]["name"] == name for name, query in queries for c in [padded.lookup(query)])
+    assert hits >= 0.95 * len(queries)
+
+
+@pytest.mark.parametrize("a, b, distance", [
+    ("amoxicillin", "amoxicillin", 0),
+    ("amoxicillin", "amoxycilin", 2),
+    ("paracetamol", "paracetmol", 1),
+    ("kitten", "sitting", 3),
+    ("abc", "", 3),
+])
+def test_edit_distance(a, b, distance):
+    assert edit_distance(_pattern_bits(a), len(a), b) == distance
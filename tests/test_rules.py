@@ -0,0 +1,92 @@
+import pytest
+
+from scheduler.rules import parse_duration, parse_frequency, parse_timing
+
+MORNING, AFTERNOON, NIGHT = ("morning",), ("afternoon",), ("night",)
+BD = ("morning", "night")
+TDS = ("morning", "afternoon", "night")
+
+
+@pytest.mark.parametrize("frequency, expected", [
+    # Dose patterns (morning-afternoon-night, or with an evening slot)
+    ("1-0-1", BD),
+    ("1-1-1", TDS),
+    ("0-0-1", NIGHT),
+    ("½-0-½", BD),
+    (" 1 - 0 - 1 ", BD),
+    ("1-0-0-1", BD),
+    ("0-0-1-0", NIGHT),
+    ("1-0-1-1", None),  # evening and night doses would share a slot
+    ("0-0-0", None),
+    # Abbreviations
+    ("OD", MORNING),
+    ("BD", BD),
+    ("bid", BD),
+    ("TDS", TDS),
+    ("tid", TDS),
+    ("HS", NIGHT),
+    ("qhs", NIGHT),
+    ("QID", None),  # four doses do not fit three slots
+    ("qds", None),
+    # As needed
+    ("SOS", ()),
+    ("prn", ()),
+    ("as needed for pain", ()),
+    # Plain language and intervals
+    ("twice daily", BD),
+    ("three times a day", TDS),
+    ("four times a day", None),
+    ("after lunch", AFTERNOON),
+    ("q8h", TDS),
+    ("every 12 hours", BD),
+    ("every 6 hours", None),
+    # Count and time of day together
+    ("once daily at night", NIGHT),
+    ("OD at night", NIGHT),
+    ("twice daily at night", None),
+    ("BD HS", None),
+    ("BD twice daily", BD),
+    ("OD TDS", None),
+    # Unparseable
+    ("daily", None),
+    ("1-0-1 after food", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_frequency(frequency, expected):
+    assert parse_frequency(frequency) == expected
+
+
+@pytest.mark.parametrize("timing, expected", [
+    (["Morning", "night"], BD),
+    (["night", "morning", "night"], BD),
+    (["evening"], NIGHT),
+    (["afternoon"], AFTERNOON),
+    (["noon"], None),
+    (["morning", "bedtime"], None),
+    ([], None),
+    ("morning", None),
+    (None, None),
+])
+def test_parse_timing(timing, expected):
+    assert parse_timing(timing) == expected
+
+
+@pytest.mark.parametrize("duration, expected", [
+    (5, 5),
+    (3.9, 3),
+    ("5", 5),
+    ("5 days", 5),
+    ("10 Days", 10),
+    ("7d", 7),
+    ("0", None),
+    (0, None),
+    (-3, None),
+    (True, None),
+    ("1 week", None),
+    ("2.5", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_duration(duration, expected):
+    assert parse_duration(duration) == expected
@@ -0,0 +1,65 @@
+import pytest
+
+from backend.lexicon import MedicineLexicon
+from backend.shorthand import NAME_CONFIDENCE_SUSPECT, NAME_CONFIDENCE_UNVERIFIED, parse_line
+
+MORNING, NIGHT = ["morning"], ["night"]
+BD = ["morning", "night"]
+TDS = ["morning", "afternoon", "night"]
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("Tab Amox 500mg 1-0-1 x 5d AC", {
+        "name": "Amox 500mg", "dosage": "500mg", "frequency": "1-0-1", "timing": BD,
+        "duration_days": 5, "instructions": "Before food"
+    }),
+    ("Cap. Omeprazole 20 mg OD before breakfast x 2 weeks", {
+        "name": "Omeprazole 20mg", "dosage": "20mg", "frequency": "OD", "timing": MORNING,
+        "duration_days": 14, "instructions": "Before breakfast"
+    }),
+    ("1. Tab Paracetamol 650mg SOS if fever", {
+        "name": "Paracetamol 650mg", "frequency": "SOS", "timing": [], "duration_days": None,
+        "instructions": "If fever"
+    }),
+    ("Syp Ambroxol 5ml TDS for 5 days", {"dosage": "5ml", "frequency": "TDS", "timing": TDS, "duration_days": 5}),
+    ("Tab Metformin 500mg BD after food", {"frequency": "BD", "timing": BD, "instructions": "After food"}),
+    ("- Tab Cetirizine 10mg HS", {"name": "Cetirizine 10mg", "frequency": "HS", "timing": NIGHT}),
+    ("Tab Ibuprofen 400mg BD x 1 month", {"duration_days": 30}),
+])
+def test_parse_line_complete(line, expected):
+    medicine, complete = parse_line(line)
+    assert complete
+    assert {field: medicine[field] for field in expected} == expected
+
+
+@pytest.mark.parametrize("line, expected", [
+    # Parsed, but left for the model
+    ("Tab Dolo 650 mg QID x 3 days", {"frequency": "QID", "timing": []}),  # four doses a day
+    ("Tab Aspirin 75mg 1-0-1-1", {"frequency": "1-0-1-1", "timing": []}),  # evening + night
+    ("Tab Amox[UNCLEAR] 500mg 1-0-1", {"dosage": "500mg", "frequency": "1-0-1"}),
+    ("Tab Azithro 500mg", {"frequency": None}),  # no frequency
+    ("Tab Pan 40mg OD see me", {"frequency": "OD"}),  # unexplained words
+    ("Tab Atorvastatin 10mg once daily at night", {"dosage": "10mg"}),
+])
+def test_parse_line_incomplete(line, expected):
+    medicine, complete = parse_line(line)
+    assert not complete
+    assert {field: medicine[field] for field in expected} == expected
+
+
+@pytest.mark.parametrize("line", ["Review after 1 week", "Dr. Rao", "Drink plenty of water", ""])
+def test_parse_line_without_medicine(line):
+    assert parse_line(line) == (None, False)
+
+
+@pytest.mark.parametrize("line, name_confidence", [
+    ("Tab Paracetamol 650mg BD", 1.0),
+    ("Tab Amoxycilin 500mg BD", NAME_CONFIDENCE_SUSPECT),  # near a known name
+    ("Tab Zorbex 10mg BD", NAME_CONFIDENCE_UNVERIFIED),
+])
+def test_parse_line_name_confidence(line, name_confidence):
+    lexicon = MedicineLexicon([("Amoxicillin", ""), ("Paracetamol", ""), ("Cetirizine", "")])
+    medicine, complete = parse_line(line, lexicon)
+    assert complete
+    assert medicine["field_confidence"]["name"] == name_confidence
+    assert medicine["confidence"] == min(medicine["field_confidence"].values())